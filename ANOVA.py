@@ -9,6 +9,8 @@ import os
 from datetime import datetime
 import re
 
+from dataset_columnar import filas_totales, leer_latencias
+
 def crear_carpeta_resultados(provider_buscado):
     """Crea una carpeta para guardar los resultados con timestamp"""
     timestamp = datetime.now().strftime("%d_%m_%Y_%H_%M")
@@ -41,8 +43,10 @@ def cargar_csvs_individualmente(archivos, provider_buscado):
             continue
             
         try:
-            df = pd.read_csv(archivo)
-            total_registros += len(df)
+            # Solo las particiones de este provider si el CSV está compactado
+            df = leer_latencias(archivo, providers=patrones)
+            registros_archivo = filas_totales(archivo)
+            total_registros += registros_archivo
             
             # Verificar que tenga las columnas necesarias
             columnas_requeridas = ['timestamp', 'provider', 'region', 'datacenter', 'latency_ms']
@@ -80,7 +84,7 @@ def cargar_csvs_individualmente(archivos, provider_buscado):
                 nombres_unicos = df_filtrado['provider_original'].unique()
                 print(f"✅ Archivo '{archivo}':")
                 print(f"   • Fuente: {nombre_amigable}")
-                print(f"   • Registros de {provider_buscado}: {len(df_filtrado):,} (de {len(df):,} total)")
+                print(f"   • Registros de {provider_buscado}: {len(df_filtrado):,} (de {registros_archivo:,} total)")
                 if len(nombres_unicos) <= 3:
                     for nombre in nombres_unicos:
                         count = len(df_filtrado[df_filtrado['provider_original'] == nombre])
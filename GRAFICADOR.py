@@ -7,6 +7,8 @@ import sys
 import os
 import re
 
+from dataset_columnar import leer_latencias
+
 def crear_carpeta_resultados():
     """Crea una carpeta para guardar los resultados con timestamp"""
     timestamp = datetime.now().strftime("%d_%m_%Y_%H_%M")
@@ -76,11 +78,11 @@ def cargar_y_preparar_datos(archivos):
             continue
         
         try:
-            # Cargar el archivo CSV
-            df = pd.read_csv(archivo)
+            # Cargar el archivo CSV (del dataset columnar si está compactado)
+            columnas_requeridas = ['timestamp', 'provider', 'region', 'datacenter', 'latency_ms']
+            df = leer_latencias(archivo, columnas=columnas_requeridas)
             
             # Verificar columnas necesarias
-            columnas_requeridas = ['timestamp', 'provider', 'region', 'datacenter', 'latency_ms']
             if not all(col in df.columns for col in columnas_requeridas):
                 print(f"⚠️  El archivo '{archivo}' no tiene la estructura esperada. Se omitirá.")
                 continue
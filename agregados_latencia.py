@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AGREGADOS FUSIONABLES Y MUESTREO POR BLOQUES (ANÁLISIS SIN CARGAR TODO EN MEMORIA)
+- AgregadoLatencia(claves): por grupo filas, n, suma, suma², aceptables y un histograma
+  logarítmico de la latencia (cubetas de ERROR_RELATIVO) → media, std y disponibilidad
+  exactas; mediana/p95/p99 con error relativo ≤ ERROR_RELATIVO
+- añadir(df) acumula un bloque con un groupby vectorizado; fusionar(otro) suma otro
+  agregado (de otro bloque, archivo o proceso) → el resultado no depende del troceo
+- agrupar(claves) reduce a un agrupamiento más grueso (proveedor×región×hora → proveedor,
+  o [] → total global) sin volver a leer los datos; tabla() → DataFrame por grupo
+- tablas_exactas(df, agrupamientos): las mismas tablas desde un frame en memoria con
+  cuantiles exactos (como np.percentile) para varios agrupamientos de una vez: la latencia
+  se ordena una sola vez y cada agrupamiento son sumas con bincount (sin lambdas por grupo)
+- ReservorioEstratificado(estratos, filas_por_estrato, fraccion): muestreo por bloques
+  por estrato (proveedor/región). Cada fila recibe una clave aleatoria u (semilla fija):
+  se queda si u < fraccion y, con límite, solo las filas_por_estrato de menor u del
+  estrato (reservorio 'bottom-k': fusionable y con memoria acotada); fusionar() une los
+  reservorios de varios archivos o procesos
+"""
+import numpy as np
+import pandas as pd
+
+# ===================== CONFIG =====================
+ERROR_RELATIVO = 0.01             # ancho relativo de media cubeta del histograma
+LATENCIA_MINIMA = 0.01            # ms; por debajo va a la primera cubeta
+SEMILLA_MUESTREO = 42
+CUANTILES = {'mediana': 0.5, 'p95': 0.95, 'p99': 0.99}
+CLAVE_GLOBAL = 'global'           # índice de la tabla sin claves (todas las filas)
+
+_RAZON = np.log1p(2 * ERROR_RELATIVO)
+
+
+def _cubeta(latencias):
+    return np.floor(np.log(np.maximum(latencias, LATENCIA_MINIMA) / LATENCIA_MINIMA) / _RAZON).astype('int32')
+
+
+def _valor_cubeta(cubetas):
+    return LATENCIA_MINIMA * np.exp((np.asarray(cubetas, dtype='float64') + 0.5) * _RAZON)
+
+
+def _sin_categorias(tabla, claves):
+    """Índice por valores (no por códigos de category): bloques con distintas categorías se alinean"""
+    tabla = tabla.reset_index()
+    for clave in claves:
+        if isinstance(tabla[clave].dtype, pd.CategoricalDtype):
+            tabla[clave] = tabla[clave].astype(object)
+    return tabla.set_index(claves)
+
+
+# ===================== AGREGADOS =====================
+class AgregadoLatencia:
+    """Momentos + histograma de latency_ms (y latencia_aceptable) por grupo de claves"""
+
+    def __init__(self, claves, cuantiles=True):
+        self.claves = list(claves)
+        self.cuantiles = cuantiles
+        self.momentos = None      # índice claves → filas, n, suma, suma2, aceptables
+        self.histograma = None    # índice claves + cubeta → filas con latencia en la cubeta
+
+    def añadir(self, df):
+        latencia = df['latency_ms'].to_numpy(dtype='float64')
+        valida = ~np.isnan(latencia)
+        bloque = pd.DataFrame({c: df[c].to_numpy() for c in self.claves})
+        bloque['filas'] = 1
+        bloque['n'] = valida.astype('int64')
+        bloque['suma'] = np.where(valida, latencia, 0.0)
+        bloque['suma2'] = bloque['suma'] ** 2
+        bloque['aceptables'] = df['latencia_aceptable'].to_numpy(dtype='int64')
+        momentos = _sin_categorias(bloque.groupby(self.claves, observed=True).sum(), self.claves)
+        histograma = None
+        if self.cuantiles:
+            cubetas = bloque.loc[valida, self.claves].assign(cubeta=_cubeta(latencia[valida]))
+            histograma = _sin_categorias(cubetas.groupby(self.claves + ['cubeta'], observed=True).size()
+                                         .rename('filas'), self.claves + ['cubeta'])['filas']
+        self._sumar(momentos, histograma)
+        return self
+
+    def fusionar(self, otro):
+        self._sumar(otro.momentos, otro.histograma)
+        return self
+
+    def _sumar(self, momentos, histograma):
+        if momentos is None:
+            return
+        self.momentos = momentos if self.momentos is None else self.momentos.add(momentos, fill_value=0)
+        if histograma is not None:
+            self.histograma = histograma if self.histograma is None else self.histograma.add(histograma, fill_value=0)
+
+    def agrupar(self, claves):
+        """Mismo agregado con un agrupamiento más grueso (subconjunto de las claves)"""
+        claves = list(claves)
+        if not claves:
+            return self._total()
+        grueso = AgregadoLatencia(claves, self.cuantiles)
+        if self.momentos is not None:
+            grueso.momentos = self.momentos.groupby(level=claves).sum()
+        if self.histograma is not None:
+            grueso.histograma = self.histograma.groupby(level=claves + ['cubeta']).sum()
+        return grueso
+
+    def _total(self):
+        """Agregado de todas las filas con una sola clave constante (CLAVE_GLOBAL)"""
+        total = AgregadoLatencia([CLAVE_GLOBAL], self.cuantiles)
+        if self.momentos is not None:
+            total.momentos = self.momentos.sum().to_frame(CLAVE_GLOBAL).T.rename_axis(CLAVE_GLOBAL)
+        if self.histograma is not None:
+            cubetas = self.histograma.groupby(level='cubeta').sum()
+            cubetas.index = pd.MultiIndex.from_product([[CLAVE_GLOBAL], cubetas.index],
+                                                       names=[CLAVE_GLOBAL, 'cubeta'])
+            total.histograma = cubetas
+        return total
+
+    def tabla(self):
+        """registros, filas, media, std, disponibilidad (+ mediana, p95, p99) por grupo"""
+        m = self.momentos.sort_index()
+        n = m['n'].astype('float64')
+        tabla = pd.DataFrame(index=m.index)
+        tabla['registros'] = m['n'].astype('int64')
+        tabla['filas'] = m['filas'].astype('int64')
+        tabla['media'] = m['suma'] / n.where(n > 0)
+        varianza = (m['suma2'] - m['suma'] ** 2 / n.where(n > 0)) / (n - 1).where(n > 1)
+        tabla['std'] = np.sqrt(varianza.clip(lower=0))
+        tabla['disponibilidad'] = m['aceptables'] / m['filas'].where(m['filas'] > 0)
+        if self.cuantiles and self.histograma is not None:
+            for nombre, q in CUANTILES.items():
+                tabla[nombre] = self._cuantil(q).reindex(tabla.index)
+        return tabla
+
+    def _cuantil(self, q):
+        """Cuantil q por grupo (posición q·(n-1) como np.percentile) → valor central de su cubeta"""
+        h = self.histograma.sort_index()
+        acumulado = h.groupby(level=self.claves).cumsum()
+        total = h.groupby(level=self.claves).transform('sum')
+        dentro = h[acumulado > q * (total - 1)]
+        primera = dentro.groupby(level=self.claves).head(1)
+        return pd.Series(_valor_cubeta(primera.index.get_level_values('cubeta')),
+                         index=primera.index.droplevel('cubeta'))
+
+
+# ===================== MÉTRICAS EXACTAS =====================
+def _codigos_grupo(df, claves):
+    """
+    (código de grupo por fila, índice de los grupos observados) sin groupby: códigos de
+    category (o factorize) combinados y renumerados con un bincount. Código = nº de grupos en
+    las filas con alguna clave nula. Entero pequeño → el argsort estable es radix
+    """
+    if not claves:
+        return np.zeros(len(df), dtype='uint8'), pd.Index([CLAVE_GLOBAL], name=CLAVE_GLOBAL)
+    combinado = np.zeros(len(df), dtype='int64')
+    nula = np.zeros(len(df), dtype=bool)
+    niveles, tamanos = [], []
+    for clave in claves:
+        columna = df[clave]
+        if isinstance(columna.dtype, pd.CategoricalDtype):
+            codigos, valores = columna.cat.codes.to_numpy(), columna.cat.categories
+        else:
+            codigos, valores = pd.factorize(columna, sort=True)
+        nula |= codigos < 0
+        combinado = combinado * len(valores) + codigos
+        niveles.append(valores)
+        tamanos.append(len(valores))
+    observados = np.flatnonzero(np.bincount(combinado[~nula], minlength=int(np.prod(tamanos))))
+    tipo = 'uint8' if len(observados) < 2**8 else 'uint16' if len(observados) < 2**16 else 'int64'
+    renumerar = np.full(int(np.prod(tamanos)), len(observados), dtype=tipo)
+    renumerar[observados] = np.arange(len(observados))
+    codigos = renumerar[np.where(nula, 0, combinado)]
+    codigos[nula] = len(observados)
+    posiciones = np.unravel_index(observados, tamanos)
+    if len(claves) == 1:
+        indice = pd.Index(niveles[0].take(posiciones[0]), name=claves[0])
+    else:
+        indice = pd.MultiIndex.from_arrays([nivel.take(pos) for nivel, pos in zip(niveles, posiciones)], names=claves)
+    return codigos, indice
+
+
+def tablas_exactas(df, agrupamientos):
+    """
+    {nombre: tabla} para agrupamientos {nombre: claves} ([] → CLAVE_GLOBAL), con las columnas
+    de AgregadoLatencia.tabla() y cuantiles exactos (interpolación lineal de np.percentile).
+    Un único argsort de la latencia; por agrupamiento, un argsort estable de los códigos de
+    grupo sobre ese orden deja cada grupo contiguo y ya ordenado por latencia
+    """
+    latencia = df['latency_ms'].to_numpy()
+    valida = ~np.isnan(latencia)
+    aceptable = df['latencia_aceptable'].to_numpy(dtype=bool)
+    por_latencia = np.argsort(latencia, kind='stable')   # NaN al final de cada grupo
+    latencia = latencia.astype('float64')
+    suma = np.where(valida, latencia, 0.0)
+    suma2 = suma * suma
+    tablas = {}
+    for nombre, claves in agrupamientos.items():
+        codigos, indice = _codigos_grupo(df, list(claves))
+        k = len(indice) + 1
+        grupo = codigos.astype(np.intp)   # bincount trabaja con intp: una sola conversión
+        filas = np.bincount(grupo, minlength=k)
+        n = filas if valida.all() else np.bincount(grupo[valida], minlength=k)
+        # Mismos momentos que AgregadoLatencia (n, suma, suma²) → mismas fórmulas de media y std
+        momentos = pd.DataFrame({'filas': filas, 'n': n,
+                                 'suma': np.bincount(grupo, weights=suma, minlength=k),
+                                 'suma2': np.bincount(grupo, weights=suma2, minlength=k),
+                                 'aceptables': np.bincount(grupo[aceptable], minlength=k)})[:-1]
+        del grupo
+        momentos.index = indice
+        agregado = AgregadoLatencia(list(claves) or [CLAVE_GLOBAL], cuantiles=False)
+        agregado.momentos = momentos
+        tabla = agregado.tabla().reindex(indice)   # tabla() ordena el índice: vuelve al orden de los códigos
+
+        orden = por_latencia[np.argsort(codigos[por_latencia], kind='stable')]
+        del codigos
+        inicio = (np.cumsum(filas) - filas)[:-1]
+        validas = n[:-1]
+        for nombre_cuantil, q in CUANTILES.items():
+            posicion = q * np.maximum(validas - 1, 0)
+            bajo = np.floor(posicion).astype('int64')
+            alto = np.ceil(posicion).astype('int64')
+            v_bajo = latencia[orden[np.minimum(inicio + bajo, len(orden) - 1)]]
+            v_alto = latencia[orden[np.minimum(inicio + alto, len(orden) - 1)]]
+            tabla[nombre_cuantil] = np.where(validas > 0, v_bajo + (v_alto - v_bajo) * (posicion - bajo), np.nan)
+        tablas[nombre] = tabla
+    return tablas
+
+
+# ===================== MUESTREO =====================
+class ReservorioEstratificado:
+    """Muestra por estrato mientras se leen los bloques; filas() devuelve los bloques retenidos"""
+
+    def __init__(self, estratos, filas_por_estrato=None, fraccion=1.0, semilla=SEMILLA_MUESTREO):
+        self.estratos = list(estratos)
+        self.filas_por_estrato = filas_por_estrato
+        self.fraccion = fraccion
+        self.azar = np.random.default_rng(semilla)
+        self.bloques = []         # (df retenido, claves u, etiqueta de estrato por fila)
+
+    def añadir(self, df):
+        u = self.azar.random(len(df))
+        quedan = u < self.fraccion
+        df, u = df[quedan], u[quedan]
+        if df.empty:
+            return self
+        etiqueta = df[self.estratos[0]].astype(str)
+        for estrato in self.estratos[1:]:
+            etiqueta = etiqueta + '|' + df[estrato].astype(str)
+        etiqueta = etiqueta.to_numpy()
+        self.bloques.append((df, u, etiqueta))
+        if self.filas_por_estrato:
+            self._recortar()
+        return self
+
+    def _recortar(self):
+        """Deja en cada estrato solo las filas_por_estrato filas de menor u (entre todos los bloques)"""
+        todas = pd.DataFrame({'u': np.concatenate([u for _, u, _ in self.bloques]),
+                              'estrato': np.concatenate([e for _, _, e in self.bloques])})
+        dentro = (todas.groupby('estrato')['u'].rank(method='first') <= self.filas_por_estrato).to_numpy()
+        bloques, inicio = [], 0
+        for df, u, etiqueta in self.bloques:
+            mantener = dentro[inicio:inicio + len(df)]
+            inicio += len(df)
+            if mantener.all():
+                bloques.append((df, u, etiqueta))
+            elif mantener.any():
+                bloques.append((df[mantener], u[mantener], etiqueta[mantener]))
+        self.bloques = bloques
+
+    def fusionar(self, otro):
+        """Une el reservorio de otro archivo/proceso: el bottom-k de la unión es el de los bottom-k"""
+        self.bloques += otro.bloques
+        if self.filas_por_estrato:
+            self._recortar()
+        return self
+
+    def filas(self):
+        return [df for df, _, _ in self.bloques]
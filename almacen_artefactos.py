@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ALMACÉN ÚNICO DE ARTEFACTOS DE ERROR
+- Un solo directorio para todos los scrapers (una subcarpeta por scraper)
+- Deduplica fallos repetidos por hash del DOM normalizado (o del PNG si no hay DOM)
+- Escritura en hilo de fondo → no bloquea la captura
+- Cuota de disco con expulsión de los artefactos más antiguos; el índice cuenta en la
+  cuota y rota a indice.csv.1 al pasar de ARTEFACTOS_INDICE_MB (nunca crece sin límite)
+- Un fallo se reconoce como repetido tras reiniciar tanto si se guardó PNG como HTML
+"""
+import atexit
+import csv
+import datetime
+import glob
+import hashlib
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+# ===================== CONFIG =====================
+DIRECTORIO_ALMACEN = os.environ.get('ARTEFACTOS_DIR', 'artefactos_error')
+CUOTA_MB = float(os.environ.get('ARTEFACTOS_CUOTA_MB', '200'))
+INDICE_MB = float(os.environ.get('ARTEFACTOS_INDICE_MB', '5'))
+INDICE = 'indice.csv'
+
+logger = logging.getLogger(__name__)
+
+# Números, horas y contadores cambian en cada fallo aunque la página sea la misma
+_RE_VOLATIL = re.compile(r'\d+')
+_RE_ESPACIOS = re.compile(r'\s+')
+
+
+def huella_dom(dom):
+    """Hash del DOM ignorando cifras y espacios (temporizadores, latencias, ids)"""
+    normalizado = _RE_ESPACIOS.sub(' ', _RE_VOLATIL.sub('#', dom))
+    return hashlib.sha1(normalizado.encode('utf-8', 'ignore')).hexdigest()[:16]
+
+
+def huella_bytes(datos):
+    return hashlib.sha1(datos).hexdigest()[:16]
+
+
+class AlmacenArtefactos:
+    def __init__(self, categoria, directorio=DIRECTORIO_ALMACEN, cuota_mb=CUOTA_MB):
+        """
+        Args:
+            categoria: Subcarpeta del scraper (el antiguo SCREENSHOT_DIR)
+            directorio: Raíz común del almacén
+            cuota_mb: Tamaño máximo del almacén completo
+        """
+        self.categoria = categoria
+        self.directorio = directorio
+        self.cuota_bytes = int(cuota_mb * 1024 * 1024)
+        self.vistos = set()
+        self.cola = queue.Queue()
+        self.hilo = None
+        self.lock = threading.Lock()
+
+    # ===================== API =====================
+    def guardar(self, driver, prefijo):
+        """
+        Registra un fallo. Solo toca el driver para leer DOM y, si el fallo es
+        nuevo, la captura PNG; el disco se escribe en segundo plano.
+        Devuelve la ruta destino o None si era un fallo repetido.
+        """
+        ts = int(time.time())
+        try:
+            dom = driver.page_source
+        except Exception:
+            dom = None
+
+        huella = huella_dom(dom) if dom else None
+        if huella and self._es_repetido(huella):
+            logger.info(f"ERROR REPETIDO ({huella}) → sin nueva captura")
+            self._encolar(('indice', ts, prefijo, huella, '', True))
+            return None
+
+        try:
+            png = driver.get_screenshot_as_png()
+        except Exception as e:
+            logger.warning(f"No se pudo capturar pantalla: {e}")
+            png = None
+        if png is None and dom is None:
+            return None
+
+        if huella is None:
+            huella = huella_bytes(png)
+            if self._es_repetido(huella):
+                logger.info(f"ERROR REPETIDO ({huella}) → sin nueva captura")
+                self._encolar(('indice', ts, prefijo, huella, '', True))
+                return None
+
+        self.vistos.add(huella)
+        path = os.path.join(self.directorio, self.categoria, f"{prefijo}_{ts}_{huella}.png")
+        self._encolar(('artefacto', ts, prefijo, huella, path, png, dom))
+        logger.info(f"ERROR CAPTURADO: {path}")
+        return path
+
+    def vaciar(self, timeout=10):
+        """Espera a que el hilo de fondo termine lo pendiente"""
+        if self.hilo is None:
+            return
+        fin = time.time() + timeout
+        while self.cola.unfinished_tasks and time.time() < fin:
+            time.sleep(0.05)
+
+    # ===================== INTERNOS =====================
+    def _es_repetido(self, huella):
+        if huella in self.vistos:
+            return True
+        patron = os.path.join(self.directorio, self.categoria, f"*_{huella}.*")
+        if any(not ruta.endswith('.tmp') for ruta in glob.glob(patron)):   # .png o .html (sin PNG)
+            self.vistos.add(huella)
+            return True
+        return False
+
+    def _encolar(self, tarea):
+        with self.lock:
+            if self.hilo is None:
+                self.hilo = threading.Thread(target=self._trabajador, name='almacen-artefactos', daemon=True)
+                self.hilo.start()
+                atexit.register(self.vaciar)
+        self.cola.put(tarea)
+
+    def _trabajador(self):
+        while True:
+            tarea = self.cola.get()
+            try:
+                if tarea[0] == 'artefacto':
+                    _, ts, prefijo, huella, path, png, dom = tarea
+                    self._escribir(path, png, dom)
+                    self._anotar(ts, prefijo, huella, path, False)
+                    self._aplicar_cuota()
+                else:
+                    _, ts, prefijo, huella, path, repetido = tarea
+                    self._anotar(ts, prefijo, huella, path, repetido)
+            except Exception as e:
+                logger.warning(f"Almacén de artefactos: {e}")
+            finally:
+                self.cola.task_done()
+
+    def _escribir(self, path, png, dom):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if png is not None:
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(png)
+            os.replace(tmp, path)
+        else:
+            # Sin PNG guardamos el DOM con el mismo nombre base para no perder el fallo
+            path_html = path[:-4] + '.html'
+            with open(path_html, 'w', encoding='utf-8') as f:
+                f.write(dom)
+
+    def _anotar(self, ts, prefijo, huella, path, repetido):
+        os.makedirs(self.directorio, exist_ok=True)
+        indice = os.path.join(self.directorio, INDICE)
+        try:
+            if os.path.getsize(indice) > INDICE_MB * 1024 * 1024:
+                os.replace(indice, indice + '.1')   # se conserva una generación anterior
+        except OSError:
+            pass
+        nuevo = not os.path.exists(indice)
+        with open(indice, 'a', newline='', encoding='utf-8') as f:
+            w = csv.writer(f)
+            if nuevo:
+                w.writerow(['timestamp', 'categoria', 'prefijo', 'huella', 'archivo', 'repetido'])
+            fecha = datetime.datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+            w.writerow([fecha, self.categoria, prefijo, huella, path, int(repetido)])
+
+    def _aplicar_cuota(self):
+        """Expulsa los artefactos más antiguos de TODO el almacén hasta caber en la cuota (índice incluido)"""
+        artefactos = []
+        total = 0
+        for raiz, _, archivos in os.walk(self.directorio):
+            for nombre in archivos:
+                if nombre.endswith('.tmp'):
+                    continue
+                ruta = os.path.join(raiz, nombre)
+                try:
+                    st = os.stat(ruta)
+                except OSError:
+                    continue
+                total += st.st_size
+                if not nombre.startswith(INDICE):   # el índice ocupa cuota pero no se expulsa: rota
+                    artefactos.append((st.st_mtime, st.st_size, ruta))
+
+        if total <= self.cuota_bytes:
+            return
+        artefactos.sort()
+        for _, tam, ruta in artefactos:
+            if total <= self.cuota_bytes:
+                break
+            try:
+                os.remove(ruta)
+                total -= tam
+                logger.info(f"Cuota artefactos: eliminado {ruta}")
+            except OSError:
+                pass
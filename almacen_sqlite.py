@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ALMACÉN SQLITE DE SERIES TEMPORALES (SUMIDERO OPCIONAL)
+- Con SQLITE_LATENCIA=ruta.db cada captura confirmada en CSV se inserta también aquí
+  (una transacción por captura, executemany)
+- Modo WAL: los colectores escriben mientras los análisis leen, sin bloquearse
+- Tablas: capturas (una fila por capture_id) y mediciones en el esquema v2 (ts_ms UTC,
+  region_key, status), con índice (provider, region_key, ts_ms) → una región o ventana
+  de tiempo en milisegundos
+- Al abrir una base antigua se rehacen sus region_key con la clave actual (una sola vez)
+- capturas.solapes_medicion: cuántas capturas de motor_async hicieron ping a la vez que
+  esta (NULL si no pasó por el motor); las bases anteriores ganan la columna al abrirse
+- Los CSV siguen siendo la fuente de verdad: si SQLite falla solo se avisa
+- Uso: python almacen_sqlite.py --importar                    → vuelca los CSV existentes
+       python almacen_sqlite.py --consulta PROVIDER [REGION] [DESDE] [HASTA]
+  PROVIDER es un patrón como en dataset_columnar.leer_latencias (regex, sin mayúsculas:
+  'aws' → 'cloudping AWS', 'cloudping.net AWS', ...); se resuelve contra los providers
+  guardados y se filtra con IN → la consulta sigue usando el índice
+"""
+import contextlib
+import csv
+import glob
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from esquema_latencia import a_epoch_ms, cabecera_logica, clave_region, ms_a_local, normalizar_filas
+from segmentos_nodo import NODO_ID, info_segmento
+
+# ===================== CONFIG =====================
+ARCHIVO_SQLITE = os.environ.get('SQLITE_LATENCIA') or None
+LOTE_IMPORTACION = 5000
+PATRONES_CSV = ['*_latency_longterm.csv']
+
+logger = logging.getLogger(__name__)
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS capturas (
+    capture_id TEXT PRIMARY KEY,
+    ts_ms INTEGER NOT NULL,
+    origen TEXT NOT NULL,          -- CSV canónico (aws_cloudping_latency_longterm.csv, ...)
+    nodo TEXT,
+    filas INTEGER NOT NULL,
+    solapes_medicion INTEGER       -- motor_async: otras capturas midiendo a la vez
+);
+CREATE TABLE IF NOT EXISTS mediciones (
+    capture_id TEXT NOT NULL REFERENCES capturas(capture_id),
+    ts_ms INTEGER NOT NULL,        -- epoch UTC en milisegundos
+    provider TEXT NOT NULL,
+    region_key TEXT NOT NULL,      -- clave canónica (cloudpingco: de to_region)
+    region TEXT,                   -- cloudpingco: from_region
+    datacenter TEXT,               -- cloudpingco: to_region
+    latency_ms REAL,               -- NULL si la web dio 'Failed' u otro texto
+    status TEXT NOT NULL,          -- ok / failed / invalido / vacio
+    seq INTEGER                    -- clave de fila: (capture_id, provider, region_key, datacenter, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_mediciones_serie ON mediciones(provider, region_key, ts_ms);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mediciones_clave ON mediciones(capture_id, provider, region_key, datacenter, seq);
+CREATE INDEX IF NOT EXISTS idx_capturas_tiempo ON capturas(origen, ts_ms);
+"""
+
+
+@contextlib.contextmanager
+def conectar(archivo=None):
+    db = sqlite3.connect(archivo or ARCHIVO_SQLITE, timeout=30)
+    try:
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(ESQUEMA)
+        _migrar(db)
+        yield db
+    finally:
+        db.close()
+
+
+def _migrar(db):
+    """
+    Bases anteriores: se añade capturas.solapes_medicion (NULL en lo ya guardado) y, una
+    vez (user_version 1), las region_key con guiones pasan a la clave actual sin separadores
+    """
+    columnas = {fila[1] for fila in db.execute("PRAGMA table_info(capturas)")}
+    if 'solapes_medicion' not in columnas:
+        try:
+            db.execute("ALTER TABLE capturas ADD COLUMN solapes_medicion INTEGER")
+        except sqlite3.OperationalError:
+            # otro proceso la añadió entre el PRAGMA y el ALTER
+            if 'solapes_medicion' not in {fila[1] for fila in db.execute("PRAGMA table_info(capturas)")}:
+                raise
+    if db.execute("PRAGMA user_version").fetchone()[0] < 1:
+        with db:
+            # las claves antiguas solo tenían [A-Z0-9-] → quitar '-' da clave_region();
+            # OR IGNORE: si dos grafías de una captura chocan en la clave de fila, queda la primera
+            db.execute("UPDATE OR IGNORE mediciones SET region_key = REPLACE(region_key, '-', '') "
+                       "WHERE region_key GLOB '*-*'")
+            db.execute("PRAGMA user_version = 1")
+
+
+# ===================== ESCRITURA =====================
+def _insertar(db, capture_id, origen, nodo, filas):
+    """Inserta una captura con sus filas v2; False si el capture_id ya estaba"""
+    cursor = db.execute("INSERT OR IGNORE INTO capturas (capture_id, ts_ms, origen, nodo, filas) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (capture_id, int(filas[0][0]), origen, nodo, len(filas)))
+    if cursor.rowcount == 0:
+        return False
+    db.executemany("INSERT OR IGNORE INTO mediciones VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                   [(capture_id, int(f[0]), f[1], f[2], f[3], f[4],
+                     float(f[5]) if f[5] != '' else None, f[6], int(f[8])) for f in filas])
+    return True
+
+
+def origen_de_ruta(ruta):
+    """(csv canónico, nodo) de un CSV o de un segmento de nodo"""
+    info = info_segmento(ruta)
+    if info:
+        return info['base'], info['nodo']
+    return os.path.basename(ruta), NODO_ID
+
+
+def guardar_captura(ruta, capture_id, filas, archivo=None):
+    """Sumidero de LoteCaptura: filas ya normalizadas (v2) de una captura"""
+    if not filas:
+        return
+    origen, nodo = origen_de_ruta(ruta)
+    with conectar(archivo) as db:
+        with db:   # una transacción por captura
+            _insertar(db, capture_id, origen, nodo, filas)
+
+
+def anotar_solapes(capture_id, solapes, archivo=None):
+    """Guarda en la captura cuántas otras midieron a la vez (se sabe al cerrar sus ventanas)"""
+    with conectar(archivo) as db:
+        with db:
+            db.execute("UPDATE capturas SET solapes_medicion = ? WHERE capture_id = ?", (int(solapes), capture_id))
+
+
+def importar_csv(ruta, archivo=None):
+    """Vuelca un CSV v1 o v2 (idempotente); sin capture_id se agrupa por timestamp"""
+    origen, nodo = origen_de_ruta(ruta)
+    nuevas = 0
+    with conectar(archivo) as db, open(ruta, newline='', encoding='utf-8') as f:
+        lector = csv.reader(f)
+        cabecera = next(lector, [])
+        capturas = {}
+        for v2 in normalizar_filas(lector, cabecera_logica(cabecera)):
+            capture_id = v2[7] or f"{origen}@{v2[0]}"
+            if capture_id not in capturas and len(capturas) >= LOTE_IMPORTACION:
+                # se vacía entre capturas: una captura partida perdería su segunda mitad
+                with db:
+                    nuevas += sum(_insertar(db, c, origen, nodo, fs) for c, fs in capturas.items())
+                capturas = {}
+            capturas.setdefault(capture_id, []).append(v2)
+        with db:
+            nuevas += sum(_insertar(db, c, origen, nodo, fs) for c, fs in capturas.items())
+    return nuevas
+
+
+# ===================== LECTURA =====================
+def providers_guardados(db):
+    """Providers distintos saltando por el índice (una búsqueda por provider, sin escanear la tabla)"""
+    providers = []
+    actual = db.execute("SELECT MIN(provider) FROM mediciones").fetchone()[0]
+    while actual is not None:
+        providers.append(actual)
+        actual = db.execute("SELECT MIN(provider) FROM mediciones WHERE provider > ?", (actual,)).fetchone()[0]
+    return providers
+
+
+def consultar(provider=None, region=None, desde=None, hasta=None, archivo=None):
+    """
+    Filas (ts_ms, provider, region, datacenter, latency_ms) filtradas por el índice;
+    provider es un patrón (regex, sin mayúsculas), region se compara por clave canónica
+    y desde/hasta son horas locales (texto o datetime)
+    """
+    condiciones, parametros = [], []
+    for columna, operador, valor in (('region_key', '=', region and clave_region(region)),
+                                     ('ts_ms', '>=', desde and a_epoch_ms(desde)),
+                                     ('ts_ms', '<=', hasta and a_epoch_ms(hasta))):
+        if valor is not None:
+            condiciones.append(f"{columna} {operador} ?")
+            parametros.append(valor)
+    with conectar(archivo) as db:
+        if provider is not None:
+            elegidos = [p for p in providers_guardados(db) if re.search(provider, p, re.I)]
+            if not elegidos:
+                return []
+            condiciones.insert(0, f"provider IN ({', '.join('?' * len(elegidos))})")
+            parametros[:0] = elegidos
+        sql = "SELECT ts_ms, provider, region, datacenter, latency_ms FROM mediciones"
+        if condiciones:
+            sql += " WHERE " + " AND ".join(condiciones)
+        return db.execute(sql + " ORDER BY provider, region_key, ts_ms", parametros).fetchall()
+
+
+def consultar_df(provider=None, region=None, desde=None, hasta=None, archivo=None):
+    import pandas as pd
+    df = pd.DataFrame(consultar(provider, region, desde, hasta, archivo),
+                      columns=['ts_ms', 'provider', 'region', 'datacenter', 'latency_ms'])
+    df.insert(0, 'timestamp', ms_a_local(df.pop('ts_ms')))
+    return df
+
+
+def main():
+    args = sys.argv[1:]
+    if not ARCHIVO_SQLITE:
+        print("❌ Define SQLITE_LATENCIA=ruta.db")
+        return
+    if '--importar' in args:
+        for ruta in sorted(set(sum((glob.glob(p) for p in PATRONES_CSV), []))):
+            inicio = time.perf_counter()
+            nuevas = importar_csv(ruta)
+            print(f"📥 {ruta}: {nuevas} capturas nuevas ({time.perf_counter() - inicio:.1f}s)")
+    if '--consulta' in args:
+        filtros = args[args.index('--consulta') + 1:][:4]
+        filtros += [None] * (4 - len(filtros))
+        inicio = time.perf_counter()
+        filas = consultar(*filtros)
+        print(f"🔎 {len(filas)} filas en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+        for fila in filas[:5]:
+            print(f"   {fila}")
+
+
+if __name__ == "__main__":
+    main()
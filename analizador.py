@@ -16,12 +16,33 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy import stats
 import json
+from pandas.api.types import union_categoricals
 from pathlib import Path
 import gc
 import re
+import contextlib
+import io
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import cache_analisis
+from agregados_latencia import SEMILLA_MUESTREO, AgregadoLatencia, ReservorioEstratificado, tablas_exactas
+from dataset_columnar import FILAS_BLOQUE, compactar_csv, iterar_latencias
+from esquema_latencia import clave_region
 
 # Configuración
 warnings.filterwarnings('ignore')
+PROCESOS_CARGA = int(os.environ.get('ANALIZADOR_PROCESOS', os.cpu_count() or 1))   # 1 → carga en serie
+# Agrupamientos del motor de métricas (una pasada, cacheados en metricas_cache['tablas'])
+AGRUPAMIENTOS_METRICAS = {
+    'proveedor': ['proveedor_real'],
+    'herramienta': ['herramienta'],
+    'herramienta_proveedor': ['herramienta', 'proveedor_real'],
+    'hora': ['hora'],
+    'datacenter': ['datacenter_id', 'proveedor_real'],
+    'region_proveedor': ['region', 'proveedor_real'],
+    'global': [],
+}
 pd.set_option('display.max_columns', None)
 pd.set_option('display.width', 1000)
 
@@ -30,7 +51,7 @@ plt.style.use('seaborn-v0_8-darkgrid')
 sns.set_palette("husl")
 
 class AnalizadorLatenciaMultiProveedor:
-    def __init__(self, ruta_datos, umbral_latencia=100, umbral_disponibilidad=0.95):
+    def __init__(self, ruta_datos, umbral_latencia=100, umbral_disponibilidad=0.95, directorio_cache=None):
         """
         Inicializa el analizador de latencia para múltiples proveedores
         
@@ -38,12 +59,16 @@ class AnalizadorLatenciaMultiProveedor:
             ruta_datos: Ruta a los archivos CSV
             umbral_latencia: Latencia máxima aceptable en ms
             umbral_disponibilidad: Disponibilidad mínima aceptable
+            directorio_cache: Caché en disco de las etapas (cache_analisis.py); None → sin caché
         """
         self.ruta_datos = ruta_datos
         self.umbral_latencia = umbral_latencia
         self.umbral_disponibilidad = umbral_disponibilidad
         self.df_completo = None
         self.metricas_cache = {}
+        self.agregados = None   # agregados fusionables de la carga por bloques (solo con muestreo)
+        self.directorio_cache = directorio_cache
+        self._clave_carga = None   # clave en caché de la última carga (base de las de las etapas)
         
         # Lista de archivos esperados
         self.archivos_esperados = [
@@ -59,6 +84,12 @@ class AnalizadorLatenciaMultiProveedor:
             'huawei_cloudping_latency_longterm.csv'
         ]
         
+        # Dimensiones de texto → category (códigos int8/int16 + un diccionario por columna)
+        self.columnas_categoricas = [
+            'provider', 'region', 'datacenter', 'from_region', 'to_region',
+            'archivo_fuente', 'proveedor_real', 'herramienta', 'capture_id', 'datacenter_id'
+        ]
+        
         # Mapeo para extraer proveedor real del nombre del archivo
         self.mapeo_proveedores = {
             'aws_': 'aws',
@@ -69,10 +100,52 @@ class AnalizadorLatenciaMultiProveedor:
             'cloudpinginfo_': 'multi'  # Mide múltiples proveedores
         }
         
-    def cargar_y_unificar_datos(self, muestra_porcentaje=100):
+    def cargar_y_unificar_datos(self, muestra_porcentaje=100, proveedores=None, regiones=None,
+                                desde=None, hasta=None, filas_por_estrato=None, filas_por_bloque=FILAS_BLOQUE):
         """
-        Carga y unifica todos los archivos CSV adaptándose a sus formatos específicos
+        Carga y unifica todos los archivos CSV adaptándose a sus formatos específicos.
+        Cada archivo se lee por bloques (iterar_latencias) y se filtra al leer:
+            proveedores: proveedores reales a incluir (aws, azure, ...)
+            regiones: regiones a incluir (se comparan por clave canónica)
+            desde/hasta: ventana de tiempo (las particiones de días fuera ni se leen)
+        Muestreo estratificado por proveedor/región durante la lectura (memoria acotada):
+            muestra_porcentaje: fracción de filas de cada estrato
+            filas_por_estrato: máximo de filas por estrato (reservorio)
+        Con muestreo, las métricas salen de agregados fusionables de todas las filas
+        leídas y df_completo es solo la muestra.
+        Con directorio_cache, si los CSV y estos parámetros no cambiaron, el frame limpio
+        (y los agregados) se restauran del disco.
         """
+        parametros = {'muestra_porcentaje': muestra_porcentaje, 'proveedores': proveedores, 'regiones': regiones,
+                      'desde': desde, 'hasta': hasta, 'filas_por_estrato': filas_por_estrato,
+                      'filas_por_bloque': filas_por_bloque}
+        self._clave_carga = None
+        self.metricas_cache.pop('tablas', None)
+        if not self.directorio_cache:
+            return self._cargar_y_unificar(**parametros)
+        
+        # Sin muestreo latencia_aceptable se recalcula al restaurar → el umbral no entra en la clave
+        if muestra_porcentaje < 100 or filas_por_estrato:
+            parametros['umbral_latencia'] = self.umbral_latencia
+        huella = cache_analisis.huella_archivos(
+            [os.path.join(self.ruta_datos, archivo) for archivo in self.archivos_esperados])
+        clave = cache_analisis.clave_etapa('carga', huella, parametros)
+        guardado = cache_analisis.leer(self.directorio_cache, 'carga', clave)
+        if guardado is not None:
+            self.df_completo, self.agregados = guardado['df_completo'], guardado['agregados']
+            self.df_completo['latencia_aceptable'] = self.df_completo['latency_ms'] <= self.umbral_latencia
+            print(f"♻️  Datos restaurados de la caché ({clave}): {len(self.df_completo):,} registros, "
+                  f"{self.df_completo['timestamp'].min()} a {self.df_completo['timestamp'].max()}")
+        else:
+            parametros.pop('umbral_latencia', None)
+            self._cargar_y_unificar(**parametros)
+            cache_analisis.guardar(self.directorio_cache, 'carga', clave,
+                                   {'df_completo': self.df_completo, 'agregados': self.agregados})
+        self._clave_carga = clave
+        return self.df_completo
+    
+    def _cargar_y_unificar(self, muestra_porcentaje, proveedores, regiones, desde, hasta,
+                           filas_por_estrato, filas_por_bloque):
         print("=" * 80)
         print("CARGANDO Y PROCESANDO ARCHIVOS DE DATOS")
         print("=" * 80)
@@ -81,104 +154,55 @@ class AnalizadorLatenciaMultiProveedor:
         archivos_procesados = []
         archivos_no_encontrados = []
         
+        muestreo = None
+        if muestra_porcentaje < 100 or filas_por_estrato:
+            muestreo = (muestra_porcentaje / 100, filas_por_estrato)
+        filtros = {'regiones': regiones, 'desde': desde, 'hasta': hasta, 'filas_por_bloque': filas_por_bloque}
+        reservorio = None
+        self.agregados = None
+        self.df_completo = None   # no viaja a los procesos de carga
+        filas_leidas = 0
+        
         print(f"📁 Buscando archivos en: {os.path.abspath(self.ruta_datos)}")
         print(f"📋 Archivos en el directorio: {len(os.listdir(self.ruta_datos)) if os.path.exists(self.ruta_datos) else 'Directorio no existe'} archivos")
         
+        pendientes = []
         for archivo_nombre in self.archivos_esperados:
             archivo_path = os.path.join(self.ruta_datos, archivo_nombre)
             
             if not os.path.exists(archivo_path):
                 archivos_no_encontrados.append(archivo_nombre)
                 continue
-                
-            print(f"\n✅ Procesando: {archivo_nombre}")
             
-            try:
-                # Leer primero las primeras líneas para inspeccionar
-                with open(archivo_path, 'r') as f:
-                    primeras_lineas = [next(f) for _ in range(3)]
-                
-                print(f"  📄 Muestra de datos (3 primeras líneas):")
-                for i, linea in enumerate(primeras_lineas):
-                    print(f"    Línea {i+1}: {linea.strip()}")
-                
-                # Determinar el formato del archivo
-                if archivo_nombre == 'cloudpingco_latency_longterm.csv':
-                    # Formato especial: from_region, to_region
-                    try:
-                        df = pd.read_csv(archivo_path, 
-                                       names=['timestamp', 'provider', 'from_region', 'to_region', 'latency_ms'],
-                                       parse_dates=['timestamp'])
-                    except Exception as e:
-                        print(f"  ⚠️  Error leyendo con parse_dates, intentando sin: {e}")
-                        df = pd.read_csv(archivo_path, 
-                                       names=['timestamp', 'provider', 'from_region', 'to_region', 'latency_ms'])
-                        # Intentar convertir timestamp manualmente
-                        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-                    
-                    # Extraer proveedor del nombre del archivo
-                    proveedor_real = None
-                    for key, value in self.mapeo_proveedores.items():
-                        if archivo_nombre.startswith(key):
-                            proveedor_real = value
-                            break
-                    
-                    # Para cloudping.co, usar el proveedor de destino
-                    df['provider'] = proveedor_real
-                    df['region'] = df['to_region']
-                    df['datacenter'] = df['to_region']
-                    
-                else:
-                    # Formato estándar: timestamp,provider,region,datacenter,latency_ms
-                    try:
-                        df = pd.read_csv(archivo_path, 
-                                       names=['timestamp', 'provider', 'region', 'datacenter', 'latency_ms'],
-                                       parse_dates=['timestamp'])
-                    except Exception as e:
-                        print(f"  ⚠️  Error leyendo con parse_dates, intentando sin: {e}")
-                        df = pd.read_csv(archivo_path, 
-                                       names=['timestamp', 'provider', 'region', 'datacenter', 'latency_ms'])
-                        # Intentar convertir timestamp manualmente
-                        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-                
-                # Verificar que timestamp sea datetime
-                if not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
-                    print(f"  ⚠️  timestamp no es datetime, intentando convertir...")
-                    df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-                
-                # Verificar si hay valores nulos en timestamp
-                nulos_timestamp = df['timestamp'].isnull().sum()
-                if nulos_timestamp > 0:
-                    print(f"  ⚠️  {nulos_timestamp} timestamps nulos encontrados, eliminando...")
-                    df = df.dropna(subset=['timestamp'])
-                
-                # Añadir información del archivo
-                df['archivo_fuente'] = archivo_nombre
-                df['proveedor_real'] = self._extraer_proveedor_real(archivo_nombre)
-                df['herramienta'] = self._extraer_herramienta(archivo_nombre)
-                
-                # Limpieza específica por archivo
-                df = self._limpiar_datos_especificos(df, archivo_nombre)
-                
-                if muestra_porcentaje < 100:
-                    df = df.sample(frac=muestra_porcentaje/100, random_state=42)
-                
-                dfs.append(df)
-                archivos_procesados.append(archivo_nombre)
-                
-                print(f"  ✅ {len(df):,} registros cargados")
-                print(f"  📅 Período: {df['timestamp'].min()} a {df['timestamp'].max()}")
-                print(f"  🏢 Proveedor detectado: {df['proveedor_real'].iloc[0]}")
-                print(f"  🛠️  Herramienta: {df['herramienta'].iloc[0]}")
-                
-                # Liberar memoria
-                gc.collect()
-                
-            except Exception as e:
-                print(f"  ❌ Error procesando {archivo_nombre}: {str(e)}")
-                import traceback
-                traceback.print_exc()
+            if proveedores is not None and self._extraer_proveedor_real(archivo_nombre) not in proveedores:
                 continue
+            
+            pendientes.append(archivo_nombre)
+        
+        # Un proceso por archivo (hasta PROCESOS_CARGA); resultados en el orden de archivos_esperados
+        for resultado in self._procesar_archivos(pendientes, muestreo, filtros):
+            print(resultado['salida'], end='')
+            if not resultado['registros']:
+                continue
+            
+            filas_leidas += resultado['registros']
+            archivos_procesados.append(resultado['archivo'])
+            if muestreo is None:
+                dfs.extend(resultado['bloques'])
+            elif reservorio is None:
+                reservorio, self.agregados = resultado['reservorio'], resultado['agregados']
+            else:
+                # Agregados y reservorios de cada archivo se fusionan (mismo resultado que en serie)
+                reservorio.fusionar(resultado['reservorio'])
+                for nombre, agregado in resultado['agregados'].items():
+                    self.agregados[nombre].fusionar(agregado)
+        
+        if reservorio is not None:
+            dfs = reservorio.filas()
+            print(f"\n🎲 Muestra estratificada por proveedor/región: {sum(len(df) for df in dfs):,} "
+                  f"de {filas_leidas:,} registros (métricas sobre todos, con agregados por bloques)")
+            if not dfs:
+                archivos_procesados = []
         
         # Reporte de archivos
         print(f"\n{'='*60}")
@@ -193,7 +217,9 @@ class AnalizadorLatenciaMultiProveedor:
         
         if archivos_procesados:
             print(f"\n🔗 Unificando datos de {len(dfs)} dataframes...")
-            self.df_completo = pd.concat(dfs, ignore_index=True, sort=False)
+            # Unión ya ordenada por timestamp, columna a columna (sin concat + sort del total)
+            self.df_completo = self._concatenar_ordenado(dfs)
+            del dfs
             
             print(f"  📊 Total antes de limpieza: {len(self.df_completo):,} registros")
             
@@ -240,6 +266,143 @@ class AnalizadorLatenciaMultiProveedor:
         
         return self.df_completo
     
+    def _procesar_archivos(self, archivos, muestreo, filtros):
+        """Carga y limpieza por archivo en un pool de procesos; devuelve los resultados en orden"""
+        tareas = [(archivo, indice, muestreo, filtros) for indice, archivo in enumerate(archivos)]
+        procesos = min(PROCESOS_CARGA, len(tareas))
+        if procesos <= 1:
+            return [self._procesar_archivo(*tarea) for tarea in tareas]
+        print(f"⚙️  Cargando {len(tareas)} archivos en {procesos} procesos")
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            return list(pool.map(self._procesar_archivo, *zip(*tareas)))
+    
+    def _procesar_archivo(self, archivo_nombre, indice, muestreo, filtros):
+        """
+        Un archivo: compactación, lectura por bloques y limpieza. Devuelve los bloques (o,
+        con muestreo, su reservorio y agregados) y la salida impresa, que se muestra en orden
+        """
+        archivo_path = os.path.join(self.ruta_datos, archivo_nombre)
+        resultado = {'archivo': archivo_nombre, 'registros': 0, 'bloques': [],
+                     'reservorio': None, 'agregados': None}
+        salida = io.StringIO()
+        with contextlib.redirect_stdout(salida):
+            print(f"\n✅ Procesando: {archivo_nombre}")
+            
+            try:
+                # Leer primero las primeras líneas para inspeccionar
+                with open(archivo_path, 'r') as f:
+                    primeras_lineas = [next(f) for _ in range(3)]
+                
+                print(f"  📄 Muestra de datos (3 primeras líneas):")
+                for i, linea in enumerate(primeras_lineas):
+                    print(f"    Línea {i+1}: {linea.strip()}")
+                
+                # Catálogo de ingesta: solo se parsea lo añadido al CSV desde la última ejecución
+                nuevas = compactar_csv(archivo_path)
+                print(f"  📒 Catálogo de ingesta: {nuevas:,} filas nuevas parseadas")
+                
+                if muestreo is not None:
+                    # Semilla por archivo: la muestra no depende de qué proceso lo cargue
+                    fraccion, filas_por_estrato = muestreo
+                    resultado['reservorio'] = ReservorioEstratificado(
+                        ['proveedor_real', 'region'], filas_por_estrato, fraccion, semilla=[SEMILLA_MUESTREO, indice])
+                    resultado['agregados'] = {
+                        'general': AgregadoLatencia(['proveedor_real', 'herramienta', 'region', 'datacenter_id', 'hora']),
+                        'diario': AgregadoLatencia(['proveedor_real', 'fecha'], cuantiles=False),
+                        'horario': AgregadoLatencia(['region', 'proveedor_real', 'hora_completa'], cuantiles=False),
+                    }
+                
+                registros, periodo = 0, []
+                for df in self._bloques_archivo(archivo_path, archivo_nombre, **filtros):
+                    registros += len(df)
+                    periodo += [df['timestamp'].min(), df['timestamp'].max()]
+                    if muestreo is None:
+                        resultado['bloques'].append(df)
+                    else:
+                        # Agregados de todas las filas; a memoria solo pasa la muestra
+                        for agregado in resultado['agregados'].values():
+                            agregado.añadir(df)
+                        resultado['reservorio'].añadir(df)
+                    del df
+                
+                if registros == 0:
+                    print(f"  ⚠️  Sin registros tras los filtros")
+                else:
+                    resultado['registros'] = registros
+                    print(f"  ✅ {registros:,} registros cargados")
+                    print(f"  📅 Período: {min(periodo)} a {max(periodo)}")
+                    print(f"  🏢 Proveedor detectado: {self._extraer_proveedor_real(archivo_nombre)}")
+                    print(f"  🛠️  Herramienta: {self._extraer_herramienta(archivo_nombre)}")
+                
+                # Liberar memoria
+                gc.collect()
+                
+            except Exception as e:
+                print(f"  ❌ Error procesando {archivo_nombre}: {str(e)}")
+                import traceback
+                traceback.print_exc(file=sys.stdout)
+                resultado.update(registros=0, bloques=[])
+        
+        resultado['salida'] = salida.getvalue()
+        return resultado
+    
+    def _bloques_archivo(self, archivo_path, archivo_nombre, regiones, desde, hasta, filas_por_bloque):
+        """Bloques ya limpios, compactos y con las columnas derivadas de un archivo"""
+        if archivo_nombre == 'cloudpingco_latency_longterm.csv':
+            # Formato especial: from_region, to_region
+            names = ['timestamp', 'provider', 'from_region', 'to_region', 'latency_ms']
+        else:
+            # Formato estándar: timestamp,provider,region,datacenter,latency_ms
+            names = ['timestamp', 'provider', 'region', 'datacenter', 'latency_ms']
+        
+        # Dataset columnar ya al día (timestamp ya tipado), por bloques de particiones
+        for df in iterar_latencias(archivo_path, names=names, desde=desde, hasta=hasta,
+                                   filas_por_bloque=filas_por_bloque):
+            if archivo_nombre == 'cloudpingco_latency_longterm.csv':
+                # Para cloudping.co, usar el proveedor de destino
+                df['provider'] = self._extraer_proveedor_real(archivo_nombre)
+                df['region'] = df['to_region']
+                df['datacenter'] = df['to_region']
+            
+            # Duplicados ya descartados por el índice de claves del catálogo
+            deduplicado = df.attrs.get('deduplicado', False)
+            
+            # Verificar que timestamp sea datetime
+            if not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
+                print(f"  ⚠️  timestamp no es datetime, intentando convertir...")
+                df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+            
+            # Verificar si hay valores nulos en timestamp
+            nulos_timestamp = df['timestamp'].isnull().sum()
+            if nulos_timestamp > 0:
+                print(f"  ⚠️  {nulos_timestamp} timestamps nulos encontrados, eliminando...")
+                df = df.dropna(subset=['timestamp'])
+            
+            # Añadir información del archivo
+            df['archivo_fuente'] = archivo_nombre
+            df['proveedor_real'] = self._extraer_proveedor_real(archivo_nombre)
+            df['herramienta'] = self._extraer_herramienta(archivo_nombre)
+            
+            # Limpieza específica por archivo
+            df = self._limpiar_datos_especificos(df, archivo_nombre, deduplicado)
+            
+            # Representación compacta antes de acumular (el pico de memoria es la suma de dfs)
+            df = self._compactar_tipos(df)
+            
+            if regiones is not None:
+                claves = {clave_region(r) for r in regiones}
+                df = df[df['region'].isin([r for r in df['region'].cat.categories if clave_region(r) in claves])]
+            
+            if len(df):
+                yield self._derivar_columnas(df)
+    
+    def _proveedores_por_region(self):
+        """Proveedores con datos por región: del frame o, con muestreo, de los agregados (todas las filas)"""
+        if self.agregados:
+            parejas = self.agregados['general'].agrupar(['region', 'proveedor_real']).momentos.reset_index()
+            return parejas.groupby('region')['proveedor_real'].unique()
+        return self.df_completo.groupby('region', observed=True)['proveedor_real'].unique()
+    
     def _extraer_proveedor_real(self, archivo_nombre):
         """Extrae el proveedor real del nombre del archivo"""
         for key, value in self.mapeo_proveedores.items():
@@ -260,23 +423,32 @@ class AnalizadorLatenciaMultiProveedor:
         herramienta = nombre_sin_prefijo.split('_')[0]
         return herramienta
     
-    def _limpiar_datos_especificos(self, df, archivo_nombre):
+    def _limpiar_datos_especificos(self, df, archivo_nombre, deduplicado=False):
         """Limpieza específica por tipo de archivo"""
         
         print(f"  🔧 Limpiando datos de {archivo_nombre}...")
         
-        # Eliminar duplicados
-        antes = len(df)
-        df = df.drop_duplicates()
-        despues = len(df)
-        if antes != despues:
-            print(f"    ✅ Eliminados {antes - despues} duplicados")
-        
-        # Limpiar valores de latencia
-        df['latency_ms'] = pd.to_numeric(df['latency_ms'], errors='coerce')
+        # Eliminar duplicados (si no lo hizo ya el catálogo al ingerir, con claves de fila)
+        if not deduplicado:
+            antes = len(df)
+            df = df.drop_duplicates()
+            despues = len(df)
+            if antes != despues:
+                print(f"    ✅ Eliminados {antes - despues} duplicados")
+        
+        # CSV v2 (esquema_latencia.py): latencia numérica y status ya vienen normalizados
+        # desde la escritura → sin conversiones ni limpieza de cadenas
+        normalizado = 'status' in df.columns
+        if normalizado:
+            invalidos = (df['status'] != 'ok').sum()
+            df['region'] = df.pop('region_key')
+            df = df.drop(columns='status')
+        else:
+            # Limpiar valores de latencia
+            df['latency_ms'] = pd.to_numeric(df['latency_ms'], errors='coerce')
+            invalidos = df['latency_ms'].isnull().sum()
         
         # Contar valores inválidos
-        invalidos = df['latency_ms'].isnull().sum()
         if invalidos > 0:
             print(f"    ⚠️  {invalidos} valores de latencia inválidos encontrados")
         
@@ -288,21 +460,21 @@ class AnalizadorLatenciaMultiProveedor:
             print(f"    ✅ Eliminados {antes_filtro - despues_filtro} registros con latencia fuera de rango")
         
         # Limpiar cadenas de texto
-        if 'provider' in df.columns:
+        if not normalizado and 'provider' in df.columns:
             df['provider'] = df['provider'].astype(str).str.strip()
         
+        # Misma clave de región en v1 y v2 (los CSV se migran de uno en uno → árboles mixtos);
+        # en v2 también: las claves escritas antes de quitar los guiones se rehacen igual
         if 'region' in df.columns:
-            df['region'] = df['region'].astype(str).str.strip().str.upper()
+            regiones = df['region'].astype(str)
+            unicas = regiones.unique()
+            df['region'] = regiones.map(dict(zip(unicas, map(clave_region, unicas))))
         
-        if 'datacenter' in df.columns:
+        if not normalizado and 'datacenter' in df.columns:
             df['datacenter'] = df['datacenter'].astype(str).str.strip()
         
         # Limpieza específica por archivo
-        if archivo_nombre == 'cloudpingco_latency_longterm.csv':
-            # Para cloudping.co, extraer proveedor de to_region
-            df['region'] = df['region'].astype(str).str.strip().str.upper()
-        
-        elif 'cloudpingtest' in archivo_nombre:
+        if 'cloudpingtest' in archivo_nombre:
             # cloudpingtest.com tiene latencias más altas
             print(f"    ℹ️  Archivo cloudpingtest detectado (latencias altas esperadas)")
         
@@ -310,38 +482,90 @@ class AnalizadorLatenciaMultiProveedor:
         
         return df
     
-    def _limpiar_datos_generales(self, df):
-        """Limpieza general después de unificar todos los datos"""
-        
-        print("\n🔧 APLICANDO LIMPIEZA GENERAL A DATOS UNIFICADOS...")
-        
-        # Verificar y asegurar que timestamp es datetime
-        if not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
-            print("  ⚠️  timestamp no es datetime, convirtiendo...")
-            df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-        
-        # Eliminar registros con timestamp nulo
-        antes = len(df)
-        df = df.dropna(subset=['timestamp'])
-        despues = len(df)
-        if antes != despues:
-            print(f"  ✅ Eliminados {antes - despues} registros con timestamp nulo")
+    def _compactar_tipos(self, df):
+        """Textos → category y latencia → float32 (los análisis no necesitan más precisión)"""
+        for columna in self.columnas_categoricas:
+            if columna in df.columns:
+                df[columna] = df[columna].astype('category')
+        df['latency_ms'] = df['latency_ms'].astype('float32')
+        return df
+    
+    def _unificar_categorias(self, dfs):
+        """Da a cada columna category el mismo diccionario (ordenado) en todos los dataframes"""
+        for columna in self.columnas_categoricas:
+            presentes = [df[columna] for df in dfs if columna in df.columns]
+            if not presentes:
+                continue
+            categorias = union_categoricals(presentes, sort_categories=True).categories
+            for df in dfs:
+                if columna in df.columns:
+                    df[columna] = df[columna].cat.set_categories(categorias)
+                else:
+                    df[columna] = pd.Categorical.from_codes(np.full(len(df), -1), categories=categorias)
+        return dfs
+    
+    def _concatenar_ordenado(self, dfs):
+        """
+        Une los dataframes ordenando por timestamp columna a columna: cada columna se
+        concatena, se reordena una vez y se suelta de los dataframes de origen, así nunca
+        coexisten dos copias completas (antes concat + sort_values + reset_index)
+        """
+        dfs = self._unificar_categorias(dfs)
+        orden = np.argsort(np.concatenate([df['timestamp'].to_numpy() for df in dfs]), kind='stable')
+        columnas = list(dict.fromkeys(c for df in dfs for c in df.columns))
+        datos = {}
+        for columna in columnas:
+            unida = pd.concat([df.pop(columna) if columna in df.columns else pd.Series(np.nan, index=df.index)
+                               for df in dfs], ignore_index=True)
+            datos[columna] = pd.Series(unida.array.take(orden), name=columna)
+            del unida
+        return pd.DataFrame(datos, copy=False)
+    
+    def _posiciones(self, claves):
+        """{clave: posiciones de fila} con un solo groupby (sin una máscara del frame por pareja)"""
+        return self.df_completo.groupby(claves, observed=True).indices
+    
+    def _subconjunto(self, posiciones, columnas):
+        """Solo las filas y columnas pedidas: la copia es del subconjunto, no del frame entero"""
+        return self.df_completo.iloc[posiciones, [self.df_completo.columns.get_loc(c) for c in columnas]]
+    
+    @staticmethod
+    def _a_json(valor):
+        """Escalares numpy (float32 de la latencia, int8 de las horas) como números en el JSON"""
+        return valor.item() if isinstance(valor, np.generic) else str(valor)
+    
+    @staticmethod
+    def _combinar_categorias(a, b, separador='_'):
+        """a + separador + b para dos columnas category sin materializar los textos por fila"""
+        n = max(len(b.cat.categories), 1)
+        codigos_a, codigos_b = a.cat.codes.to_numpy(), b.cat.codes.to_numpy()
+        combinado = np.where((codigos_a < 0) | (codigos_b < 0), -1, codigos_a.astype('int64') * n + codigos_b)
+        unicos, inversa = np.unique(combinado, return_inverse=True)
+        validos = unicos[unicos >= 0]
+        etiquetas = [f"{a.cat.categories[u // n]}{separador}{b.cat.categories[u % n]}" for u in validos]
+        codigos = inversa - (len(unicos) - len(validos))   # el -1 (si lo hay) es el primero de unicos
+        return pd.Series(pd.Categorical.from_codes(codigos, categories=etiquetas), index=a.index)
+    
+    def _derivar_columnas(self, df):
+        """Columnas derivadas de cada bloque (no dependen de otras filas)"""
         
         # Crear identificador único de datacenter
-        df['datacenter_id'] = df['proveedor_real'] + '_' + df['region']
+        df['datacenter_id'] = self._combinar_categorias(df['proveedor_real'], df['region'])
         
-        # Crear columnas derivadas solo si timestamp es datetime
+        # Crear columnas derivadas solo si timestamp es datetime (partes de fecha en int8)
         try:
-            df['fecha'] = df['timestamp'].dt.date
-            df['hora'] = df['timestamp'].dt.hour
-            df['dia_semana'] = df['timestamp'].dt.day_name()
-            df['mes'] = df['timestamp'].dt.month
-            df['dia_mes'] = df['timestamp'].dt.day
+            df['fecha'] = df['timestamp'].dt.normalize()
+            df['hora'] = df['timestamp'].dt.hour.astype('int8')
+            df['dia_semana'] = pd.Categorical.from_codes(
+                df['timestamp'].dt.dayofweek.to_numpy(),
+                categories=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'],
+                ordered=True)
+            df['mes'] = df['timestamp'].dt.month.astype('int8')
+            df['dia_mes'] = df['timestamp'].dt.day.astype('int8')
             
             # Crear identificador de hora completa
             df['hora_completa'] = df['timestamp'].dt.floor('H')
             
-            print("  ✅ Columnas temporales creadas exitosamente")
         except Exception as e:
             print(f"  ❌ Error creando columnas temporales: {e}")
             print(f"    Tipo de timestamp: {df['timestamp'].dtype}")
@@ -362,65 +586,91 @@ class AnalizadorLatenciaMultiProveedor:
             print(f"  ⚠️  Error categorizando latencia: {e}")
             df['latencia_categoria'] = 'No categorizada'
         
-        # Ordenar por timestamp
-        df = df.sort_values('timestamp').reset_index(drop=True)
+        return df
+    
+    def _limpiar_datos_generales(self, df):
+        """Limpieza general después de unificar todos los datos"""
+        
+        print("\n🔧 APLICANDO LIMPIEZA GENERAL A DATOS UNIFICADOS...")
+        
+        # Verificar y asegurar que timestamp es datetime
+        if not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
+            print("  ⚠️  timestamp no es datetime, convirtiendo...")
+            df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+        
+        # Eliminar registros con timestamp nulo (sin copiar el frame si no hay ninguno)
+        nulos = df['timestamp'].isna()
+        if nulos.any():
+            df = df[~nulos].reset_index(drop=True)
+            print(f"  ✅ Eliminados {int(nulos.sum())} registros con timestamp nulo")
+        
+        # Columnas derivadas (datacenter_id, partes de fecha, latencia_aceptable...) ya
+        # creadas por bloque en _derivar_columnas
+        print("  ✅ Columnas temporales creadas exitosamente")
+        
+        # Ordenar por timestamp (la carga ya lo deja ordenado: solo se copia si hace falta)
+        if not df['timestamp'].is_monotonic_increasing:
+            df = df.sort_values('timestamp', kind='stable', ignore_index=True)
         
         print(f"  ✅ Limpieza general completada: {len(df):,} registros finales")
         
         return df
     
+    def _etapa_con_cache(self, etapa, entradas_cache, calcular):
+        """
+        calcular() o, si ya se hizo con la misma carga y umbral_latencia, su resultado del
+        disco: se repite su salida y se restauran sus entradas de metricas_cache
+        """
+        if not self.directorio_cache or self._clave_carga is None:
+            return calcular()
+        clave = cache_analisis.clave_etapa(etapa, self._clave_carga, self.umbral_latencia)
+        guardado = cache_analisis.leer(self.directorio_cache, etapa, clave)
+        if guardado is not None:
+            print(guardado['salida'], end='')
+            self.metricas_cache.update(guardado['metricas_cache'])
+            print(f"♻️  {etapa}: restaurado de la caché ({clave})")
+            return guardado['resultado']
+        
+        with cache_analisis.capturar_salida() as salida:
+            resultado = calcular()
+        cache_analisis.guardar(self.directorio_cache, etapa, clave, {
+            'resultado': resultado,
+            'salida': salida.getvalue(),
+            'metricas_cache': {k: self.metricas_cache[k] for k in entradas_cache if k in self.metricas_cache},
+        })
+        return resultado
+    
     def calcular_metricas_generales(self):
         """
         Calcula métricas generales de rendimiento
+        (la etapa se restaura de la caché en disco si la carga y umbral_latencia no cambiaron)
         """
+        return self._etapa_con_cache('metricas', ['generales', 'tablas'], self._calcular_metricas_generales)
+    
+    def _calcular_metricas_generales(self):
+        """Cálculo de calcular_metricas_generales (sin caché)"""
         print("\n" + "="*80)
         print("📊 CALCULANDO MÉTRICAS GENERALES DE RENDIMIENTO")
         print("="*80)
         
         metricas = {}
+        metricas_proveedor, metricas_herramienta, metricas_hora, top_datacenters = self._metricas_generales()
         
         # 1. Métricas por proveedor real
         print("\n1. 📊 MÉTRICAS POR PROVEEDOR:")
         print("-" * 60)
-        
-        metricas_proveedor = self.df_completo.groupby('proveedor_real').agg({
-            'latency_ms': ['count', 'mean', 'median', 'std', 
-                          lambda x: np.percentile(x, 95),
-                          lambda x: np.percentile(x, 99)],
-            'latencia_aceptable': 'mean'
-        }).round(2)
-        
-        metricas_proveedor.columns = ['registros', 'media', 'mediana', 'std', 
-                                     'p95', 'p99', 'disponibilidad']
         metricas['por_proveedor'] = metricas_proveedor
-        
         print(metricas_proveedor.to_string())
         
         # 2. Métricas por herramienta
         print("\n2. 🛠️ MÉTRICAS POR HERRAMIENTA:")
         print("-" * 60)
-        
-        metricas_herramienta = self.df_completo.groupby('herramienta').agg({
-            'latency_ms': ['mean', 'std', lambda x: np.percentile(x, 95)],
-            'latencia_aceptable': 'mean',
-            'proveedor_real': 'nunique'
-        }).round(2)
-        
-        metricas_herramienta.columns = ['latencia_media', 'latencia_std', 'latencia_p95', 
-                                       'disponibilidad', 'proveedores_medidos']
         metricas['por_herramienta'] = metricas_herramienta
-        
         print(metricas_herramienta.to_string())
         
         # 3. Métricas por hora del día
         print("\n3. ⏰ MÉTRICAS POR HORA DEL DÍA:")
         print("-" * 60)
-        
-        metricas_hora = self.df_completo.groupby('hora').agg({
-            'latency_ms': 'mean',
-            'latencia_aceptable': 'mean'
-        }).round(2)
-        
         metricas['por_hora'] = metricas_hora
         
         print("Hora | Latencia Media | Disponibilidad")
@@ -432,25 +682,8 @@ class AnalizadorLatenciaMultiProveedor:
         print("\n4. 🏭 TOP 10 DATACENTERS POR LATENCIA:")
         print("-" * 60)
         
-        # Filtrar datacenters con suficiente datos
-        conteo_datacenters = self.df_completo['datacenter_id'].value_counts()
-        datacenters_suficientes = conteo_datacenters[conteo_datacenters > 100].index
-        
-        if len(datacenters_suficientes) > 0:
-            df_filtrado = self.df_completo[self.df_completo['datacenter_id'].isin(datacenters_suficientes)]
-            
-            top_datacenters = df_filtrado.groupby('datacenter_id').agg({
-                'latency_ms': ['mean', 'std', lambda x: np.percentile(x, 95)],
-                'latencia_aceptable': 'mean',
-                'proveedor_real': 'first'
-            }).round(2)
-            
-            top_datacenters.columns = ['latencia_media', 'latencia_std', 'latencia_p95', 
-                                      'disponibilidad', 'proveedor']
-            
-            # Ordenar por latencia media
-            top_datacenters = top_datacenters.sort_values('latencia_media')
-            metricas['top_datacenters'] = top_datacenters.head(10)
+        if top_datacenters is not None:
+            metricas['top_datacenters'] = top_datacenters
             
             print("\n🏆 Mejores datacenters (menor latencia):")
             for idx, (datacenter, fila) in enumerate(metricas['top_datacenters'].iterrows(), 1):
@@ -465,10 +698,65 @@ class AnalizadorLatenciaMultiProveedor:
         self.metricas_cache['generales'] = metricas
         return metricas
     
+    def _tablas_metricas(self):
+        """
+        registros, media, std, disponibilidad y mediana/p95/p99 de cada agrupamiento de
+        AGRUPAMIENTOS_METRICAS, calculados una vez y servidos desde metricas_cache. Del frame
+        (cuantiles exactos) o, con muestreo, de los agregados de todas las filas leídas
+        """
+        if 'tablas' not in self.metricas_cache:
+            if self.agregados:
+                general = self.agregados['general']
+                tablas = {nombre: general.agrupar(claves).tabla() for nombre, claves in AGRUPAMIENTOS_METRICAS.items()}
+            else:
+                tablas = tablas_exactas(self.df_completo, AGRUPAMIENTOS_METRICAS)
+            self.metricas_cache['tablas'] = tablas
+        return self.metricas_cache['tablas']
+    
+    def _metricas_globales(self):
+        """(disponibilidad, latencia media, latencia P95) de todas las filas, desde la caché"""
+        fila = self._tablas_metricas()['global'].iloc[0]
+        return fila['disponibilidad'], fila['media'], fila['p95']
+    
+    def _metricas_generales(self):
+        """(por proveedor, por herramienta, por hora, top datacenters o None) desde la caché"""
+        tablas = self._tablas_metricas()
+        
+        metricas_proveedor = tablas['proveedor'][
+            ['registros', 'media', 'mediana', 'std', 'p95', 'p99', 'disponibilidad']].round(2)
+        
+        metricas_herramienta = tablas['herramienta'][['media', 'std', 'p95', 'disponibilidad']].round(2)
+        metricas_herramienta.columns = ['latencia_media', 'latencia_std', 'latencia_p95', 'disponibilidad']
+        parejas = tablas['herramienta_proveedor'].index.to_frame(index=False)
+        metricas_herramienta['proveedores_medidos'] = parejas.groupby('herramienta', observed=True)['proveedor_real'].nunique()
+        
+        metricas_hora = tablas['hora'][['media', 'disponibilidad']].round(2)
+        metricas_hora.columns = ['latency_ms', 'latencia_aceptable']
+        
+        # Filtrar datacenters con suficiente datos
+        datacenters = tablas['datacenter']
+        datacenters = datacenters[datacenters['registros'] > 100]
+        if datacenters.empty:
+            return metricas_proveedor, metricas_herramienta, metricas_hora, None
+        
+        top_datacenters = datacenters[['media', 'std', 'p95', 'disponibilidad']].round(2)
+        top_datacenters.columns = ['latencia_media', 'latencia_std', 'latencia_p95', 'disponibilidad']
+        top_datacenters['proveedor'] = datacenters.index.get_level_values('proveedor_real')
+        top_datacenters.index = datacenters.index.get_level_values('datacenter_id')
+        
+        # Ordenar por latencia media
+        top_datacenters = top_datacenters.sort_values('latencia_media')
+        return metricas_proveedor, metricas_herramienta, metricas_hora, top_datacenters.head(10)
+    
     def analizar_comparacion_proveedores(self):
         """
         Compara proveedores en las mismas regiones
+        (la etapa se restaura de la caché en disco si la carga y umbral_latencia no cambiaron)
         """
+        return self._etapa_con_cache('comparacion', ['comparacion_proveedores'], self._analizar_comparacion_proveedores)
+    
+    def _analizar_comparacion_proveedores(self):
+        """Cálculo de analizar_comparacion_proveedores (sin caché)"""
         print("\n" + "="*80)
         print("🔄 COMPARANDO PROVEEDORES EN MISMAS REGIONES")
         print("="*80)
@@ -477,7 +765,7 @@ class AnalizadorLatenciaMultiProveedor:
         regiones_comunes = []
         
         # Agrupar por región y ver qué proveedores tienen datos
-        region_proveedores = self.df_completo.groupby('region')['proveedor_real'].unique()
+        region_proveedores = self._proveedores_por_region()
         
         for region, proveedores in region_proveedores.items():
             if len(proveedores) > 1:
@@ -500,6 +788,7 @@ class AnalizadorLatenciaMultiProveedor:
             return {}
         
         resultados_comparacion = {}
+        parejas = self._tablas_metricas()['region_proveedor']
         
         # Analizar las top 5 regiones con más proveedores
         for i, region_info in enumerate(regiones_comunes[:5]):
@@ -514,28 +803,26 @@ class AnalizadorLatenciaMultiProveedor:
             resultados_region = {}
             
             for proveedor in proveedores:
-                datos_proveedor = self.df_completo[
-                    (self.df_completo['region'] == region) & 
-                    (self.df_completo['proveedor_real'] == proveedor)
-                ]
+                if (region, proveedor) not in parejas.index:
+                    continue
+                fila = parejas.loc[(region, proveedor)]
+                latencia_media = fila['media']
+                disponibilidad = fila['disponibilidad']
+                latencia_p95 = fila['p95']
+                muestras = int(fila['registros'])
                 
-                if len(datos_proveedor) > 0:
-                    latencia_media = datos_proveedor['latency_ms'].mean()
-                    disponibilidad = datos_proveedor['latencia_aceptable'].mean()
-                    latencia_p95 = np.percentile(datos_proveedor['latency_ms'].values, 95)
-                    
-                    resultados_region[proveedor] = {
-                        'latencia_media': latencia_media,
-                        'disponibilidad': disponibilidad,
-                        'latencia_p95': latencia_p95,
-                        'muestras': len(datos_proveedor)
-                    }
-                    
-                    print(f"\n{proveedor.upper():10s}:")
-                    print(f"  📊 Latencia media: {latencia_media:.1f} ms")
-                    print(f"  📈 Latencia P95:   {latencia_p95:.1f} ms")
-                    print(f"  ✅ Disponibilidad: {disponibilidad:.2%}")
-                    print(f"  🔢 Muestras:       {len(datos_proveedor):,}")
+                resultados_region[proveedor] = {
+                    'latencia_media': latencia_media,
+                    'disponibilidad': disponibilidad,
+                    'latencia_p95': latencia_p95,
+                    'muestras': muestras
+                }
+                
+                print(f"\n{proveedor.upper():10s}:")
+                print(f"  📊 Latencia media: {latencia_media:.1f} ms")
+                print(f"  📈 Latencia P95:   {latencia_p95:.1f} ms")
+                print(f"  ✅ Disponibilidad: {disponibilidad:.2%}")
+                print(f"  🔢 Muestras:       {muestras:,}")
             
             # Determinar el mejor proveedor para esta región
             if resultados_region:
@@ -585,31 +872,54 @@ class AnalizadorLatenciaMultiProveedor:
     def analizar_tendencias_temporales(self):
         """
         Analiza tendencias de latencia a lo largo del tiempo
+        (la etapa se restaura de la caché en disco si la carga y umbral_latencia no cambiaron)
         """
+        return self._etapa_con_cache('tendencias', ['tendencias'], self._analizar_tendencias_temporales)
+    
+    def _analizar_tendencias_temporales(self):
+        """Cálculo de analizar_tendencias_temporales (sin caché)"""
         print("\n" + "="*80)
         print("📈 ANALIZANDO TENDENCIAS TEMPORALES")
         print("="*80)
         
-        # Configurar timestamp como índice para resample
-        df_temp = self.df_completo.set_index('timestamp')
+        # Filas de cada proveedor por posición; resample sobre ese subconjunto (3 columnas)
+        # en vez de set_index/reset_index del frame completo
+        if self.agregados:
+            diario = self.agregados['diario'].tabla()
+            proveedores_presentes = diario.index.unique('proveedor_real')
+        else:
+            posiciones = self._posiciones('proveedor_real')
+            proveedores_presentes = self.df_completo['proveedor_real'].unique()
         
         tendencias = {}
         
         # Analizar tendencias por proveedor
-        proveedores_a_analizar = [p for p in self.df_completo['proveedor_real'].unique() 
+        proveedores_a_analizar = [p for p in proveedores_presentes 
                                  if p not in ['multi', 'desconocido']]
         
         for proveedor in proveedores_a_analizar:
             print(f"\n📊 Analizando tendencias de {proveedor.upper()}...")
             
-            df_proveedor = df_temp[df_temp['proveedor_real'] == proveedor]
+            if self.agregados:
+                # Días sin filas como en resample: media NaN, count 0
+                dias = diario.loc[proveedor]
+                dias = dias.reindex(pd.date_range(dias.index.min(), dias.index.max(), freq='D'))
+                registros = int(dias['registros'].sum())
+                latencia_diaria = pd.DataFrame({'mean': dias['media'], 'std': dias['std'],
+                                                'count': dias['registros'].fillna(0).astype('int64')})
+                disponibilidad_diaria = dias['disponibilidad']
+            else:
+                df_proveedor = self._subconjunto(posiciones[proveedor], ['timestamp', 'latency_ms', 'latencia_aceptable'])
+                registros = len(df_proveedor)
             
-            if len(df_proveedor) < 100:  # Muy pocos datos
-                print(f"  ⚠️  Muy pocos datos ({len(df_proveedor):,} registros), saltando...")
+            if registros < 100:  # Muy pocos datos
+                print(f"  ⚠️  Muy pocos datos ({registros:,} registros), saltando...")
                 continue
             
-            # Latencia diaria
-            latencia_diaria = df_proveedor['latency_ms'].resample('D').agg(['mean', 'std', 'count'])
+            if not self.agregados:
+                # Latencia y disponibilidad diarias
+                latencia_diaria = df_proveedor.resample('D', on='timestamp')['latency_ms'].agg(['mean', 'std', 'count'])
+                disponibilidad_diaria = df_proveedor.resample('D', on='timestamp')['latencia_aceptable'].mean()
             
             if len(latencia_diaria) < 3:  # Necesitamos al menos 3 días
                 print(f"  ⚠️  Menos de 3 días de datos, saltando...")
@@ -617,9 +927,6 @@ class AnalizadorLatenciaMultiProveedor:
             
             latencia_diaria['rolling_3d'] = latencia_diaria['mean'].rolling(window=3).mean()
             
-            # Disponibilidad diaria
-            disponibilidad_diaria = df_proveedor['latencia_aceptable'].resample('D').mean()
-            
             # Calcular tendencia (pendiente de regresión lineal)
             x = np.arange(len(latencia_diaria))
             y = latencia_diaria['mean'].values
@@ -661,16 +968,79 @@ class AnalizadorLatenciaMultiProveedor:
                 print(f"  ✅ Disponibilidad: {disponibilidad_diaria.mean():.2%}")
                 print(f"  📐 R²: {r_value**2:.3f}")
         
-        # Resetear índice
-        self.df_completo = df_temp.reset_index()
-        
         self.metricas_cache['tendencias'] = tendencias
         return tendencias
     
+    def _tabla_horaria(self, regiones):
+        """media, aceptable (alguna medición aceptable) y registros por región × proveedor × hora"""
+        if self.agregados:
+            horario = self.agregados['horario'].tabla()
+            return pd.DataFrame({'media': horario['media'],
+                                 'aceptable': horario['disponibilidad'] > 0,
+                                 'registros': horario['registros']})
+        # Por región sobre su subconjunto: un groupby de tres claves del frame entero pesa más que el frame
+        posiciones = self._posiciones('region')
+        tablas = {}
+        for region in regiones:
+            datos = self._subconjunto(posiciones.get(region, []),
+                                      ['proveedor_real', 'hora_completa', 'latency_ms', 'latencia_aceptable'])
+            tablas[region] = datos.groupby(['proveedor_real', 'hora_completa'], observed=True).agg(
+                media=('latency_ms', 'mean'),
+                aceptable=('latencia_aceptable', 'any'),
+                registros=('latency_ms', 'size'))
+        tabla = pd.concat(tablas, names=['region'])
+        tabla.index = tabla.index.set_levels(tabla.index.levels[1].astype(object), level='proveedor_real')
+        return tabla
+
+    def _motor_multiservidor(self, regiones_comunes):
+        """
+        Pivote (región, hora) × proveedor construido una vez; por hora, reducciones sobre los
+        proveedores incluidos (>10 registros en la región): todos aceptables, mejor y media
+        latencia. Solo cuentan las horas con datos de todos ellos (horas comunes)
+        """
+        tabla = self._tabla_horaria([r['region'] for r in regiones_comunes])
+        reales = pd.MultiIndex.from_tuples([(r['region'], p) for r in regiones_comunes for p in r['proveedores']],
+                                           names=['region', 'proveedor_real'])
+        registros = tabla['registros'].groupby(level=['region', 'proveedor_real']).sum()
+        incluidos = registros.index[(registros > 10).to_numpy() & registros.index.isin(reales)]
+        tabla = tabla[tabla.index.droplevel('hora_completa').isin(incluidos)]
+        if tabla.empty:
+            return {'horas_comunes': {}, 'por_region': pd.DataFrame()}
+
+        latencia = tabla['media'].unstack('proveedor_real')
+        aceptable = tabla['aceptable'].unstack('proveedor_real')
+        presente = latencia.index.get_level_values('region')
+        incluido = (pd.Series(True, index=incluidos).unstack('proveedor_real')
+                    .reindex(index=presente, columns=latencia.columns).fillna(False).to_numpy(dtype=bool))
+        hay_dato = tabla['registros'].unstack('proveedor_real').notna().to_numpy()
+
+        n_incluidos = incluido.sum(axis=1)
+        comun = (hay_dato == incluido).all(axis=1)
+        multi = comun & (n_incluidos > 1)
+        L = latencia.to_numpy(dtype='float64')
+        horas = pd.DataFrame({
+            'region': presente,
+            'disponibilidad': (aceptable.fillna(True).to_numpy(dtype=bool) | ~incluido).all(axis=1),
+            'latencia_minima': np.where(incluido, L, np.inf).min(axis=1),
+            'latencia_media': np.where(incluido, L, 0.0).sum(axis=1) / np.maximum(n_incluidos, 1),
+        })
+        por_region = horas[multi].groupby('region', sort=False).agg(
+            horas=('disponibilidad', 'size'),
+            disponibilidad=('disponibilidad', 'mean'),
+            latencia_minima=('latencia_minima', 'mean'),
+            latencia_media=('latencia_media', 'mean'))
+        return {'horas_comunes': pd.Series(comun).groupby(presente).sum().to_dict(),
+                'por_region': por_region}
+
     def analizar_rentabilidad_multiservidor(self):
         """
         Analiza la rentabilidad de implementar multiservidor vs monoservidor
+        (la etapa se restaura de la caché en disco si la carga y umbral_latencia no cambiaron)
         """
+        return self._etapa_con_cache('rentabilidad', ['rentabilidad'], self._analizar_rentabilidad_multiservidor)
+    
+    def _analizar_rentabilidad_multiservidor(self):
+        """Cálculo de analizar_rentabilidad_multiservidor (sin caché)"""
         print("\n" + "="*80)
         print("💰 ANÁLISIS DE RENTABILIDAD: MULTISERVIDOR vs MONOSERVIDOR")
         print("="*80)
@@ -679,7 +1049,7 @@ class AnalizadorLatenciaMultiProveedor:
         
         # Identificar regiones con múltiples proveedores
         regiones_comunes = []
-        region_proveedores = self.df_completo.groupby('region')['proveedor_real'].unique()
+        region_proveedores = self._proveedores_por_region()
         
         for region, proveedores in region_proveedores.items():
             if len(proveedores) > 1:
@@ -697,7 +1067,10 @@ class AnalizadorLatenciaMultiProveedor:
             print("⚠️  No se encontraron regiones con múltiples proveedores para análisis")
             return {}
         
-        for i, region_info in enumerate(regiones_comunes[:15]):  # Limitar a 15 regiones
+        # Pivote hora × región × proveedor construido una vez: todas las horas y regiones
+        motor = self._motor_multiservidor(regiones_comunes)
+        
+        for region_info in regiones_comunes:
             region = region_info['region']
             proveedores = region_info['proveedores']
             
@@ -706,62 +1079,14 @@ class AnalizadorLatenciaMultiProveedor:
             print(f"🏢 Proveedores disponibles: {', '.join(proveedores)}")
             print(f"{'='*60}")
             
-            # Recopilar datos por proveedor
-            datos_proveedores = {}
-            timestamps_comunes = None
-            
-            for proveedor in proveedores:
-                datos = self.df_completo[
-                    (self.df_completo['region'] == region) & 
-                    (self.df_completo['proveedor_real'] == proveedor)
-                ]
-                
-                if not datos.empty and len(datos) > 10:  # Al menos 10 registros
-                    # Agrupar por hora para análisis de disponibilidad simultánea
-                    datos_hora = datos.groupby('hora_completa').agg({
-                        'latency_ms': 'mean',
-                        'latencia_aceptable': 'any'
-                    })
-                    
-                    datos_proveedores[proveedor] = datos_hora
-                    
-                    # Encontrar timestamps comunes
-                    if timestamps_comunes is None:
-                        timestamps_comunes = set(datos_hora.index)
-                    else:
-                        timestamps_comunes = timestamps_comunes.intersection(set(datos_hora.index))
-            
-            # Solo continuar si hay timestamps comunes suficientes
-            if timestamps_comunes and len(timestamps_comunes) > 10:
-                # Calcular métricas de multiservidor
-                disponibilidad_simultanea = []
-                latencia_minima_por_hora = []
-                latencia_media_por_hora = []
-                
-                # Usar una muestra de timestamps para no sobrecargar
-                timestamps_muestra = list(timestamps_comunes)
-                if len(timestamps_muestra) > 100:
-                    timestamps_muestra = np.random.choice(timestamps_muestra, 100, replace=False)
-                
-                for timestamp in timestamps_muestra:
-                    latencias = []
-                    disponible = True
-                    
-                    for proveedor, datos in datos_proveedores.items():
-                        if timestamp in datos.index:
-                            latencias.append(datos.loc[timestamp, 'latency_ms'])
-                            if not datos.loc[timestamp, 'latencia_aceptable']:
-                                disponible = False
-                    
-                    if latencias and len(latencias) > 1:  # Solo si hay datos de múltiples proveedores
-                        disponibilidad_simultanea.append(disponible)
-                        latencia_minima_por_hora.append(min(latencias))
-                        latencia_media_por_hora.append(np.mean(latencias))
-                
-                if disponibilidad_simultanea and latencia_minima_por_hora:
-                    disponibilidad_simultanea_pct = np.mean(disponibilidad_simultanea)
-                    latencia_media_agregada = np.mean(latencia_media_por_hora)
-                    latencia_minima_agregada = np.mean(latencia_minima_por_hora)
+            # Solo continuar si hay horas comunes suficientes
+            if motor['horas_comunes'].get(region, 0) > 10:
+                if region in motor['por_region'].index:  # horas con datos de múltiples proveedores
+                    fila = motor['por_region'].loc[region]
+                    disponibilidad_simultanea_pct = float(fila['disponibilidad'])
+                    latencia_media_agregada = float(fila['latencia_media'])
+                    latencia_minima_agregada = float(fila['latencia_minima'])
+                    muestras = int(fila['horas'])
                     
                     mejora_potencial = ((latencia_media_agregada - latencia_minima_agregada) / 
                                       latencia_media_agregada * 100) if latencia_media_agregada > 0 else 0
@@ -811,7 +1136,7 @@ class AnalizadorLatenciaMultiProveedor:
                         'costo_multiservidor': costo_multi,
                         'costo_adicional': costo_adicional,
                         'roi_estimado': roi,
-                        'muestras_analizadas': len(disponibilidad_simultanea)
+                        'muestras_analizadas': muestras
                     }
                     
                     print(f"\n💰 ANÁLISIS DE RENTABILIDAD:")
@@ -821,7 +1146,7 @@ class AnalizadorLatenciaMultiProveedor:
                     print(f"  • 📈 Mejora potencial de latencia: {mejora_potencial:.1f}%")
                     print(f"  • 💰 Costo adicional multiservidor: {costo_adicional:.0f} unidades")
                     print(f"  • 📊 ROI estimado: {roi:.0f}%")
-                    print(f"  • 🔢 Muestras analizadas: {len(disponibilidad_simultanea):,}")
+                    print(f"  • 🔢 Horas analizadas: {muestras:,}")
             else:
                 print(f"  ⚠️  No hay suficientes datos coincidentes para análisis")
         
@@ -901,9 +1226,7 @@ class AnalizadorLatenciaMultiProveedor:
             }
             
             # Agregar métricas generales
-            disponibilidad_global = self.df_completo['latencia_aceptable'].mean()
-            latencia_global_media = self.df_completo['latency_ms'].mean()
-            latencia_global_p95 = np.percentile(self.df_completo['latency_ms'].dropna().values, 95)
+            disponibilidad_global, latencia_global_media, latencia_global_p95 = self._metricas_globales()
             
             resumen["metricas_globales"] = {
                 "disponibilidad": float(disponibilidad_global),
@@ -944,7 +1267,7 @@ class AnalizadorLatenciaMultiProveedor:
             
             # Guardar como JSON
             with open(os.path.join(directorio, 'reporte_ejecutivo.json'), 'w', encoding='utf-8') as f:
-                json.dump(resumen, f, indent=2, ensure_ascii=False, default=str)
+                json.dump(resumen, f, indent=2, ensure_ascii=False, default=self._a_json)
             
             # Crear versión texto
             with open(os.path.join(directorio, 'resumen_ejecutivo.txt'), 'w', encoding='utf-8') as f:
@@ -1090,7 +1413,7 @@ class AnalizadorLatenciaMultiProveedor:
             df_proveedores_reales = self.df_completo[~self.df_completo['proveedor_real'].isin(['multi', 'desconocido'])]
             
             if len(df_proveedores_reales) > 0:
-                proveedores_orden = df_proveedores_reales.groupby('proveedor_real')['latency_ms'].median().sort_values().index
+                proveedores_orden = df_proveedores_reales.groupby('proveedor_real', observed=True)['latency_ms'].median().sort_values().index
                 
                 sns.boxplot(data=df_proveedores_reales, x='proveedor_real', y='latency_ms', 
                            order=proveedores_orden, ax=axes[0,0])
@@ -1102,7 +1425,7 @@ class AnalizadorLatenciaMultiProveedor:
                 axes[0,0].tick_params(axis='x', rotation=45)
             
             # Disponibilidad por proveedor
-            disponibilidad = df_proveedores_reales.groupby('proveedor_real')['latencia_aceptable'].mean().sort_values(ascending=False)
+            disponibilidad = df_proveedores_reales.groupby('proveedor_real', observed=True)['latencia_aceptable'].mean().sort_values(ascending=False)
             
             axes[0,1].bar(disponibilidad.index, disponibilidad.values * 100)
             axes[0,1].set_title('Disponibilidad por Proveedor')
@@ -1193,8 +1516,10 @@ class AnalizadorLatenciaMultiProveedor:
             # Guardar métricas en JSON
             with open(os.path.join(directorio, 'metricas_completas.json'), 'w', 
                      encoding='utf-8') as f:
-                json.dump(self.metricas_cache, f, indent=2, 
-                         ensure_ascii=False, default=str)
+                # Las tablas del motor de métricas ya están resumidas en 'generales'
+                metricas = {k: v for k, v in self.metricas_cache.items() if k != 'tablas'}
+                json.dump(metricas, f, indent=2, 
+                         ensure_ascii=False, default=self._a_json)
             
             print("✅ Datos procesados guardados")
             
@@ -1209,9 +1534,7 @@ class AnalizadorLatenciaMultiProveedor:
         print("="*80)
         
         # Métricas globales
-        disponibilidad_global = self.df_completo['latencia_aceptable'].mean()
-        latencia_media = self.df_completo['latency_ms'].mean()
-        latencia_p95 = np.percentile(self.df_completo['latency_ms'].dropna().values, 95)
+        disponibilidad_global, latencia_media, latencia_p95 = self._metricas_globales()
         
         print(f"\n📊 MÉTRICAS GLOBALES:")
         print(f"   • ✅ Disponibilidad: {disponibilidad_global:.2%}")
@@ -1295,13 +1618,18 @@ def main():
     UMBRAL_LATENCIA = 100  # ms
     UMBRAL_DISPONIBILIDAD = 0.95  # 95%
     
+    # Caché de etapas (ANALIZADOR_CACHE; vacío → desactivada)
+    DIRECTORIO_CACHE = (os.path.join(RUTA_DATOS, cache_analisis.DIRECTORIO_CACHE)
+                        if cache_analisis.DIRECTORIO_CACHE else None)
+    
     try:
         # 1. Inicializar analizador
         print("\n🔧 INICIALIZANDO ANALIZADOR...")
         analizador = AnalizadorLatenciaMultiProveedor(
             ruta_datos=RUTA_DATOS,
             umbral_latencia=UMBRAL_LATENCIA,
-            umbral_disponibilidad=UMBRAL_DISPONIBILIDAD
+            umbral_disponibilidad=UMBRAL_DISPONIBILIDAD,
+            directorio_cache=DIRECTORIO_CACHE
         )
         
         # 2. Cargar y procesar datos
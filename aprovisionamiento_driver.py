@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+APROVISIONAMIENTO DE CHROMEDRIVER / CHROME
+- Resuelve UNA vez las rutas con Selenium Manager y las fija en .driver_cache.json
+- setup_driver() construye el Service desde la caché → sin Selenium Manager ni red por captura
+- La caché se invalida sola si Chrome o chromedriver cambian en disco (actualizaciones)
+- CHROMEDRIVER_PATH / CHROME_BINARY se aplican por separado encima de la caché; un
+  CHROME_BINARY distinto del cacheado (sin driver fijado) re-resuelve el chromedriver
+- Uso: python aprovisionamiento_driver.py [--forzar]
+"""
+import json
+import logging
+import os
+import sys
+
+from selenium.webdriver.chrome.service import Service
+
+# ===================== CONFIG =====================
+ARCHIVO_CACHE = os.environ.get(
+    'DRIVER_CACHE', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.driver_cache.json'))
+# Rutas fijadas a mano (tienen prioridad sobre la caché)
+CHROMEDRIVER_PATH = os.environ.get('CHROMEDRIVER_PATH')
+CHROME_BINARY = os.environ.get('CHROME_BINARY')
+
+logger = logging.getLogger(__name__)
+
+_rutas_proceso = None
+
+
+def _firma(path):
+    st = os.stat(path)
+    return [st.st_size, int(st.st_mtime)]
+
+
+def _cache_valida(cache):
+    try:
+        return (_firma(cache['driver_path']) == cache['driver_firma'] and
+                _firma(cache['browser_path']) == cache['browser_firma'])
+    except (KeyError, OSError, TypeError):
+        return False
+
+
+def _con_fijadas(rutas):
+    """Las rutas fijadas por entorno pisan las resueltas (caché o Selenium Manager)"""
+    return {'driver_path': CHROMEDRIVER_PATH or rutas['driver_path'],
+            'browser_path': CHROME_BINARY or rutas['browser_path']}
+
+
+def _driver_sirve(cache):
+    """El chromedriver cacheado se resolvió para otro Chrome si CHROME_BINARY no coincide"""
+    return bool(CHROMEDRIVER_PATH) or not CHROME_BINARY or cache.get('browser_path') == CHROME_BINARY
+
+
+def _selenium_manager(offline):
+    from selenium.webdriver.common.selenium_manager import SeleniumManager
+    args = ['--browser', 'chrome']
+    if CHROME_BINARY:
+        args += ['--browser-path', CHROME_BINARY]
+    if offline:
+        args.append('--offline')
+    salida = SeleniumManager().binary_paths(args)
+    # En modo offline puede terminar con código 0 y rutas vacías
+    for clave in ('driver_path', 'browser_path'):
+        if not os.path.isfile(salida.get(clave) or ''):
+            raise FileNotFoundError(f"Selenium Manager no devolvió {clave}: {salida.get('message')}")
+    return salida
+
+
+def resolver_rutas(forzar=False):
+    """
+    Devuelve {'driver_path', 'browser_path'}. Prueba, por orden: rutas fijadas
+    por entorno, caché válida, Selenium Manager offline y, solo si todo falla,
+    Selenium Manager con red. El resultado queda cacheado en disco.
+    """
+    if CHROMEDRIVER_PATH and CHROME_BINARY:
+        return {'driver_path': CHROMEDRIVER_PATH, 'browser_path': CHROME_BINARY}
+
+    if not forzar and os.path.exists(ARCHIVO_CACHE):
+        try:
+            with open(ARCHIVO_CACHE, encoding='utf-8') as f:
+                cache = json.load(f)
+            if not _driver_sirve(cache):
+                logger.info("CHROME_BINARY distinto del cacheado → re-resolviendo su chromedriver")
+            elif _cache_valida(cache):
+                return _con_fijadas(cache)
+            else:
+                logger.info("Caché de driver obsoleta (Chrome/chromedriver cambiaron) → re-resolviendo")
+        except (OSError, ValueError):
+            pass
+
+    try:
+        salida = _selenium_manager(offline=True)
+    except Exception as e:
+        logger.warning(f"Selenium Manager offline falló ({e}) → resolviendo con red")
+        salida = _selenium_manager(offline=False)
+
+    rutas = _con_fijadas(salida)
+    cache = dict(rutas,
+                 driver_firma=_firma(rutas['driver_path']),
+                 browser_firma=_firma(rutas['browser_path']))
+    tmp = ARCHIVO_CACHE + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp, ARCHIVO_CACHE)
+    logger.info(f"Driver fijado: {rutas['driver_path']} | Chrome: {rutas['browser_path']}")
+    return rutas
+
+
+def crear_servicio(chrome_options):
+    """Service listo para webdriver.Chrome(); fija también binary_location en las opciones"""
+    global _rutas_proceso
+    if _rutas_proceso is None:
+        _rutas_proceso = resolver_rutas()
+    if not chrome_options.binary_location:
+        chrome_options.binary_location = _rutas_proceso['browser_path']
+    return Service(executable_path=_rutas_proceso['driver_path'])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
+    rutas = resolver_rutas(forzar='--forzar' in sys.argv)
+    print(f"chromedriver: {rutas['driver_path']}")
+    print(f"chrome:       {rutas['browser_path']}")
+    print(f"caché:        {ARCHIVO_CACHE}")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MICRO-BENCHMARK DE ARRANQUE DEL DRIVER
+Compara, por captura:
+  A) webdriver.Chrome(options=...)                → Selenium Manager en cada construcción
+  B) webdriver.Chrome(service=cacheado, options=...) → rutas de aprovisionamiento_driver
+Uso: python benchmark_arranque_driver.py [repeticiones] [--solo-resolucion]
+     --solo-resolucion mide solo la resolución de rutas (sin abrir Chrome)
+"""
+import statistics
+import sys
+import time
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.driver_finder import DriverFinder
+
+import aprovisionamiento_driver
+
+
+def opciones():
+    chrome_options = Options()
+    chrome_options.add_argument('--headless=new')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--disable-gpu')
+    return chrome_options
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+def resolucion_selenium_manager():
+    DriverFinder(Service(), opciones()).get_driver_path()
+
+
+def resolucion_cacheada():
+    aprovisionamiento_driver._rutas_proceso = None   # cada captura es un proceso nuevo
+    aprovisionamiento_driver.crear_servicio(opciones())
+
+
+def arranque_selenium_manager():
+    webdriver.Chrome(options=opciones()).quit()
+
+
+def arranque_cacheado():
+    aprovisionamiento_driver._rutas_proceso = None
+    chrome_options = opciones()
+    webdriver.Chrome(service=aprovisionamiento_driver.crear_servicio(chrome_options),
+                     options=chrome_options).quit()
+
+
+def resumen(nombre, tiempos):
+    print(f"{nombre:32s} mediana {statistics.median(tiempos)*1000:8.1f} ms | "
+          f"min {min(tiempos)*1000:8.1f} ms | max {max(tiempos)*1000:8.1f} ms")
+    return statistics.median(tiempos)
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    repeticiones = int(args[0]) if args else 5
+    solo_resolucion = '--solo-resolucion' in sys.argv
+
+    aprovisionamiento_driver.resolver_rutas()   # calienta la caché (paso de aprovisionamiento)
+
+    print(f"{'='*70}")
+    print(f"BENCHMARK ARRANQUE DRIVER ({repeticiones} repeticiones)")
+    print(f"{'='*70}")
+    a = resumen("Resolución Selenium Manager", medir(resolucion_selenium_manager, repeticiones))
+    b = resumen("Resolución caché", medir(resolucion_cacheada, repeticiones))
+    print(f"→ Ahorro por captura (resolución): {(a - b)*1000:.1f} ms")
+
+    if not solo_resolucion:
+        a = resumen("Arranque Selenium Manager", medir(arranque_selenium_manager, repeticiones))
+        b = resumen("Arranque caché", medir(arranque_cacheado, repeticiones))
+        print(f"→ Ahorro por captura (arranque completo): {(a - b)*1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
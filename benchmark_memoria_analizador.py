@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PRUEBA DE REGRESIÓN DE MEMORIA PICO DEL ANALIZADOR
+- Genera un conjunto sintético de CSV v2 (LoteCaptura) en un directorio temporal, con
+  regiones compartidas entre proveedores para que comparación y rentabilidad trabajen
+- Mide con tracemalloc el pico de cada etapa por encima de lo que ya estaba asignado
+  al empezarla, en múltiplos del tamaño del frame unificado (df_completo)
+- Si una etapa supera su límite (LIMITES_PICO) → sale con código 1: una copia del frame
+  completo que vuelva a colarse en carga/tendencias/comparación se ve aquí
+Uso: python benchmark_memoria_analizador.py [capturas_por_archivo] [--conservar]
+     --conservar deja el directorio temporal para inspeccionarlo
+"""
+import contextlib
+import datetime
+import io
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import analizador
+from csv_capturas import LoteCaptura
+
+# ===================== CONFIG =====================
+CAPTURAS_POR_ARCHIVO = 400
+INTERVALO_CAPTURAS = datetime.timedelta(minutes=20)
+ARCHIVOS_SINTETICOS = {
+    'aws_cloudpingnet_latency_longterm.csv': 'aws',
+    'azure_cloudpingnet_latency_longterm.csv': 'azure',
+    'gcp_cloudpingnet_latency_longterm.csv': 'gcp',
+    'huawei_cloudping_latency_longterm.csv': 'huawei',
+}
+REGIONES = ['East US', 'West Europe', 'Southeast Asia', 'Brazil South', 'Japan East', 'Australia East',
+            'Central India', 'South Africa North', 'Canada Central', 'UK South', 'France Central',
+            'Germany West Central']
+DATACENTERS_POR_REGION = 4
+# Pico extra permitido por etapa, en veces el tamaño de df_completo. Incluye los índices
+# internos de groupby (~0.8× con este frame); una copia completa del frame suma 1× más
+# (antes: carga 4.7×, tendencias 2.7× con concat + sort y set_index/reset_index)
+LIMITES_PICO = {
+    'carga': 3.0,
+    'metricas': 2.0,
+    'comparacion': 1.0,
+    'tendencias': 1.0,
+    'rentabilidad': 1.0,
+}
+
+
+# ===================== DATOS SINTÉTICOS =====================
+def generar_datos(directorio, capturas):
+    azar = random.Random(42)
+    inicio = datetime.datetime(2025, 1, 1)
+    filas = 0
+    for archivo, proveedor in ARCHIVOS_SINTETICOS.items():
+        base = {(r, d): azar.uniform(20, 250) for r in REGIONES for d in range(DATACENTERS_POR_REGION)}
+        for i in range(capturas):
+            ts = inicio + i * INTERVALO_CAPTURAS
+            with LoteCaptura(f"{directorio}/{archivo}",
+                             ['timestamp', 'provider', 'region', 'datacenter', 'latency_ms']) as w:
+                for (region, dc), media in base.items():
+                    latencia = 'Failed' if azar.random() < 0.01 else round(azar.gauss(media, media * 0.1), 1)
+                    w.writerow([ts, proveedor, region, f"{proveedor}-dc{dc}", latencia])
+                    filas += 1
+    return filas
+
+
+# ===================== MEDICIÓN =====================
+def medir_etapas(directorio):
+    analizador.PROCESOS_CARGA = 1   # tracemalloc solo ve este proceso
+    a = analizador.AnalizadorLatenciaMultiProveedor(directorio)
+    with contextlib.redirect_stdout(io.StringIO()):
+        a.cargar_y_unificar_datos()   # primera pasada: compacta el catálogo de ingesta
+    a.df_completo = None
+    a.metricas_cache = {}
+
+    etapas = [('carga', a.cargar_y_unificar_datos),
+              ('metricas', a.calcular_metricas_generales),
+              ('comparacion', a.analizar_comparacion_proveedores),
+              ('tendencias', a.analizar_tendencias_temporales),
+              ('rentabilidad', a.analizar_rentabilidad_multiservidor)]
+    resultados = []
+    tracemalloc.start()
+    try:
+        for nombre, etapa in etapas:
+            base, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            inicio = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                etapa()
+            _, pico = tracemalloc.get_traced_memory()
+            resultados.append((nombre, pico - base, time.perf_counter() - inicio))
+    finally:
+        tracemalloc.stop()
+    return a.df_completo, resultados
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    capturas = int(args[0]) if args else CAPTURAS_POR_ARCHIVO
+    directorio = tempfile.mkdtemp(prefix='bench_memoria_')
+    try:
+        filas = generar_datos(directorio, capturas)
+        df, resultados = medir_etapas(directorio)
+        tamano = df.memory_usage(deep=True).sum()
+
+        print(f"{'='*70}")
+        print(f"MEMORIA PICO POR ETAPA ({filas:,} filas sintéticas, frame {tamano / 2**20:.1f} MiB)")
+        print(f"{'='*70}")
+        fallos = []
+        for nombre, pico, segundos in resultados:
+            veces = pico / tamano
+            ok = veces <= LIMITES_PICO[nombre]
+            if not ok:
+                fallos.append(nombre)
+            print(f"{'✅' if ok else '❌'} {nombre:14s} pico {pico / 2**20:8.1f} MiB | {veces:5.2f}× frame "
+                  f"(límite {LIMITES_PICO[nombre]:.1f}×) | {segundos:6.2f} s")
+        if fallos:
+            print(f"❌ Regresión de memoria en: {', '.join(fallos)}")
+            sys.exit(1)
+        print("✅ Todas las etapas dentro de su límite")
+    finally:
+        if '--conservar' in sys.argv:
+            print(f"📁 Datos sintéticos en {directorio}")
+        else:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
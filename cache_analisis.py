@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CACHÉ EN DISCO DE LAS ETAPAS DEL ANALIZADOR
+- Cada etapa (carga, métricas, comparación, tendencias, rentabilidad) se guarda en
+  <directorio>/<etapa>-<clave>.pkl: resultado, estado que deja en el analizador y su
+  salida por pantalla (al restaurarla se repite tal cual)
+- clave = sha1 de VERSION_CACHE + huella de los CSV de entrada (nombre, tamaño, mtime_ns)
+  + los parámetros de los que depende la etapa → si nada cambió, se restaura al instante
+- Dependencias de los umbrales: el frame limpio no depende de umbral_latencia
+  (latencia_aceptable se recalcula al restaurarlo; con muestreo sí, los agregados cuentan
+  aceptables), las etapas de análisis sí; umbral_disponibilidad no entra en ninguna clave
+  (solo lo usan reportes y gráficos, que no se cachean)
+- Escritura atómica (tmp + os.replace); una entrada ilegible cuenta como ausente. Se
+  conservan las MAX_ENTRADAS_ETAPA más recientes de cada etapa
+- ANALIZADOR_CACHE=directorio (vacío → sin caché); relativo → dentro de la ruta de datos
+- Uso: python cache_analisis.py [directorio] [--limpiar]
+"""
+import contextlib
+import glob
+import hashlib
+import io
+import json
+import os
+import pickle
+import sys
+
+# ===================== CONFIG =====================
+DIRECTORIO_CACHE = os.environ.get('ANALIZADOR_CACHE', '.cache_analisis')
+MAX_ENTRADAS_ETAPA = int(os.environ.get('ANALIZADOR_CACHE_ENTRADAS', 8))
+VERSION_CACHE = 2   # subir si cambia el cálculo de alguna etapa → invalida lo guardado
+
+
+# ===================== CLAVES =====================
+def huella_archivos(rutas):
+    """[(nombre, tamaño, mtime_ns)] de los archivos que existen: cambia si se les añade o reescribe algo"""
+    huella = []
+    for ruta in rutas:
+        try:
+            st = os.stat(ruta)
+        except OSError:
+            continue
+        huella.append([os.path.basename(ruta), st.st_size, st.st_mtime_ns])
+    return huella
+
+
+def clave_etapa(*partes):
+    texto = json.dumps([VERSION_CACHE, *partes], sort_keys=True, default=str)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()[:16]
+
+
+# ===================== LECTURA / ESCRITURA =====================
+def _ruta(directorio, etapa, clave):
+    return os.path.join(directorio, f"{etapa}-{clave}.pkl")
+
+
+def leer(directorio, etapa, clave):
+    """Contenido guardado de la etapa con esa clave, o None"""
+    ruta = _ruta(directorio, etapa, clave)
+    if not os.path.exists(ruta):
+        return None
+    try:
+        with open(ruta, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        print(f"  ⚠️  Caché ilegible ({os.path.basename(ruta)}): {e} → se recalcula")
+        return None
+
+
+def guardar(directorio, etapa, clave, contenido):
+    os.makedirs(directorio, exist_ok=True)
+    ruta = _ruta(directorio, etapa, clave)
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'wb') as f:
+            pickle.dump(contenido, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, ruta)
+    except Exception as e:
+        print(f"  ⚠️  No se pudo guardar la caché de {etapa}: {e}")
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        return
+    _podar(directorio, etapa)
+
+
+def _podar(directorio, etapa):
+    """Deja solo las MAX_ENTRADAS_ETAPA entradas más recientes de la etapa"""
+    entradas = sorted(glob.glob(os.path.join(directorio, f"{etapa}-*.pkl")), key=os.path.getmtime, reverse=True)
+    for ruta in entradas[MAX_ENTRADAS_ETAPA:]:
+        with contextlib.suppress(OSError):
+            os.remove(ruta)
+
+
+# ===================== SALIDA =====================
+class _Duplicador(io.StringIO):
+    """Escribe en la salida real y se queda una copia"""
+
+    def __init__(self, destino):
+        super().__init__()
+        self.destino = destino
+
+    def write(self, texto):
+        self.destino.write(texto)
+        return super().write(texto)
+
+    def flush(self):
+        self.destino.flush()
+
+
+@contextlib.contextmanager
+def capturar_salida():
+    """La salida se sigue viendo en vivo; getvalue() la devuelve para guardarla con la etapa"""
+    copia = _Duplicador(sys.stdout)
+    with contextlib.redirect_stdout(copia):
+        yield copia
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    directorio = args[0] if args else DIRECTORIO_CACHE
+    entradas = sorted(glob.glob(os.path.join(directorio, '*.pkl')))
+    total = sum(os.path.getsize(r) for r in entradas)
+    print(f"📦 {directorio}: {len(entradas)} entradas, {total / 2**20:.1f} MiB")
+    for ruta in entradas:
+        print(f"   {os.path.basename(ruta)} ({os.path.getsize(ruta) / 2**20:.1f} MiB)")
+    if '--limpiar' in sys.argv:
+        for ruta in entradas:
+            os.remove(ruta)
+        print("🧹 Caché vaciada")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,7 +14,6 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
-import csv
 import datetime
 import time
 import os
@@ -25,6 +24,16 @@ import re
 import signal
 import sys
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from almacen_artefactos import AlmacenArtefactos
+from vigilante_memoria import VigilanteMemoria
+from aprovisionamiento_driver import crear_servicio
+from sonda_ruido import SondaRuido
+from limitador_sitios import LimitadorSitio
+from segmentos_nodo import ruta_salida
+from csv_capturas import LoteCaptura, nuevo_id_captura
+from esquema_latencia import a_epoch_ms
+
 # ===================== CONFIG =====================
 URL = "https://www.cloudping.cloud/aws"
 INTERVALO_MINUTOS = 10
@@ -36,7 +45,10 @@ HEADLESS = True
 DISABLE_IMAGES = True            
 DISABLE_JS_IF_POSSIBLE = False
 
-os.makedirs(SCREENSHOT_DIR, exist_ok=True)
+ALMACEN = AlmacenArtefactos(SCREENSHOT_DIR)
+VIGILANTE = VigilanteMemoria(os.path.basename(__file__))
+SONDA = SondaRuido()
+LIMITE = LimitadorSitio(URL)
 
 # Logging
 logging.basicConfig(
@@ -93,7 +105,9 @@ def setup_driver():
     chrome_options.add_argument('--disable-backgrounding-occluded-windows')
     chrome_options.add_argument('--disable-features=ImprovedCookieControls,LazyFrameLoading,GlobalMediaControls,DestroyProfileOnBrowserClose,MediaRouter')
 
-    driver = webdriver.Chrome(options=chrome_options)
+    VIGILANTE.comprobar_arranque()
+    driver = webdriver.Chrome(service=crear_servicio(chrome_options), options=chrome_options)
+    VIGILANTE.vigilar(driver)
     
     # Anti-detección extra
     driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
@@ -203,17 +217,62 @@ def get_datacenter_name(region):
     return datacenter_map.get(region.lower(), region)
 
 def guardar_screenshot(driver, nombre):
-    path = os.path.join(SCREENSHOT_DIR, f"{nombre}_{int(time.time())}.png")
-    driver.save_screenshot(path)
-    logger.info(f"📸 {path}")
+    LIMITE.revisar(driver)
+    ALMACEN.guardar(driver, nombre)
+
+# ===================== GUARDAR DATOS =====================
+def guardar_datos(driver, timestamp, id_captura=None):
+    """💾 Extrae las tablas de latencia y las añade al CSV"""
+    rows_found = 0
+    with LoteCaptura(ruta_salida(OUTPUT_CSV), ['timestamp', 'provider', 'region', 'datacenter', 'latency_ms'], id_captura=id_captura) as writer:
+        tables = driver.find_elements(By.TAG_NAME, "table")
+        logger.info(f"📊 {len(tables)} tablas")
+        for table_idx, table in enumerate(tables):
+            rows = table.find_elements(By.TAG_NAME, "tr")
+            for i, row in enumerate(rows[1:], 1):  # Skip header
+                try:
+                    cells = row.find_elements(By.XPATH, ".//td | .//th")
+                    if len(cells) >= 2:
+                        region_text = cells[0].text.strip()
+                        latency_cell = cells[1]
+                        latency_text = latency_cell.text.strip()
+                        # Dig spans/data-*
+                        if not any(c.isdigit() for c in latency_text):
+                            spans = latency_cell.find_elements(By.TAG_NAME, "span")
+                            for span in spans:
+                                st = span.text.strip()
+                                if any(c.isdigit() for c in st):
+                                    latency_text = st
+                                    break
+                        if not any(c.isdigit() for c in latency_text):
+                            data_val = latency_cell.get_attribute('data-value') or latency_cell.get_attribute('data-latency')
+                            if data_val and any(c.isdigit() for c in data_val):
+                                latency_text = data_val
+                        # Filtro regiones válidas
+                        if (region_text and region_text not in ['Region', ''] and
+                            any(keyword in region_text.lower() for keyword in ['us-', 'eu-', 'ap-', 'ca-', 'me-', 'af-', 'sa-'])):
+                            region_code = extract_region_code(region_text)
+                            datacenter_name = get_datacenter_name(region_code) or region_text
+                            latency_clean = extract_latency_value(latency_text)
+                            if latency_clean:
+                                writer.writerow([timestamp, 'cloudping AWS', region_code or region_text, datacenter_name, latency_clean])
+                                logger.info(f"✓ {datacenter_name}: {latency_clean}ms")
+                                rows_found += 1
+                except Exception as e:
+                    logger.debug(f"Error fila {i} tabla {table_idx}: {e}")
+                    continue
+    return rows_found
 
 # ===================== CAPTURA UNA VEZ (TU LÓGICA ORIGINAL) =====================
 def capturar_datos_una_vez():
     driver = None
+    captura = {'capture_id': nuevo_id_captura()}  # clave para unir los metadatos con las filas
     try:
         driver = setup_driver()
         wait = WebDriverWait(driver, 20)
         logger.info("🚀 Iniciando captura AWS...")
+        LIMITE.tomar()
+        SONDA.antes()
         driver.get(URL)
         time.sleep(3)
 
@@ -236,49 +295,10 @@ def capturar_datos_una_vez():
             raise Exception("Falló carga datos")
 
         # 💾 EXTRAER Y GUARDAR (TU CÓDIGO EXACTO)
-        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        file_exists = os.path.exists(OUTPUT_CSV)
-        rows_found = 0
-        with open(OUTPUT_CSV, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            if not file_exists:
-                writer.writerow(['timestamp', 'provider', 'region', 'datacenter', 'latency_ms'])
-            tables = driver.find_elements(By.TAG_NAME, "table")
-            logger.info(f"📊 {len(tables)} tablas")
-            for table_idx, table in enumerate(tables):
-                rows = table.find_elements(By.TAG_NAME, "tr")
-                for i, row in enumerate(rows[1:], 1):  # Skip header
-                    try:
-                        cells = row.find_elements(By.XPATH, ".//td | .//th")
-                        if len(cells) >= 2:
-                            region_text = cells[0].text.strip()
-                            latency_cell = cells[1]
-                            latency_text = latency_cell.text.strip()
-                            # Dig spans/data-*
-                            if not any(c.isdigit() for c in latency_text):
-                                spans = latency_cell.find_elements(By.TAG_NAME, "span")
-                                for span in spans:
-                                    st = span.text.strip()
-                                    if any(c.isdigit() for c in st):
-                                        latency_text = st
-                                        break
-                            if not any(c.isdigit() for c in latency_text):
-                                data_val = latency_cell.get_attribute('data-value') or latency_cell.get_attribute('data-latency')
-                                if data_val and any(c.isdigit() for c in data_val):
-                                    latency_text = data_val
-                            # Filtro regiones válidas
-                            if (region_text and region_text not in ['Region', ''] and
-                                any(keyword in region_text.lower() for keyword in ['us-', 'eu-', 'ap-', 'ca-', 'me-', 'af-', 'sa-'])):
-                                region_code = extract_region_code(region_text)
-                                datacenter_name = get_datacenter_name(region_code) or region_text
-                                latency_clean = extract_latency_value(latency_text)
-                                if latency_clean:
-                                    writer.writerow([timestamp, 'cloudping AWS', region_code or region_text, datacenter_name, latency_clean])
-                                    logger.info(f"✓ {datacenter_name}: {latency_clean}ms")
-                                    rows_found += 1
-                    except Exception as e:
-                        logger.debug(f"Error fila {i} tabla {table_idx}: {e}")
-                        continue
+        SONDA.despues()
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        captura['ts_ms'] = a_epoch_ms(timestamp)
+        rows_found = guardar_datos(driver, timestamp, captura['capture_id'])
         logger.info(f"🎉 ¡{rows_found} filas guardadas en {OUTPUT_CSV}!")
         return rows_found > 0
 
@@ -289,6 +309,7 @@ def capturar_datos_una_vez():
             guardar_screenshot(driver, "error_captura")
         return False
     finally:
+        VIGILANTE.terminar(**captura, **SONDA.recoger())
         if driver:
             try:
                 driver.quit()
@@ -308,7 +329,7 @@ def main():
         logger.info(f"\n🔄 --- ITERACIÓN {iteracion} ---")
         exito = False
         for intento in range(MAX_REINTENTOS):
-            if capturar_datos_una_vez():
+            if LIMITE.resultado(capturar_datos_una_vez()):
                 exito = True
                 break
             logger.warning(f"⚠️ Intento {intento+1}/{MAX_REINTENTOS} falló → 60s...")
@@ -14,7 +14,6 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.common.exceptions import TimeoutException, WebDriverException
-import csv
 import datetime
 import time
 import os
@@ -27,6 +26,16 @@ import sys
 import requests
 import gc
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from almacen_artefactos import AlmacenArtefactos
+from vigilante_memoria import VigilanteMemoria
+from aprovisionamiento_driver import crear_servicio
+from sonda_ruido import SondaRuido
+from limitador_sitios import LimitadorSitio
+from segmentos_nodo import ruta_salida
+from csv_capturas import LoteCaptura, nuevo_id_captura
+from esquema_latencia import a_epoch_ms
+
 # ===================== CONFIG =====================
 URL = "https://www.cloudping.cloud/huawei"
 INTERVALO_MINUTOS = 10
@@ -37,7 +46,10 @@ SCREENSHOT_DIR = "huawei_errores"
 HEADLESS = True
 DISABLE_IMAGES = True 
 DISABLE_JS_IF_POSSIBLE = False
-os.makedirs(SCREENSHOT_DIR, exist_ok=True)
+ALMACEN = AlmacenArtefactos(SCREENSHOT_DIR)
+VIGILANTE = VigilanteMemoria(os.path.basename(__file__))
+SONDA = SondaRuido()
+LIMITE = LimitadorSitio(URL)
 
 # Logging bonito
 logging.basicConfig(
@@ -100,7 +112,9 @@ def setup_driver():
     chrome_options.add_argument('--memory-pressure-off')
     chrome_options.add_argument('--max_old_space_size=4096')
 
-    driver = webdriver.Chrome(options=chrome_options)
+    VIGILANTE.comprobar_arranque()
+    driver = webdriver.Chrome(service=crear_servicio(chrome_options), options=chrome_options)
+    VIGILANTE.vigilar(driver)
     driver.set_page_load_timeout(60)
     
     # Anti-detección extra
@@ -116,10 +130,8 @@ def setup_driver():
     return driver
 
 def guardar_screenshot(driver, prefijo):
-    ts = int(time.time())
-    path = os.path.join(SCREENSHOT_DIR, f"{prefijo}_{ts}.png")
-    driver.save_screenshot(path)
-    logger.info(f"{path}")
+    LIMITE.revisar(driver)
+    ALMACEN.guardar(driver, prefijo)
 
 def extract_region_code(region_text):
     patterns = [r'([a-z]{2}-[a-z]+-\d+)', r'([a-z]{2}-[a-z]+\d-\d+)']
@@ -207,13 +219,13 @@ def click_and_wait(driver, wait, btn_idx, buttons, ping_name):
     logger.warning(f"Timeout datos {ping_name}")
     return 0
 
-def extraer_y_guardar(driver, timestamp):
+def nuevo_lote(id_captura=None):
+    return LoteCaptura(ruta_salida(OUTPUT_CSV), ['timestamp', 'provider', 'region', 'datacenter', 'latency_ms'], id_captura=id_captura)
+
+def extraer_y_guardar(driver, timestamp, lote=None):
     rows = 0
-    file_exists = os.path.exists(OUTPUT_CSV)
-    with open(OUTPUT_CSV, 'a', newline='', encoding='utf-8') as f:
-        w = csv.writer(f)
-        if not file_exists:
-            w.writerow(['timestamp', 'provider', 'region', 'datacenter', 'latency_ms'])
+    with lote if lote is not None else nuevo_lote() as w:
+        w.nueva_lectura()  # se releen TODAS las tablas: lo ya guardado del ping anterior se descarta
         tables = driver.find_elements(By.TAG_NAME, "table")
         for tbl in tables:
             for row in tbl.find_elements(By.TAG_NAME, "tr")[1:]:
@@ -248,6 +260,7 @@ def extraer_y_guardar(driver, timestamp):
 # ===================== CAPTURA UNA VEZ =====================
 def capturar_una_vez():
     driver = None
+    captura = {'capture_id': nuevo_id_captura()}  # clave para unir los metadatos con las filas
     try:
         if not check_website_accessibility(URL):
             logger.error("Sitio no accesible")
@@ -255,8 +268,11 @@ def capturar_una_vez():
 
         driver = setup_driver()
         wait = WebDriverWait(driver, 15)
+        LIMITE.tomar()
+        SONDA.antes()
         driver.get(URL)
-        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        captura['ts_ms'] = a_epoch_ms(timestamp)
         logger.info("Página cargada")
 
         buttons = find_http_ping_buttons(driver)
@@ -269,14 +285,16 @@ def capturar_una_vez():
                 raise Exception("No hay 2 botones")
 
         total_rows = 0
-        for idx, name in enumerate(["HTTP_Ping_1", "HTTP_Ping_2"]):
-            logger.info(f"\n--- {name} ---")
-            click_and_wait(driver, wait, idx, buttons, name)
-            rows = extraer_y_guardar(driver, timestamp)
-            total_rows += rows
-            if idx == 0:
-                time.sleep(3)  # pausa entre pings
+        with nuevo_lote(captura['capture_id']) as lote:  # los dos pings son una sola captura
+            for idx, name in enumerate(["HTTP_Ping_1", "HTTP_Ping_2"]):
+                logger.info(f"\n--- {name} ---")
+                click_and_wait(driver, wait, idx, buttons, name)
+                rows = extraer_y_guardar(driver, timestamp, lote)
+                total_rows += rows
+                if idx == 0:
+                    time.sleep(3)  # pausa entre pings
 
+        SONDA.despues()
         logger.info(f"Guardadas {total_rows} filas")
         return total_rows > 0
 
@@ -287,6 +305,7 @@ def capturar_una_vez():
             guardar_screenshot(driver, "error_captura")
         return False
     finally:
+        VIGILANTE.terminar(**captura, **SONDA.recoger())
         if driver:
             try:
                 driver.quit()
@@ -305,7 +324,7 @@ def main():
         logger.info(f"\nITERACIÓN {ciclo}")
         exito = False
         for intento in range(1, MAX_REINTENTOS + 1):
-            if capturar_una_vez():
+            if LIMITE.resultado(capturar_una_vez()):
                 exito = True
                 break
             logger.warning(f"Intento {intento}/{MAX_REINTENTOS} falló → 60s")
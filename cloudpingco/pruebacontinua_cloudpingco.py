@@ -13,7 +13,6 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, WebDriverException
-import csv
 import datetime
 import time
 import os
@@ -25,6 +24,16 @@ import signal
 import sys
 import gc
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from almacen_artefactos import AlmacenArtefactos
+from vigilante_memoria import VigilanteMemoria
+from aprovisionamiento_driver import crear_servicio
+from sonda_ruido import SondaRuido
+from limitador_sitios import LimitadorSitio
+from segmentos_nodo import ruta_salida
+from csv_capturas import LoteCaptura, nuevo_id_captura
+from esquema_latencia import a_epoch_ms
+
 # ===================== CONFIG =====================
 URL = "https://www.cloudping.co/"
 INTERVALO_MINUTOS = 10
@@ -35,7 +44,10 @@ SCREENSHOT_DIR = "cloudping_errores"
 HEADLESS = True
 DISABLE_IMAGES = True                   
 DISABLE_JS_IF_POSSIBLE = False
-os.makedirs(SCREENSHOT_DIR, exist_ok=True)
+ALMACEN = AlmacenArtefactos(SCREENSHOT_DIR)
+VIGILANTE = VigilanteMemoria(os.path.basename(__file__))
+SONDA = SondaRuido()
+LIMITE = LimitadorSitio(URL)
 
 # Logging
 logging.basicConfig(
@@ -91,7 +103,9 @@ def setup_driver():
     ua = random.choice(USER_AGENTS)
     chrome_options.add_argument(f'--user-agent={ua}')
 
-    driver = webdriver.Chrome(options=chrome_options)
+    VIGILANTE.comprobar_arranque()
+    driver = webdriver.Chrome(service=crear_servicio(chrome_options), options=chrome_options)
+    VIGILANTE.vigilar(driver)
     driver.set_page_load_timeout(180)
     
     # Anti-detección extra
@@ -107,9 +121,8 @@ def setup_driver():
     return driver
 
 def guardar_screenshot(driver, prefijo):
-    path = os.path.join(SCREENSHOT_DIR, f"{prefijo}_{int(time.time())}.png")
-    driver.save_screenshot(path)
-    logger.info(f"{path}")
+    LIMITE.revisar(driver)
+    ALMACEN.guardar(driver, prefijo)
 
 # ===================== EXTRACCIÓN =====================
 def extract_latency_value(text):
@@ -117,13 +130,9 @@ def extract_latency_value(text):
     m = re.search(r'(\d+\.?\d*)\s*ms', text)
     return m.group(1) if m else None
 
-def guardar_matriz(driver, timestamp):
+def guardar_matriz(driver, timestamp, id_captura=None):
     rows = 0
-    file_exists = os.path.exists(OUTPUT_CSV)
-    with open(OUTPUT_CSV, 'a', newline='', encoding='utf-8') as f:
-        w = csv.writer(f)
-        if not file_exists:
-            w.writerow(['timestamp', 'provider', 'from_region', 'to_region', 'latency_ms'])
+    with LoteCaptura(ruta_salida(OUTPUT_CSV), ['timestamp', 'provider', 'from_region', 'to_region', 'latency_ms'], id_captura=id_captura) as w:
 
         try:
             wait = WebDriverWait(driver, 30)
@@ -165,11 +174,14 @@ def guardar_matriz(driver, timestamp):
 # ===================== UNA CAPTURA =====================
 def capturar_una_vez():
     driver = None
+    captura = {'capture_id': nuevo_id_captura()}  # clave para unir los metadatos con las filas
     try:
         driver = setup_driver()
         wait = WebDriverWait(driver, 60)
         logger.info("Cargando cloudping.co...")
         
+        LIMITE.tomar()
+        SONDA.antes()
         for intento in range(5):
             try:
                 driver.get(URL)
@@ -184,8 +196,10 @@ def capturar_una_vez():
         table = wait.until(EC.presence_of_element_located((By.XPATH, "//table")))
         logger.info("Tabla detectada")
 
-        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        filas = guardar_matriz(driver, timestamp)
+        SONDA.despues()
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        captura['ts_ms'] = a_epoch_ms(timestamp)
+        filas = guardar_matriz(driver, timestamp, captura['capture_id'])
         
         logger.info(f"Guardadas {filas} latencias")
         return filas > 0
@@ -197,6 +211,7 @@ def capturar_una_vez():
             guardar_screenshot(driver, "error_captura")
         return False
     finally:
+        VIGILANTE.terminar(**captura, **SONDA.recoger())
         if driver:
             try:
                 driver.quit()
@@ -215,7 +230,7 @@ def main():
         logger.info(f"\nITERACIÓN {ciclo}")
         exito = False
         for intento in range(1, MAX_REINTENTOS + 1):
-            if capturar_una_vez():
+            if LIMITE.resultado(capturar_una_vez()):
                 exito = True
                 break
             logger.warning(f"Intento {intento} falló → 60s")
@@ -15,7 +15,6 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.common.exceptions import TimeoutException, StaleElementReferenceException
-import csv
 import datetime
 import time
 import os
@@ -27,6 +26,16 @@ import signal
 import sys
 import gc
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from almacen_artefactos import AlmacenArtefactos
+from vigilante_memoria import VigilanteMemoria
+from aprovisionamiento_driver import crear_servicio
+from sonda_ruido import SondaRuido
+from limitador_sitios import LimitadorSitio
+from segmentos_nodo import ruta_salida
+from csv_capturas import LoteCaptura, nuevo_id_captura
+from esquema_latencia import a_epoch_ms
+
 # ===================== CONFIG =====================
 URL = "https://cloudping.net/"
 INTERVALO_MINUTOS = 10
@@ -37,7 +46,10 @@ SCREENSHOT_DIR = "gcp_errores"
 HEADLESS = True  
 DISABLE_IMAGES = True                  
 DISABLE_JS_IF_POSSIBLE = False
-os.makedirs(SCREENSHOT_DIR, exist_ok=True)
+ALMACEN = AlmacenArtefactos(SCREENSHOT_DIR)
+VIGILANTE = VigilanteMemoria(os.path.basename(__file__))
+SONDA = SondaRuido()
+LIMITE = LimitadorSitio(URL)
 
 # Logging épico
 logging.basicConfig(
@@ -90,7 +102,9 @@ def setup_driver():
     ua = random.choice(USER_AGENTS)
     chrome_options.add_argument(f'--user-agent={ua}')
 
-    driver = webdriver.Chrome(options=chrome_options)
+    VIGILANTE.comprobar_arranque()
+    driver = webdriver.Chrome(service=crear_servicio(chrome_options), options=chrome_options)
+    VIGILANTE.vigilar(driver)
     driver.set_page_load_timeout(180)
     
     driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
@@ -105,9 +119,8 @@ def setup_driver():
     return driver
 
 def guardar_screenshot(driver, prefijo):
-    path = os.path.join(SCREENSHOT_DIR, f"{prefijo}_{int(time.time())}.png")
-    driver.save_screenshot(path)
-    logger.info(f"ERROR CAPTURADO: {path}")
+    LIMITE.revisar(driver)
+    ALMACEN.guardar(driver, prefijo)
 
 # ===================== UTILIDADES =====================
 def extract_latency_value(text):
@@ -166,13 +179,9 @@ def esperar_datos(driver, wait, max_wait=300):
     return True
 
 # ===================== GUARDAR DATOS =====================
-def guardar_datos(driver, timestamp):
+def guardar_datos(driver, timestamp, id_captura=None):
     rows = 0
-    file_exists = os.path.exists(OUTPUT_CSV)
-    with open(OUTPUT_CSV, 'a', newline='', encoding='utf-8') as f:
-        w = csv.writer(f)
-        if not file_exists:
-            w.writerow(['timestamp', 'provider', 'region', 'datacenter', 'latency_ms'])
+    with LoteCaptura(ruta_salida(OUTPUT_CSV), ['timestamp', 'provider', 'region', 'datacenter', 'latency_ms'], id_captura=id_captura) as w:
         
         try:
             elements = driver.find_elements(By.XPATH, "//*[contains(text(), 'ms') or contains(text(), 'Failed')]")
@@ -208,12 +217,15 @@ def guardar_datos(driver, timestamp):
 # ===================== UNA CAPTURA =====================
 def capturar_una_vez():
     driver = None
+    captura = {'capture_id': nuevo_id_captura()}  # clave para unir los metadatos con las filas
     try:
         driver = setup_driver()
         wait = WebDriverWait(driver, 60)
         logger.info("CARGANDO CLOUDPING.NET...")
 
         # Carga con reintentos
+        LIMITE.tomar()
+        SONDA.antes()
         for _ in range(5):
             try:
                 driver.get(URL)
@@ -249,8 +261,10 @@ def capturar_una_vez():
         esperar_datos(driver, wait)
 
         # Guardar
-        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        filas = guardar_datos(driver, timestamp)
+        SONDA.despues()
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        captura['ts_ms'] = a_epoch_ms(timestamp)
+        filas = guardar_datos(driver, timestamp, captura['capture_id'])
         logger.info(f"¡{filas} REGIONES GCP GUARDADAS!")
         return filas > 0
 
@@ -261,6 +275,7 @@ def capturar_una_vez():
             guardar_screenshot(driver, "FALLO_GCP")
         return False
     finally:
+        VIGILANTE.terminar(**captura, **SONDA.recoger())
         if driver:
             try:
                 driver.quit()
@@ -277,7 +292,7 @@ def main():
         logger.info(f"\nITERACIÓN {ciclo} - {datetime.datetime.now().strftime('%H:%M')}")
         exito = False
         for intento in range(1, MAX_REINTENTOS + 1):
-            if capturar_una_vez():
+            if LIMITE.resultado(capturar_una_vez()):
                 exito = True
                 break
             logger.warning(f"Intento {intento}/{MAX_REINTENTOS} falló → 60s")
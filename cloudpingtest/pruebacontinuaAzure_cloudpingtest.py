@@ -10,7 +10,6 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-import csv
 import datetime
 import time
 import os
@@ -22,6 +21,16 @@ import signal
 import sys
 import subprocess
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from almacen_artefactos import AlmacenArtefactos
+from vigilante_memoria import VigilanteMemoria
+from aprovisionamiento_driver import crear_servicio
+from sonda_ruido import SondaRuido
+from limitador_sitios import LimitadorSitio
+from segmentos_nodo import ruta_salida
+from csv_capturas import LoteCaptura, nuevo_id_captura
+from esquema_latencia import a_epoch_ms
+
 # ===================== CONFIG =====================
 URL = "https://cloudpingtest.com/azure"
 INTERVALO_MINUTOS = 10
@@ -31,7 +40,10 @@ LOG_FILE = "azure_cloudpingtest.log"
 SCREENSHOT_DIR = "azure_errores"
 HEADLESS = True
 
-os.makedirs(SCREENSHOT_DIR, exist_ok=True)
+ALMACEN = AlmacenArtefactos(SCREENSHOT_DIR)
+VIGILANTE = VigilanteMemoria(os.path.basename(__file__))
+SONDA = SondaRuido()
+LIMITE = LimitadorSitio(URL)
 
 # Logging épico
 logging.basicConfig(
@@ -76,15 +88,16 @@ def setup_driver():
     chrome_options.add_argument('--disable-web-security')
     chrome_options.add_argument('--ignore-certificate-errors')
     chrome_options.add_argument(f'--user-agent={random.choice(USER_AGENTS)}')
-    driver = webdriver.Chrome(options=chrome_options)
+    VIGILANTE.comprobar_arranque()
+    driver = webdriver.Chrome(service=crear_servicio(chrome_options), options=chrome_options)
+    VIGILANTE.vigilar(driver)
     driver.set_page_load_timeout(120)
     driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
     return driver
 
 def guardar_screenshot(driver, prefijo):
-    path = os.path.join(SCREENSHOT_DIR, f"{prefijo}_{int(time.time())}.png")
-    driver.save_screenshot(path)
-    logger.info(f"ERROR: {path}")
+    LIMITE.revisar(driver)
+    ALMACEN.guardar(driver, prefijo)
 
 # ===================== UTILIDADES =====================
 def extract_ms(text):
@@ -168,13 +181,9 @@ def esperar_datos(driver, max_wait=300):
     return True
 
 # ===================== GUARDAR DATOS (FORMATO UNIFICADO) =====================
-def guardar_datos(driver, timestamp):
+def guardar_datos(driver, timestamp, id_captura=None):
     rows = 0
-    file_exists = os.path.exists(OUTPUT_CSV)
-    with open(OUTPUT_CSV, 'a', newline='', encoding='utf-8') as f:
-        w = csv.writer(f)
-        if not file_exists:
-            w.writerow(['timestamp', 'provider', 'region', 'datacenter', 'latency_ms'])
+    with LoteCaptura(ruta_salida(OUTPUT_CSV), ['timestamp', 'provider', 'region', 'datacenter', 'latency_ms'], id_captura=id_captura) as w:
         
         for row in driver.find_elements(By.XPATH, "//table//tr")[1:]:
             cells = row.find_elements(By.TAG_NAME, "td")
@@ -195,11 +204,14 @@ def guardar_datos(driver, timestamp):
 # ===================== UNA CAPTURA =====================
 def capturar_una_vez():
     driver = None
+    captura = {'capture_id': nuevo_id_captura()}  # clave para unir los metadatos con las filas
     try:
         driver = setup_driver()
         wait = WebDriverWait(driver, 60)
         logger.info("CARGANDO AZURE...")
 
+        LIMITE.tomar()
+        SONDA.antes()
         for _ in range(5):
             try:
                 driver.get(URL)
@@ -211,8 +223,10 @@ def capturar_una_vez():
         click_start(driver, wait) or logger.info("AUTO-START")
         esperar_datos(driver)
 
-        ts = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        filas = guardar_datos(driver, ts)
+        SONDA.despues()
+        ts = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        captura['ts_ms'] = a_epoch_ms(ts)
+        filas = guardar_datos(driver, ts, captura['capture_id'])
         logger.info(f"{filas} REGIONES AZURE GUARDADAS")
         return filas > 0
     except Exception as e:
@@ -221,6 +235,7 @@ def capturar_una_vez():
         if driver: guardar_screenshot(driver, "AZURE_FAIL")
         return False
     finally:
+        VIGILANTE.terminar(**captura, **SONDA.recoger())
         if driver:
             try: driver.quit()
             except: pass
@@ -235,7 +250,7 @@ def main():
         ciclo += 1
         logger.info(f"\nITERACIÓN {ciclo} - {datetime.datetime.now():%H:%M}")
         for intento in range(1, MAX_REINTENTOS + 1):
-            if capturar_una_vez(): break
+            if LIMITE.resultado(capturar_una_vez()): break
             logger.warning(f"Intento {intento} falló")
             time.sleep(60)
         time.sleep(INTERVALO_MINUTOS * 60)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+COLA DE TRABAJO COMPARTIDA (LEASES EN SQLITE)
+- Una fila por script: cuándo vence su próxima captura y quién la tiene reclamada
+- Cada lanzador RECLAMA la captura con un UPDATE atómico → nunca la hacen dos a la vez
+- El lease caduca a los LEASE_SEGUNDOS: si un lanzador muere, otro la recupera
+- Al completar, la próxima captura se programa con el intervalo del plan adaptativo
+- Varios lanzar_todos_en_roundrobin.py (misma máquina o almacenamiento compartido)
+  cooperan en una sola campaña sin muestrear dos veces
+- Uso: python cola_trabajo.py   → estado de la cola
+"""
+import contextlib
+import os
+import socket
+import sqlite3
+import time
+
+# ===================== CONFIG =====================
+ARCHIVO_COLA = os.environ.get(
+    'COLA_TRABAJO', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cola_trabajo.db'))
+LEASE_SEGUNDOS = 300              # > timeout por script (150 s) con margen
+
+
+def id_trabajador():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# ===================== COLA =====================
+class ColaTrabajo:
+    def __init__(self, scripts, trabajador=None, lease_s=LEASE_SEGUNDOS, archivo=ARCHIVO_COLA):
+        self.trabajador = trabajador or id_trabajador()
+        self.lease_s = lease_s
+        self.archivo = archivo
+        with self._transaccion() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS tareas (
+                              script TEXT PRIMARY KEY,
+                              proxima REAL NOT NULL DEFAULT 0,
+                              trabajador TEXT,
+                              lease_hasta REAL,
+                              capturas INTEGER NOT NULL DEFAULT 0,
+                              recuperadas INTEGER NOT NULL DEFAULT 0,
+                              ultima_fin REAL,
+                              ultimo_trabajador TEXT)""")
+            db.executemany("INSERT OR IGNORE INTO tareas (script) VALUES (?)",
+                           [(self._clave(s),) for s in scripts])
+
+    @staticmethod
+    def _clave(script):
+        # Ruta relativa al repo: igual en todas las máquinas aunque cambie el directorio
+        return os.path.relpath(os.path.abspath(script), os.path.dirname(os.path.abspath(__file__)))
+
+    @contextlib.contextmanager
+    def _transaccion(self):
+        db = sqlite3.connect(self.archivo, timeout=30, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")    # bloqueo de escritura desde el principio
+            try:
+                yield db
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        finally:
+            db.close()
+
+    def espera(self, script):
+        """Segundos hasta que la captura esté libre y vencida (0 = se puede reclamar)"""
+        with self._transaccion() as db:
+            proxima, lease_hasta = db.execute(
+                "SELECT proxima, lease_hasta FROM tareas WHERE script = ?", (self._clave(script),)).fetchone()
+        return max(0.0, proxima - time.time(), (lease_hasta or 0) - time.time())
+
+    def reclamar(self, script):
+        """True si este lanzador se queda con la captura (vencida y sin lease vivo)"""
+        ahora = time.time()
+        with self._transaccion() as db:
+            anterior = db.execute("SELECT trabajador FROM tareas WHERE script = ?",
+                                  (self._clave(script),)).fetchone()[0]
+            cursor = db.execute(
+                """UPDATE tareas SET trabajador = ?, lease_hasta = ?,
+                          recuperadas = recuperadas + (trabajador IS NOT NULL)
+                   WHERE script = ? AND proxima <= ? AND (trabajador IS NULL OR lease_hasta < ?)""",
+                (self.trabajador, ahora + self.lease_s, self._clave(script), ahora, ahora))
+            reclamada = cursor.rowcount == 1
+        if reclamada and anterior:
+            print(f"♻️  {os.path.basename(script)}: lease caducado de {anterior} → recuperado")
+        return reclamada
+
+    def completar(self, script, intervalo_s):
+        """Libera el lease y programa la siguiente captura dentro de intervalo_s"""
+        ahora = time.time()
+        with self._transaccion() as db:
+            db.execute(
+                """UPDATE tareas SET trabajador = NULL, lease_hasta = NULL, proxima = ?,
+                          capturas = capturas + 1, ultima_fin = ?, ultimo_trabajador = ?
+                   WHERE script = ? AND trabajador = ?""",
+                (ahora + intervalo_s, ahora, self.trabajador, self._clave(script), self.trabajador))
+
+    def liberar(self):
+        """Suelta los leases propios sin reprogramar (salida ordenada del lanzador)"""
+        with self._transaccion() as db:
+            db.execute("UPDATE tareas SET trabajador = NULL, lease_hasta = NULL WHERE trabajador = ?",
+                       (self.trabajador,))
+
+
+# ===================== INFORME =====================
+def informe(archivo=ARCHIVO_COLA):
+    if not os.path.exists(archivo):
+        print(f"❌ No existe la cola {archivo}")
+        return
+    db = sqlite3.connect(archivo, timeout=30)
+    filas = db.execute("SELECT script, proxima, trabajador, lease_hasta, capturas, recuperadas, "
+                       "ultima_fin, ultimo_trabajador FROM tareas ORDER BY proxima").fetchall()
+    db.close()
+    ahora = time.time()
+    print(f"{'='*118}")
+    print(f"{'SCRIPT':42s} {'VENCE EN':>9s} {'CAPT':>6s} {'RECUP':>6s} {'ÚLTIMA':>9s}  EN CURSO / ÚLTIMO TRABAJADOR")
+    print(f"{'='*118}")
+    for script, proxima, trabajador, lease_hasta, capturas, recuperadas, ultima_fin, ultimo in filas:
+        vence = f"{max(0.0, proxima - ahora) / 60:.1f}min"
+        hace = f"{(ahora - ultima_fin) / 60:.0f}min" if ultima_fin else '-'
+        if trabajador:
+            quien = f"🔒 {trabajador} (lease {lease_hasta - ahora:+.0f}s)"
+        else:
+            quien = ultimo or '-'
+        print(f"{os.path.basename(script):42s} {vence:>9s} {capturas:6d} {recuperadas:6d} {hace:>9s}  {quien}")
+
+
+if __name__ == "__main__":
+    informe()
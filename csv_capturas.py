@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESCRITURA ATÓMICA DE CAPTURAS EN CSV
+- Las filas de una captura se acumulan en memoria y se escriben de golpe al cerrar el lote
+- Un solo os.write con O_APPEND bajo flock → ni capturas a medias (timeout/Ctrl+C a mitad
+  del DOM) ni filas de dos procesos intercaladas en el mismo CSV
+- Las filas se normalizan al escribir (esquema v2 de esquema_latencia.py: ts_ms UTC,
+  region_key, latencia numérica + status); un CSV v1 se migra bajo el mismo candado
+- Cada fila lleva la columna capture_id (misma para toda la captura) y seq; una fila con
+  la misma clave (provider, region_key, datacenter, seq) que otra del lote se descarta al
+  escribir → las relecturas del DOM no llegan al CSV
+- CSV_FSYNC=1 → fsync tras cada captura (más lento, sobrevive a un corte de luz)
+- SQLITE_LATENCIA=ruta.db → además se inserta en el almacén SQLite (almacen_sqlite.py)
+- leer_csv_capturas(): lectura con pandas de CSV v1 (con o sin capture_id) y v2
+"""
+import csv
+import datetime
+import io
+import logging
+import os
+import secrets
+
+import almacen_sqlite
+from esquema_latencia import (COLUMNA_ID, abrir_bloqueado, cabecera_logica, cabecera_v2, es_actual, es_v2,
+                              leer_cabecera, migrar_bloqueado, ms_a_local, normalizar_fila)
+from segmentos_nodo import info_segmento
+
+# ===================== CONFIG =====================
+CSV_FSYNC = os.environ.get('CSV_FSYNC', '0') == '1'
+
+logger = logging.getLogger(__name__)
+
+
+def nuevo_id_captura():
+    """AAAAMMDDHHMMSS-xxxxxxxx: ordenable por tiempo y único entre nodos/procesos"""
+    return f"{datetime.datetime.now():%Y%m%d%H%M%S}-{secrets.token_hex(4)}"
+
+
+# ===================== ESCRITURA =====================
+class LoteCaptura:
+    """
+    with LoteCaptura(destino, cabecera) as w:
+        w.writerow([...])        # en memoria
+    → al salir sin excepción se confirma; con excepción se descarta entero.
+    Reentrante: si una captura reparte filas entre varias funciones (varios pings),
+    solo el with más externo confirma.
+    nueva_lectura(): cada recorrido completo de la página vuelve a numerar seq desde 0,
+    así releer una tabla ya guardada da claves repetidas (y se descarta).
+    """
+
+    def __init__(self, ruta, cabecera, id_captura=None):
+        self.ruta = ruta
+        self.cabecera = list(cabecera)   # cabecera lógica v1 del colector
+        self.id = id_captura or nuevo_id_captura()
+        self.filas = []
+        self.descartadas = 0
+        self._nivel = 0
+        self._claves = set()
+        self._apariciones = {}
+
+    def nueva_lectura(self):
+        self._apariciones = {}
+
+    def writerow(self, fila):
+        fila = normalizar_fila(fila, self.cabecera)
+        etiqueta = (fila[1], fila[2], fila[4])
+        seq = self._apariciones.get(etiqueta, 0)
+        self._apariciones[etiqueta] = seq + 1
+        if etiqueta + (seq,) in self._claves:
+            self.descartadas += 1
+            return
+        self._claves.add(etiqueta + (seq,))
+        self.filas.append(fila + [self.id, seq])
+
+    def _vaciar(self):
+        self.filas = []
+        self.descartadas = 0
+        self._claves = set()
+        self._apariciones = {}
+
+    def confirmar(self):
+        """Escribe todas las filas en una única escritura bloqueada; devuelve cuántas"""
+        if not self.filas:
+            return 0
+        fd = abrir_bloqueado(self.ruta)
+        try:
+            # Un segmento de nodo no se migra: la fusión lleva offsets en bytes de él y ya
+            # normaliza sus filas v1; el resto de CSV v1 se migra una sola vez (los demás
+            # procesos esperan al candado y reabren el archivo nuevo)
+            if (os.fstat(fd).st_size and info_segmento(self.ruta) is None
+                    and not es_actual(leer_cabecera(self.ruta))):
+                migrar_bloqueado(self.ruta)
+                os.close(fd)
+                fd = abrir_bloqueado(self.ruta)
+            buffer = io.StringIO()
+            w = csv.writer(buffer)
+            if os.fstat(fd).st_size == 0:   # bajo el candado: solo uno escribe la cabecera
+                w.writerow(cabecera_v2(self.cabecera))
+            w.writerows(self.filas)
+            datos = memoryview(buffer.getvalue().encode('utf-8'))
+            while datos:
+                datos = datos[os.write(fd, datos):]
+            if CSV_FSYNC:
+                os.fsync(fd)
+        finally:
+            os.close(fd)   # cerrar suelta también el flock
+        if almacen_sqlite.ARCHIVO_SQLITE:
+            try:
+                almacen_sqlite.guardar_captura(self.ruta, self.id, self.filas)
+            except Exception as e:
+                logger.warning(f"⚠️  Captura {self.id} en CSV pero no en SQLite: {e}")
+        n = len(self.filas)
+        if self.descartadas:
+            logger.info(f"♻️  Captura {self.id}: {self.descartadas} filas releídas descartadas (clave repetida)")
+        self._vaciar()
+        return n
+
+    def __enter__(self):
+        self._nivel += 1
+        return self
+
+    def __exit__(self, tipo, valor, tb):
+        self._nivel -= 1
+        if tipo is None:
+            if self._nivel == 0:
+                self.confirmar()
+        elif self.filas:
+            logger.warning(f"🗑️  Captura {self.id} descartada ({len(self.filas)} filas sin confirmar): {tipo.__name__}")
+            self._vaciar()
+        return False
+
+
+# ===================== LECTURA =====================
+def columnas_csv(ruta):
+    """Columnas lógicas (timestamp, provider, region, datacenter, latency_ms) del archivo"""
+    return cabecera_logica(leer_cabecera(ruta))
+
+
+def leer_csv_capturas(ruta, names=None, **kwargs):
+    """
+    pd.read_csv para CSV de latencia con las mismas columnas sea cual sea la versión:
+      v1 → filas antiguas (sin capture_id → NaN) y nuevas juntas
+      v2 → timestamp local derivado de ts_ms, más region_key y status al final
+    """
+    import pandas as pd
+    columnas = list(names or columnas_csv(ruta))
+    if not es_v2(leer_cabecera(ruta)):
+        return pd.read_csv(ruta, names=columnas + [COLUMNA_ID], header=None, skiprows=1, **kwargs)
+    df = pd.read_csv(ruta, dtype={'ts_ms': 'int64', 'latency_ms': 'float64'}, **kwargs)
+    df.insert(0, 'timestamp', ms_a_local(df.pop('ts_ms')))
+    logicas = ['timestamp', df.columns[1], df.columns[3], df.columns[4], 'latency_ms']
+    df = df[logicas + [COLUMNA_ID, 'region_key', 'status']]
+    return df.rename(columns=dict(zip(logicas, columnas)))
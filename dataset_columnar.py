@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DATASET COLUMNAR PARTICIONADO
+- Compacta cada *_latency_longterm.csv en dataset_latencia/ (junto a los CSV):
+    <origen>/<provider>/<AAAA-MM-DD>/<columna>.npy
+- Columnas tipadas: timestamp datetime64[ms] (hora local, de ts_ms en CSV v2), latency_ms
+  float64 (NaN = 'Failed'), textos (también region_key/status de v2) como códigos int32 +
+  diccionario <columna>.json; provider va en el manifiesto
+- Los cargadores leen solo las particiones (provider/día) y columnas que piden, con
+  np.load(mmap) → el tiempo de carga depende de la consulta, no de toda la historia;
+  iterar_latencias() las entrega por bloques de FILAS_BLOQUE filas (memoria acotada)
+- El CSV se parsea por bloques de BYTES_BLOQUE bytes (DATASET_BYTES_BLOQUE)
+- INCREMENTAL: _manifest.json es el catálogo de ingesta (por CSV: tamaño, inodo, offset
+  parseado y sha1 de los últimos BYTES_HUELLA bytes antes del offset); solo se parsean los
+  bytes añadidos y solo se reescriben los días tocados. Si la huella no cuadra (el CSV se
+  reescribió en sitio) se reconstruye ese CSV
+- DUPLICADOS: cada partición guarda la clave idempotente de sus filas (clave.npy); al
+  compactar se descartan las nuevas con clave ya vista → sin drop_duplicates al analizar
+- Formato .npy (numpy) y no Parquet: el entorno del TFG no trae pyarrow
+- Uso: python dataset_columnar.py [DIRECTORIO] [--reconstruir]
+"""
+import csv
+import fcntl
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from csv_capturas import COLUMNA_ID, leer_csv_capturas
+from esquema_latencia import cabecera_logica, cabecera_v2, es_v2, ms_a_local
+
+# ===================== CONFIG =====================
+DATASET_DIR = 'dataset_latencia'
+NOMBRE_MANIFIESTO = '_manifest.json'
+PATRON_CSV = '*_latency_longterm.csv'
+FORMATO_TS = '%Y-%m-%d %H:%M:%S'
+COLUMNAS_NUMERICAS = {'timestamp', 'latency_ms', 'clave'}
+VERSION_DATASET = 2               # 2: columna clave (índice de duplicados); otra → reconstruir
+BYTES_HUELLA = 4096
+BYTES_BLOQUE = int(os.environ.get('DATASET_BYTES_BLOQUE', 64 << 20))   # CSV parseado por bloques
+FILAS_BLOQUE = 250_000            # filas por bloque de iterar_latencias()
+
+
+def _slug(texto):
+    return re.sub(r'[^A-Za-z0-9.]+', '_', str(texto)).strip('_') or 'sin_nombre'
+
+
+def _raiz(ruta_csv):
+    return os.path.join(os.path.dirname(os.path.abspath(ruta_csv)), DATASET_DIR)
+
+
+def cargar_manifiesto(raiz):
+    try:
+        with open(os.path.join(raiz, NOMBRE_MANIFIESTO), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def guardar_manifiesto(raiz, manifiesto):
+    ruta = os.path.join(raiz, NOMBRE_MANIFIESTO)
+    with open(ruta + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, indent=1)
+    os.replace(ruta + '.tmp', ruta)
+
+
+def actualizar_entrada(raiz, nombre, entrada):
+    """Reescribe solo la entrada de un CSV bajo flock: compactar varios CSV a la vez no pisa las demás"""
+    os.makedirs(raiz, exist_ok=True)
+    with open(os.path.join(raiz, NOMBRE_MANIFIESTO + '.lock'), 'w') as candado:
+        fcntl.flock(candado, fcntl.LOCK_EX)
+        manifiesto = cargar_manifiesto(raiz)
+        manifiesto[nombre] = entrada
+        guardar_manifiesto(raiz, manifiesto)
+
+
+# ===================== PARTICIONES =====================
+def escribir_particion(directorio, df):
+    """Escribe df (sin provider) como un .npy por columna; sustituye la partición entera"""
+    tmp = directorio + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for columna in df.columns:
+        ruta = os.path.join(tmp, columna)
+        if columna == 'timestamp':
+            np.save(ruta + '.npy', df[columna].to_numpy(dtype='datetime64[ms]'))
+        elif columna == 'latency_ms':
+            np.save(ruta + '.npy', df[columna].to_numpy(dtype='float64'))
+        elif columna == 'clave':
+            np.save(ruta + '.npy', df[columna].to_numpy(dtype='uint64'))
+        else:
+            codigos, categorias = pd.factorize(df[columna].astype(object), use_na_sentinel=True)
+            np.save(ruta + '.npy', codigos.astype('int32'))
+            with open(ruta + '.json', 'w', encoding='utf-8') as f:
+                json.dump([str(c) for c in categorias], f, ensure_ascii=False)
+    viejo = directorio + '.old'
+    if os.path.exists(directorio):
+        os.replace(directorio, viejo)
+    os.replace(tmp, directorio)
+    shutil.rmtree(viejo, ignore_errors=True)
+
+
+def leer_particion(directorio, columnas):
+    """{columna: array} de una partición (textos ya decodificados a objetos)"""
+    datos = {}
+    for columna in columnas:
+        ruta = os.path.join(directorio, columna)
+        if not os.path.exists(ruta + '.npy'):
+            continue
+        valores = np.load(ruta + '.npy', mmap_mode='r')
+        if columna in COLUMNAS_NUMERICAS:
+            datos[columna] = np.asarray(valores)
+        else:
+            with open(ruta + '.json', encoding='utf-8') as f:
+                categorias = np.array(json.load(f) + [None], dtype=object)   # -1 → None
+            datos[columna] = categorias[valores]
+    return datos
+
+
+# ===================== COMPACTACIÓN =====================
+def clave_fila(df, columnas):
+    """
+    Clave idempotente (uint64) de cada fila: v2 → timestamp + capture_id + provider +
+    region_key + datacenter + seq; filas sin seq (v1) → todo su contenido, que es lo que
+    comparaba el drop_duplicates de los análisis
+    """
+    contenido = pd.util.hash_pandas_object(df[columnas + [COLUMNA_ID]], index=False).to_numpy()
+    if 'seq' not in df.columns:
+        return contenido
+    con_seq = df['seq'].notna() & (df['seq'] != '')
+    clave = pd.util.hash_pandas_object(
+        df[['timestamp', COLUMNA_ID, columnas[1], 'region_key', columnas[3], 'seq']], index=False).to_numpy()
+    return np.where(con_seq.to_numpy(), clave, contenido)
+
+
+def huella_cola(ruta_csv, offset):
+    """sha1 de los BYTES_HUELLA bytes anteriores a offset (lo último ya parseado)"""
+    with open(ruta_csv, 'rb') as f:
+        f.seek(max(0, offset - BYTES_HUELLA))
+        return hashlib.sha1(f.read(min(offset, BYTES_HUELLA))).hexdigest()
+
+
+def _bloques_nuevos(ruta_csv, offset):
+    """
+    (cabecera o None, filas, offset tras el bloque) por bloques de ~BYTES_BLOQUE, hasta la
+    última línea completa → la compactación no necesita el CSV entero en memoria
+    """
+    with open(ruta_csv, 'rb') as f:
+        f.seek(offset)
+        resto = b''
+        while True:
+            leido = f.read(BYTES_BLOQUE)
+            if not leido:
+                return
+            datos = resto + leido
+            fin = datos.rfind(b'\n') + 1
+            resto = datos[fin:]
+            if not fin:
+                continue
+            cabecera, filas = None, []
+            for fila in csv.reader(io.StringIO(datos[:fin].decode('utf-8', 'replace'))):
+                if not fila:
+                    continue
+                if fila[0] in ('timestamp', 'ts_ms'):
+                    cabecera = fila
+                else:
+                    filas.append(fila)
+            offset += fin
+            yield cabecera, filas, offset
+
+
+def _esquema(cabecera):
+    """(cabecera normalizada, columnas del dataset) de una cabecera v1 o v2"""
+    if es_v2(cabecera):
+        cabecera = cabecera_v2(cabecera_logica(cabecera))   # un v2 anterior a seq se lee igual
+        return cabecera, ['timestamp', cabecera[1], cabecera[3], cabecera[4], 'latency_ms', 'region_key', 'status']
+    cabecera = [c for c in cabecera if c != COLUMNA_ID] + [COLUMNA_ID]
+    return cabecera, cabecera[:-1]
+
+
+def _volcar_bloque(raiz, origen, particiones, cabecera, columnas, filas):
+    """Lleva un bloque de filas crudas a sus particiones; devuelve (escritas, duplicadas)"""
+    duplicadas, escritas = 0, 0
+    ancho = len(cabecera)
+    df = pd.DataFrame([f[:ancho] + [None] * (ancho - len(f)) for f in filas], columns=cabecera)
+    if es_v2(cabecera):
+        df['timestamp'] = ms_a_local(pd.to_numeric(df.pop('ts_ms'), errors='coerce'))
+    else:
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format=FORMATO_TS, errors='coerce')
+    df['latency_ms'] = pd.to_numeric(df['latency_ms'], errors='coerce')
+    df = df.dropna(subset=['timestamp'])
+    df['clave'] = clave_fila(df, columnas)
+    df = df[columnas + [COLUMNA_ID, 'clave']]
+    duplicadas += int(df['clave'].duplicated().sum())
+    df = df[~df['clave'].duplicated()]
+    for (provider, dia), grupo in df.groupby(['provider', df['timestamp'].dt.strftime('%Y-%m-%d')], sort=False):
+        relativa = os.path.join(origen, _slug(provider), dia)
+        directorio = os.path.join(raiz, relativa)
+        grupo = grupo.drop(columns='provider')
+        if relativa in particiones:
+            # Índice de duplicados = claves de la partición del mismo día (una fila
+            # repetida es de la misma captura, luego del mismo día): O(filas del día)
+            previo = pd.DataFrame(leer_particion(directorio, grupo.columns))
+            repetida = grupo['clave'].isin(previo['clave'])
+            duplicadas += int(repetida.sum())
+            grupo = grupo[~repetida]
+            if grupo.empty:
+                continue
+            escritas += len(grupo)
+            grupo = pd.concat([previo, grupo], ignore_index=True)
+        else:
+            escritas += len(grupo)
+        escribir_particion(directorio, grupo)
+        particiones[relativa] = {'provider': provider, 'dia': dia, 'filas': len(grupo)}
+    return escritas, duplicadas
+
+
+def compactar_csv(ruta_csv, reconstruir=False):
+    """Lleva al dataset lo añadido al CSV desde la última vez; devuelve filas nuevas (sin duplicadas)"""
+    raiz = _raiz(ruta_csv)
+    nombre = os.path.basename(ruta_csv)
+    origen = nombre.replace('_latency_longterm.csv', '').replace('.csv', '')
+    entrada = cargar_manifiesto(raiz).get(nombre, {})
+    st = os.stat(ruta_csv)
+    # 'compactando' sigue puesto si una compactación anterior se cortó a medias
+    if (reconstruir or entrada.get('compactando') or entrada.get('inodo') != st.st_ino
+            or (entrada and entrada.get('version') != VERSION_DATASET)
+            or st.st_size < entrada.get('offset', 0)
+            or (entrada and entrada.get('huella') != huella_cola(ruta_csv, entrada['offset']))):
+        shutil.rmtree(os.path.join(raiz, origen), ignore_errors=True)
+        entrada = {}
+    offset = entrada.get('offset', 0)
+    if offset == st.st_size:
+        return 0
+
+    cabecera = entrada.get('cabecera')
+    columnas = entrada.get('columnas')
+    particiones = entrada.get('particiones', {})
+    duplicadas, escritas = entrada.get('duplicadas', 0), 0
+    marcado = False
+    for cabecera_bloque, filas, offset in _bloques_nuevos(ruta_csv, offset):
+        if not cabecera:
+            if not cabecera_bloque:
+                return 0
+            cabecera, columnas = _esquema(cabecera_bloque)
+        if not filas:
+            continue
+        if not marcado:
+            actualizar_entrada(raiz, nombre, dict(entrada, compactando=True))
+            marcado = True
+        nuevas, repetidas = _volcar_bloque(raiz, origen, particiones, cabecera, columnas, filas)
+        escritas += nuevas
+        duplicadas += repetidas
+    if not cabecera:
+        return 0
+
+    actualizar_entrada(raiz, nombre, {'offset': offset, 'inodo': st.st_ino, 'tamano': st.st_size,
+                                      'huella': huella_cola(ruta_csv, offset), 'cabecera': cabecera,
+                                      'columnas': columnas, 'filas': sum(p['filas'] for p in particiones.values()),
+                                      'duplicadas': duplicadas, 'version': VERSION_DATASET,
+                                      'particiones': particiones})
+    return escritas
+
+
+def compactar(directorio='.', reconstruir=False):
+    resultado = {}
+    for ruta in sorted(glob.glob(os.path.join(directorio, PATRON_CSV))):
+        inicio = time.perf_counter()
+        resultado[ruta] = compactar_csv(ruta, reconstruir)
+        print(f"🗜️  {os.path.basename(ruta)}: {resultado[ruta]:,} filas nuevas ({time.perf_counter() - inicio:.1f}s)")
+    return resultado
+
+
+# ===================== LECTURA =====================
+def dataset_disponible(ruta_csv):
+    return os.path.basename(ruta_csv) in cargar_manifiesto(_raiz(ruta_csv))
+
+
+def _coincide(provider, providers):
+    return providers is None or any(re.search(p, provider, re.I) for p in providers)
+
+
+def _en_rango(dia, desde, hasta):
+    return (desde is None or dia >= str(desde)[:10]) and (hasta is None or dia <= str(hasta)[:10])
+
+
+def filas_totales(ruta_csv):
+    """Filas del CSV: del manifiesto si está compactado, si no contando líneas"""
+    filas = cargar_manifiesto(_raiz(ruta_csv)).get(os.path.basename(ruta_csv), {}).get('filas')
+    if filas is None:
+        with open(ruta_csv, 'rb') as f:
+            filas = sum(bloque.count(b'\n') for bloque in iter(lambda: f.read(1 << 20), b'')) - 1
+    return filas
+
+
+def _seleccion(ruta_csv, names, providers, desde, hasta, columnas):
+    """(raíz, particiones elegidas en orden de día, columnas originales pedidas, renombre)"""
+    raiz = _raiz(ruta_csv)
+    entrada = cargar_manifiesto(raiz)[os.path.basename(ruta_csv)]
+    originales = entrada['columnas'] + [COLUMNA_ID]
+    renombre = {c: c for c in originales}
+    renombre.update(zip(entrada['columnas'][:5], names or []))
+    inverso = {v: k for k, v in renombre.items()}
+    pedidas = [inverso.get(c, c) for c in (columnas or renombre.values())]
+    elegidas = [(relativa, p) for relativa, p in sorted(entrada['particiones'].items(), key=lambda x: x[1]['dia'])
+                if _coincide(p['provider'], providers) and _en_rango(p['dia'], desde, hasta)]
+    return raiz, elegidas, [c for c in originales if c in pedidas], renombre
+
+
+def _leer_particiones(raiz, elegidas, pedidas, renombre):
+    """DataFrame de varias particiones (columnas pedidas, ya renombradas)"""
+    partes = {c: [] for c in pedidas}
+    for relativa, p in elegidas:
+        datos = leer_particion(os.path.join(raiz, relativa), [c for c in pedidas if c != 'provider'])
+        if 'provider' in pedidas:
+            datos['provider'] = np.full(p['filas'], p['provider'], dtype=object)
+        for columna in pedidas:
+            if columna in datos:
+                partes[columna].append(datos[columna])
+    df = pd.DataFrame({renombre.get(c, c): np.concatenate(partes[c]) if partes[c] else [] for c in pedidas})
+    if 'timestamp' in df.columns:
+        df['timestamp'] = df['timestamp'].astype('datetime64[ns]')
+        df = df.sort_values('timestamp', kind='stable', ignore_index=True)
+    df.attrs['deduplicado'] = True   # el índice de claves ya quitó las filas repetidas
+    return df
+
+
+def _filtrar_tiempo(df, desde, hasta):
+    if 'timestamp' in df.columns:
+        if desde is not None:
+            df = df[df['timestamp'] >= pd.Timestamp(desde)]
+        if hasta is not None:
+            df = df[df['timestamp'] <= pd.Timestamp(hasta)]
+    return df.reset_index(drop=True)
+
+
+def leer_latencias(ruta_csv, names=None, providers=None, desde=None, hasta=None, columnas=None):
+    """
+    DataFrame de un CSV de latencia. Si el CSV está compactado se lee del dataset
+    (antes se compacta lo nuevo) y solo las particiones/columnas pedidas; si no,
+    se lee el CSV entero y se aplican los mismos filtros.
+      providers: patrones (regex, sin mayúsculas) sobre la columna provider
+      desde/hasta: límites de timestamp; columnas: subconjunto (nombres de names)
+      names renombra las 5 columnas lógicas; region_key/status (v2) conservan su nombre
+    """
+    if not dataset_disponible(ruta_csv):
+        df = leer_csv_capturas(ruta_csv, names=names)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+        if providers is not None:
+            df = df[df['provider'].astype(str).map(lambda p: _coincide(p, providers))]
+        if columnas is not None:
+            df = df[[c for c in df.columns if c in columnas]]
+    else:
+        compactar_csv(ruta_csv)
+        df = _leer_particiones(*_seleccion(ruta_csv, names, providers, desde, hasta, columnas))
+    return _filtrar_tiempo(df, desde, hasta)
+
+
+def iterar_latencias(ruta_csv, names=None, providers=None, desde=None, hasta=None, columnas=None,
+                     filas_por_bloque=FILAS_BLOQUE):
+    """
+    Como leer_latencias pero por bloques de ~filas_por_bloque filas (particiones enteras,
+    en orden de día): memoria acotada sea cual sea la historia. Compacta antes lo nuevo
+    del CSV (también por bloques), así siempre lee del dataset con sus tipos.
+    """
+    compactar_csv(ruta_csv)
+    raiz, elegidas, pedidas, renombre = _seleccion(ruta_csv, names, providers, desde, hasta, columnas)
+    grupo, filas = [], 0
+    for relativa, p in elegidas:
+        grupo.append((relativa, p))
+        filas += p['filas']
+        if filas >= filas_por_bloque:
+            yield _filtrar_tiempo(_leer_particiones(raiz, grupo, pedidas, renombre), desde, hasta)
+            grupo, filas = [], 0
+    if grupo:
+        yield _filtrar_tiempo(_leer_particiones(raiz, grupo, pedidas, renombre), desde, hasta)
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    compactar(args[0] if args else '.', reconstruir='--reconstruir' in sys.argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESQUEMA NORMALIZADO DE LOS CSV DE LATENCIA (v2)
+- ts_ms | provider | region_key | region | datacenter | latency_ms | status | capture_id | seq
+  (cloudping.co: from_region | to_region en lugar de region | datacenter)
+- ts_ms: epoch UTC en milisegundos → sin ambigüedad de zona horaria ni cambio de hora
+- region_key: clave canónica de región, en mayúsculas y sin separadores ('East US' /
+  'eastus ' / 'east-us' → 'EASTUS'); en cloudping.co sale de to_region, que es la región
+  que se analiza. Es idempotente: aplicada a una clave antigua ('EAST-US') da la actual
+- latency_ms siempre numérica (vacía si no hay dato) + status: ok / failed / invalido / vacio
+- seq: nº de aparición de (provider, region_key, datacenter) en una lectura de la web →
+  clave de fila idempotente (capture_id, provider, region_key, datacenter, seq): una relectura
+  del DOM da la misma clave (duplicado), una etiqueta repetida en la web da otra
+- LoteCaptura escribe ya normalizado; un CSV antiguo (v1) se migra una sola vez, la primera
+  vez que se escribe en él o con --migrar (copia del original en <csv>.v1.bak); los
+  timestamps v1 son hora local → migrar con la zona del colector (TZ=Europe/Madrid ...)
+- fila_comun() lee filas v1 o v2 para los lectores que recorren el CSV a mano
+- Uso: python esquema_latencia.py [--migrar] [CSV...]   → versión de cada CSV / migración
+"""
+import csv
+import datetime
+import fcntl
+import glob
+import os
+import re
+import sys
+import time
+
+# ===================== CONFIG =====================
+CABECERA_V1 = ['timestamp', 'provider', 'region', 'datacenter', 'latency_ms']
+COLUMNA_ID = 'capture_id'
+COLUMNA_SEQ = 'seq'
+FORMATOS_TS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d')
+PATRON_CSV = '*_latency_longterm.csv'
+
+
+# ===================== NORMALIZACIÓN =====================
+def clave_region(texto):
+    """Una sola clave por región aunque cada web la escriba con otros espacios o guiones"""
+    return re.sub(r'[^A-Z0-9]', '', str(texto or '').upper())
+
+
+def a_epoch_ms(valor):
+    """datetime local / texto 'AAAA-MM-DD HH:MM:SS[.fff]' local / número → epoch ms UTC"""
+    if isinstance(valor, (int, float)):
+        return int(valor)
+    if isinstance(valor, str):
+        for formato in FORMATOS_TS:
+            try:
+                valor = datetime.datetime.strptime(valor.strip(), formato)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"timestamp no reconocido: {valor!r}")
+    return int(round(valor.timestamp() * 1000))   # naive → hora local del colector
+
+
+def latencia_y_estado(valor):
+    """(latencia float o None, status)"""
+    if valor is None or str(valor).strip() == '':
+        return None, 'vacio'
+    try:
+        return float(valor), 'ok'
+    except (TypeError, ValueError):
+        pass
+    if 'fail' in str(valor).lower():
+        return None, 'failed'
+    return None, 'invalido'
+
+
+def cabecera_v2(cabecera_v1=CABECERA_V1):
+    return ['ts_ms', cabecera_v1[1], 'region_key', cabecera_v1[2], cabecera_v1[3],
+            'latency_ms', 'status', COLUMNA_ID, COLUMNA_SEQ]
+
+
+def es_v2(cabecera):
+    return bool(cabecera) and cabecera[0] == 'ts_ms'
+
+
+def es_actual(cabecera):
+    """v2 con todas sus columnas (los v2 anteriores a seq también se migran)"""
+    return es_v2(cabecera) and cabecera[-1] == COLUMNA_SEQ
+
+
+def cabecera_logica(cabecera):
+    """[timestamp, provider, region, datacenter, latency_ms] de una cabecera v1 o v2"""
+    if es_v2(cabecera):
+        return ['timestamp', cabecera[1], cabecera[3], cabecera[4], 'latency_ms']
+    return [c for c in cabecera if c != COLUMNA_ID][:5] or CABECERA_V1
+
+
+def normalizar_fila(fila, cabecera_v1=CABECERA_V1):
+    """[timestamp, provider, region, datacenter, latencia] → fila v2 sin capture_id"""
+    latencia, estado = latencia_y_estado(fila[4])
+    region, datacenter = str(fila[2]).strip(), str(fila[3]).strip()
+    clave = datacenter if cabecera_v1[3] == 'to_region' else region
+    return [a_epoch_ms(fila[0]), str(fila[1]).strip(), clave_region(clave), region, datacenter,
+            '' if latencia is None else latencia, estado]
+
+
+def _parece_v2(fila):
+    return len(fila) >= 7 and fila[0].isdigit()
+
+
+def a_v2(fila, cabecera_v1=CABECERA_V1):
+    """Fila cruda v1 o v2 (con o sin capture_id/seq) → fila v2 completa (seq '' si no la trae)"""
+    if _parece_v2(fila):
+        return list(fila[:9]) + [''] * (9 - len(fila))
+    return normalizar_fila(fila[:5], cabecera_v1) + [fila[5] if len(fila) > 5 else '', '']
+
+
+def normalizar_filas(filas, cabecera_v1=CABECERA_V1):
+    """
+    Filas crudas (v1, o v2 sin seq) → filas v2 completas. Dentro de cada captura se
+    descartan las repetidas exactas (relecturas del DOM) y se numera seq como al escribir.
+    Las filas deben venir en orden de archivo (una captura es un bloque contiguo).
+    """
+    captura, vistas, etiquetas = None, set(), {}
+    for fila in filas:
+        if not fila or fila[0] in ('timestamp', 'ts_ms'):
+            continue
+        try:
+            v2 = a_v2(fila, cabecera_v1)
+        except (ValueError, IndexError):
+            continue   # filas rotas del v1: no se arrastran
+        if v2[8] != '':
+            yield v2
+            continue
+        if (v2[7] or (v2[0], v2[1])) != captura:
+            captura, vistas, etiquetas = v2[7] or (v2[0], v2[1]), set(), {}
+        contenido = tuple(str(c) for c in v2[:8])
+        if contenido in vistas:
+            continue
+        vistas.add(contenido)
+        etiqueta = (v2[1], v2[2], v2[4])
+        v2[8] = etiquetas.get(etiqueta, 0)
+        etiquetas[etiqueta] = v2[8] + 1
+        yield v2
+
+
+def fila_comun(fila):
+    """
+    (ts_ms, provider, region, datacenter, latencia o None, capture_id o None) de una fila
+    cruda v1 o v2; None si es cabecera o no se puede leer
+    """
+    try:
+        if _parece_v2(fila):
+            latencia = float(fila[5]) if fila[5] else None
+            return int(fila[0]), fila[1], fila[3], fila[4], latencia, (fila[7] if len(fila) > 7 else '') or None
+        if len(fila) < 5:
+            return None
+        latencia, _ = latencia_y_estado(fila[4])
+        return a_epoch_ms(fila[0]), fila[1], fila[2], fila[3], latencia, (fila[5] if len(fila) > 5 else '') or None
+    except ValueError:
+        return None
+
+
+def ms_a_local(serie):
+    """
+    Serie de epoch ms → datetime64[ns] local sin zona (lo que esperan los análisis).
+    Se convierte cada instante distinto una vez (todas las filas de una captura comparten
+    ts_ms), con la misma regla que fromtimestamp: mucho más rápido que tz_convert(tzlocal())
+    """
+    import numpy as np
+    import pandas as pd
+    valores = np.asarray(serie, dtype='float64')
+    unicos, inversa = np.unique(valores, return_inverse=True)
+    locales = np.array([np.datetime64('NaT') if v != v else np.datetime64(
+        datetime.datetime.fromtimestamp(int(v) // 1000) + datetime.timedelta(milliseconds=int(v) % 1000), 'ms')
+        for v in unicos], dtype='datetime64[ms]')
+    return pd.Series(locales[inversa].astype('datetime64[ns]'), index=getattr(serie, 'index', None))
+
+
+# ===================== MIGRACIÓN =====================
+def leer_cabecera(ruta):
+    try:
+        with open(ruta, newline='', encoding='utf-8') as f:
+            return next(csv.reader(f), [])
+    except OSError:
+        return []
+
+
+def abrir_bloqueado(ruta):
+    """fd en O_APPEND con flock exclusivo, garantizando que es el inodo vigente de ruta"""
+    while True:
+        fd = os.open(ruta, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_ino == os.stat(ruta).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        os.close(fd)   # lo migraron/sustituyeron mientras esperábamos el candado
+
+
+def migrar_bloqueado(ruta):
+    """Reescribe un CSV v1 (o v2 sin seq) en v2 (el llamante tiene el flock); devuelve filas migradas"""
+    cabecera = leer_cabecera(ruta)
+    if not cabecera or es_actual(cabecera):
+        return 0
+    cabecera_v1 = cabecera_logica(cabecera)
+    tmp = ruta + '.v2tmp'
+    filas = 0
+    with open(ruta, newline='', encoding='utf-8') as origen, \
+            open(tmp, 'w', newline='', encoding='utf-8') as destino:
+        w = csv.writer(destino)
+        w.writerow(cabecera_v2(cabecera_v1))
+        for fila in normalizar_filas(csv.reader(origen), cabecera_v1):
+            w.writerow(fila)
+            filas += 1
+    respaldo = ruta + ('.v2.bak' if es_v2(cabecera) else '.v1.bak')
+    if os.path.exists(respaldo):
+        os.remove(respaldo)
+    os.link(ruta, respaldo)   # el original queda intacto como respaldo
+    os.replace(tmp, ruta)
+    return filas
+
+
+def migrar_csv(ruta):
+    if es_actual(leer_cabecera(ruta)):
+        return 0
+    fd = abrir_bloqueado(ruta)
+    try:
+        return migrar_bloqueado(ruta)
+    finally:
+        os.close(fd)
+
+
+def main():
+    rutas = [a for a in sys.argv[1:] if not a.startswith('--')] or sorted(glob.glob(PATRON_CSV))
+    for ruta in rutas:
+        if '--migrar' in sys.argv:
+            inicio = time.perf_counter()
+            filas = migrar_csv(ruta)
+            if filas:
+                print(f"🔁 {ruta}: {filas:,} filas migradas a v2 ({time.perf_counter() - inicio:.1f}s, "
+                      f"original en {ruta}.v1.bak / .v2.bak)")
+            else:
+                print(f"✅ {ruta}: ya en v2")
+        else:
+            cabecera = leer_cabecera(ruta)
+            print(f"{'v2' if es_actual(cabecera) else 'v2 sin seq' if es_v2(cabecera) else 'v1'}  {ruta}")
+
+
+if __name__ == "__main__":
+    main()
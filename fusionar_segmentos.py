@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+FUSIÓN DE SEGMENTOS MULTI-NODO
+- Junta segmentos/<nodo>/<csv>__<nodo>__<AAAAMMDDHH>.csv en el <csv> canónico, en orden temporal
+- Solo segmentos sellados (hora cerrada + GRACIA_MINUTOS) salvo --todos
+- INCREMENTAL: offset ya fusionado por segmento en .segmentos_fusionados.json → re-ejecutar
+  no duplica nada
+- El nodo viaja en la fila: capture_id → <capture_id>@<nodo> (segmentos_nodo.id_con_nodo)
+- Duplicados por la clave v2 (capture_id, provider, region_key, datacenter, seq), dentro del
+  lote y contra el canónico (entero al reescribir; al añadir, sus filas finales desde el
+  ts_ms más antiguo del lote, que son las únicas con las que puede coincidir)
+- Si llegan filas más antiguas que el final del canónico (nodo atrasado) se reescribe
+  el canónico ordenado (tmp + os.replace); si no, solo se añade al final
+- Todo sale en el esquema v2 (esquema_latencia.py): segmentos de nodos aún en v1 se
+  normalizan al fusionar y un canónico v1 se migra antes de la primera fusión
+- Seguro ante cortes: antes de escribir se anota el tamaño previo y al arrancar se deshace
+  una fusión a medias
+- Todo el acceso al canónico (lectura, reescritura, añadido y el truncado de recuperar())
+  va bajo el mismo flock que LoteCaptura (abrir_bloqueado) → un colector local que escriba
+  a la vez espera y reabre el archivo nuevo; ni pierde filas ni se intercala con el lote
+- Uso: python fusionar_segmentos.py [--todos] [--destino DIR]
+       python fusionar_segmentos.py --simular 1,2,4   → prueba local con N colectores falsos
+"""
+import csv
+import datetime
+import glob
+import http.server
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from csv_capturas import LoteCaptura
+from esquema_latencia import (abrir_bloqueado, cabecera_logica, cabecera_v2, es_actual, es_v2, leer_cabecera,
+                              migrar_bloqueado, normalizar_filas)
+from segmentos_nodo import SEGMENTOS_DIR, id_con_nodo, info_segmento, ruta_salida
+
+# ===================== CONFIG =====================
+GRACIA_MINUTOS = 15               # margen tras cerrar la hora para escrituras rezagadas
+DESTINO_DIR = os.environ.get('FUSION_DESTINO', '.')
+NOMBRE_ESTADO = '.segmentos_fusionados.json'
+RETARDO_SIMULADO_MS = 10          # "región" falsa: el colector espera red, no CPU (como los reales)
+BYTES_COLA = 65536                # tramo leído hacia atrás al buscar las claves del final del canónico
+
+
+# ===================== ESTADO =====================
+def _ruta_estado(destino):
+    return os.path.join(destino, NOMBRE_ESTADO)
+
+
+def cargar_estado(destino):
+    try:
+        with open(_ruta_estado(destino), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'offsets': {}}
+
+
+def guardar_estado(destino, estado):
+    tmp = _ruta_estado(destino) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, indent=1)
+    os.replace(tmp, _ruta_estado(destino))
+
+
+def recuperar(destino, estado):
+    """Deshace (o da por buena) una fusión interrumpida a mitad de escritura"""
+    pendiente = estado.pop('pendiente', None)
+    if not pendiente:
+        return
+    canonico = os.path.join(destino, pendiente['base'])
+    inodo = os.stat(canonico).st_ino if os.path.exists(canonico) else None
+    if pendiente['inodo'] is not None and inodo != pendiente['inodo']:
+        # La reescritura (os.replace) llegó a completarse
+        estado['offsets'].update(pendiente['offsets'])
+        print(f"♻️  {pendiente['base']}: fusión interrumpida ya completa → offsets aplicados")
+    elif inodo is not None:
+        fd = abrir_bloqueado(canonico)
+        try:
+            os.ftruncate(fd, pendiente['tamano'])
+        finally:
+            os.close(fd)
+        print(f"♻️  {pendiente['base']}: fusión interrumpida deshecha (vuelta a {pendiente['tamano']} bytes)")
+    guardar_estado(destino, estado)
+
+
+# ===================== LECTURA =====================
+def buscar_segmentos(directorio=SEGMENTOS_DIR):
+    """{csv canónico: [(ruta, info)]} de todos los nodos"""
+    por_base = {}
+    for ruta in sorted(glob.glob(os.path.join(directorio, '*', '*.csv'))):
+        info = info_segmento(ruta)
+        if info:
+            por_base.setdefault(info['base'], []).append((ruta, info))
+    return por_base
+
+
+def sellado(info, ahora=None):
+    ahora = ahora or datetime.datetime.now()
+    return info['hora'] + datetime.timedelta(hours=1, minutes=GRACIA_MINUTOS) <= ahora
+
+
+def leer_nuevas(ruta, offset):
+    """(cabecera, filas, nuevo_offset) desde offset hasta la última línea completa"""
+    with open(ruta, 'rb') as f:
+        f.seek(offset)
+        datos = f.read()
+    fin = datos.rfind(b'\n') + 1          # la última línea puede estar a medio escribir
+    cabecera, filas = None, []
+    for fila in csv.reader(io.StringIO(datos[:fin].decode('utf-8', 'replace'))):
+        if not fila:
+            continue
+        if fila[0] in ('timestamp', 'ts_ms'):
+            cabecera = fila
+            continue
+        filas.append(fila)
+    return cabecera, filas, offset + fin
+
+
+def ultimo_timestamp(ruta):
+    """ts_ms de la última fila del CSV (v2) leyendo solo su final"""
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 8192))
+        lineas = f.read().splitlines()
+    for linea in reversed(lineas):
+        ts = linea.split(b',', 1)[0]
+        if ts.isdigit():
+            return int(ts)
+    return None
+
+
+def clave_fila(fila):
+    """Clave v2 de una fila: (capture_id, provider, region_key, datacenter, seq)"""
+    return fila[7], fila[1], fila[2], fila[4], str(fila[8])
+
+
+def claves_desde(ruta, ts_minimo):
+    """Claves de las filas finales del CSV con ts_ms >= ts_minimo, leyendo hacia atrás"""
+    with open(ruta, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        fin = inicio = f.tell()
+        while inicio > 0:
+            inicio = max(0, inicio - BYTES_COLA)
+            f.seek(inicio)
+            lineas = f.read(fin - inicio).splitlines()
+            primera = lineas[1 if inicio else 0:2 if inicio else 1]   # la primera puede estar cortada
+            ts = primera[0].split(b',', 1)[0] if primera else b''
+            if ts.isdigit() and int(ts) < ts_minimo:
+                break
+        f.seek(inicio)
+        datos = f.read(fin - inicio).decode('utf-8', 'replace')
+    if inicio:
+        datos = datos[datos.find('\n') + 1:]
+    return {clave_fila(fila) for fila in csv.reader(io.StringIO(datos))
+            if len(fila) >= 9 and fila[0].isdigit() and int(fila[0]) >= ts_minimo}
+
+
+def _hora(ts_ms):
+    return datetime.datetime.fromtimestamp(int(ts_ms) / 1000).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _a_v2(filas, cabecera_segmento):
+    """Filas de un segmento (v1 de un nodo sin actualizar o v2) → (filas v2, cabecera v2)"""
+    cabecera_v1 = cabecera_logica(cabecera_segmento)
+    return list(normalizar_filas(filas, cabecera_v1)), cabecera_v2(cabecera_v1)
+
+
+# ===================== FUSIÓN =====================
+def fusionar_base(base, segmentos, destino, estado, todos=False):
+    """Fusiona lo nuevo de los segmentos de un CSV canónico; devuelve filas escritas"""
+    offsets = dict(estado['offsets'])
+    cabecera, lote, vistas = None, [], set()
+    for ruta, info in segmentos:
+        if not todos and not sellado(info):
+            continue
+        _, filas, offsets[ruta] = leer_nuevas(ruta, estado['offsets'].get(ruta, 0))
+        filas, cab = _a_v2(filas, leer_cabecera(ruta))
+        cabecera = cabecera or cab
+        for fila in filas:
+            fila[7] = id_con_nodo(fila[7], info['nodo'], fila[0])
+            clave = clave_fila(fila)
+            if clave not in vistas:
+                vistas.add(clave)
+                lote.append(fila)
+    if offsets == estado['offsets']:
+        return 0
+    lote.sort(key=lambda fila: int(fila[0]))   # estable: las filas de una captura siguen juntas
+    if not lote:
+        estado['offsets'] = offsets
+        guardar_estado(destino, estado)
+        return 0
+
+    canonico = os.path.join(destino, base)
+    fd = abrir_bloqueado(canonico)   # crea el canónico si no existe
+    try:
+        if os.fstat(fd).st_size and not es_actual(leer_cabecera(canonico)):
+            migrar_bloqueado(canonico)
+            os.close(fd)
+            fd = abrir_bloqueado(canonico)   # el migrado es otro inodo
+            print(f"🔁 {base}: canónico v1 migrado a v2 antes de fusionar")
+        tamano = os.fstat(fd).st_size
+        ultimo = ultimo_timestamp(canonico)
+        estado['pendiente'] = {'base': base, 'offsets': offsets, 'tamano': tamano,
+                               'inodo': os.fstat(fd).st_ino}
+        guardar_estado(destino, estado)
+
+        if ultimo is not None and int(lote[0][0]) < ultimo:
+            # Filas atrasadas: reescritura completa ordenada (los demás esperan al candado
+            # del inodo viejo y, al obtenerlo, reabren el nuevo)
+            with open(canonico, newline='', encoding='utf-8') as f:
+                existentes = list(csv.reader(f))
+            cab_existente = existentes[0] if existentes and es_v2(existentes[0]) else None
+            cuerpo = existentes[1:] if cab_existente else existentes
+            ya = {clave_fila(fila) for fila in cuerpo if len(fila) >= 9}
+            lote = [fila for fila in lote if clave_fila(fila) not in ya]
+            if lote:
+                tmp = canonico + '.tmp'
+                with open(tmp, 'w', newline='', encoding='utf-8') as f:
+                    w = csv.writer(f)
+                    if cab_existente or cabecera:
+                        w.writerow(cab_existente or cabecera)
+                    w.writerows(sorted(cuerpo + lote, key=lambda fila: int(fila[0])))
+                os.replace(tmp, canonico)
+                print(f"🔀 {base}: {len(lote)} filas (atrasadas desde {_hora(lote[0][0])}) → canónico reescrito")
+        else:
+            if tamano:
+                ya = claves_desde(canonico, int(lote[0][0]))
+                lote = [fila for fila in lote if clave_fila(fila) not in ya]
+            if lote:
+                buffer = io.StringIO()
+                w = csv.writer(buffer)
+                if tamano == 0 and cabecera:
+                    w.writerow(cabecera)
+                w.writerows(lote)
+                datos = memoryview(buffer.getvalue().encode('utf-8'))
+                while datos:
+                    datos = datos[os.write(fd, datos):]
+                print(f"➕ {base}: {len(lote)} filas añadidas ({_hora(lote[0][0])} → {_hora(lote[-1][0])})")
+    finally:
+        os.close(fd)
+
+    estado['offsets'] = offsets
+    estado.pop('pendiente')
+    guardar_estado(destino, estado)
+    return len(lote)
+
+
+def fusionar(directorio=SEGMENTOS_DIR, destino=DESTINO_DIR, todos=False):
+    """Fusiona todos los CSV canónicos; devuelve {csv: filas escritas}"""
+    os.makedirs(destino, exist_ok=True)
+    estado = cargar_estado(destino)
+    estado.setdefault('offsets', {})
+    recuperar(destino, estado)
+    return {base: fusionar_base(base, segmentos, destino, estado, todos)
+            for base, segmentos in buscar_segmentos(directorio).items()}
+
+
+# ===================== SIMULACIÓN LOCAL =====================
+class _RegionFalsa(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(RETARDO_SIMULADO_MS / 1000)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def _colector_falso(nodo, directorio, capturas, regiones, inicio):
+    """Un 'nodo': hace ping a su servidor falso y escribe segmentos igual que un scraper"""
+    from sonda_ruido import medir_referencia
+    servidor = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _RegionFalsa)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{servidor.server_address[1]}/"
+    filas = 0
+    for i in range(capturas):
+        ahora = inicio + datetime.timedelta(minutes=10 * i)
+        destino = ruta_salida('simulado_latency_longterm.csv', nodo=nodo, directorio=directorio, ahora=ahora)
+        with LoteCaptura(destino, ['timestamp', 'provider', 'region', 'datacenter', 'latency_ms']) as w:
+            for r in range(regiones):
+                tiempos = medir_referencia(url, repeticiones=1)
+                if tiempos:
+                    w.writerow([ahora, 'simulado', f'region-{r}', f'dc-{r}', f"{tiempos[0]:.3f}"])
+                    filas += 1
+    servidor.shutdown()
+    return filas
+
+
+def simular(lista_nodos, capturas=24, regiones=10):
+    """Lanza N colectores en procesos separados, fusiona y comprueba orden, totales e idempotencia"""
+    inicio = datetime.datetime.now().replace(minute=0, second=0, microsecond=0) - datetime.timedelta(days=2)
+    print(f"{'='*80}")
+    print(f"🧪 SIMULACIÓN MULTI-NODO ({capturas} capturas × {regiones} regiones por nodo)")
+    print(f"{'='*80}")
+    print(f"{'NODOS':>5s} {'FILAS':>8s} {'INGESTA':>9s} {'FILAS/S':>9s} {'ESCALADO':>9s} {'FUSIÓN':>8s}  CHECK")
+    base_por_nodo = None
+    for n in lista_nodos:
+        with tempfile.TemporaryDirectory() as tmp:
+            directorio, destino = os.path.join(tmp, 'segmentos'), os.path.join(tmp, 'canonico')
+            t0 = time.perf_counter()
+            with multiprocessing.Pool(n) as pool:
+                filas = sum(pool.starmap(_colector_falso, [
+                    (f'nodo{k}', directorio, capturas, regiones, inicio) for k in range(n)]))
+            ingesta = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            escritas = sum(fusionar(directorio, destino, todos=True).values())
+            fusion = time.perf_counter() - t0
+            repetidas = sum(fusionar(directorio, destino, todos=True).values())
+            with open(os.path.join(destino, 'simulado_latency_longterm.csv'), encoding='utf-8') as f:
+                ts = [int(fila[0]) for fila in list(csv.reader(f))[1:]]
+            ok = escritas == filas == len(ts) and repetidas == 0 and ts == sorted(ts)
+            tasa = filas / ingesta
+            base_por_nodo = base_por_nodo or tasa / n
+            print(f"{n:5d} {filas:8d} {ingesta:8.2f}s {tasa:9.0f} {tasa / (base_por_nodo * n):8.0%} "
+                  f"{fusion:7.2f}s  {'✅' if ok else '❌'}")
+
+
+def main():
+    args = sys.argv[1:]
+    if '--simular' in args:
+        simular([int(x) for x in args[args.index('--simular') + 1].split(',')])
+        return
+    destino = args[args.index('--destino') + 1] if '--destino' in args else DESTINO_DIR
+    resultado = fusionar(destino=destino, todos='--todos' in args)
+    print(f"✅ {sum(resultado.values())} filas fusionadas en {len(resultado)} CSV canónicos")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ÍNDICE DE HUECOS Y SLO DE CADENCIA
+- Recorre cada *_latency_longterm.csv y construye, por archivo y proveedor, el índice
+  de capturas (una captura = un timestamp distinto) y los intervalos entre ellas
+- Informa: huecos (> TOLERANCIA × objetivo), cadencia mediana/p95 lograda y % del objetivo
+- INCREMENTAL: guarda el offset en bytes ya procesado en .indice_huecos.json y en cada
+  ejecución solo lee lo añadido desde la anterior (pensado para lanzarlo cada hora)
+- Uso: python indice_huecos.py [--objetivo MIN] [--huecos] [--reconstruir]
+"""
+import csv
+import datetime
+import glob
+import io
+import json
+import os
+import statistics
+import sys
+
+from esquema_latencia import fila_comun
+
+# ===================== CONFIG =====================
+OBJETIVO_MINUTOS = 10
+TOLERANCIA = 1.5                  # intervalo > 1.5 × objetivo → hueco
+ARCHIVO_INDICE = os.environ.get('INDICE_HUECOS', '.indice_huecos.json')
+PATRONES_CSV = ['*_latency_longterm.csv', '*/*_latency_longterm.csv']
+
+
+def buscar_csvs():
+    rutas = set()
+    for patron in PATRONES_CSV:
+        rutas.update(glob.glob(patron))
+    return sorted(rutas)
+
+
+def _firma(ruta):
+    st = os.stat(ruta)
+    return {'inodo': st.st_ino, 'tamano': st.st_size}
+
+
+def cargar_indice():
+    try:
+        with open(ARCHIVO_INDICE, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def guardar_indice(indice):
+    tmp = ARCHIVO_INDICE + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(indice, f)
+    os.replace(tmp, ARCHIVO_INDICE)
+
+
+# ===================== ACTUALIZACIÓN INCREMENTAL =====================
+def actualizar_archivo(ruta, entrada):
+    """
+    Lee desde entrada['offset'] hasta la última línea completa y añade capturas
+    e intervalos a cada serie. Si el archivo se ha truncado o sustituido, reconstruye.
+    Devuelve los bytes leídos.
+    """
+    firma = _firma(ruta)
+    if entrada.get('inodo') != firma['inodo'] or firma['tamano'] < entrada.get('offset', 0):
+        entrada.clear()
+    entrada.setdefault('offset', 0)
+    entrada.setdefault('series', {})
+    with open(ruta, 'rb') as f:
+        f.seek(entrada['offset'])
+        datos = f.read()
+    fin = datos.rfind(b'\n') + 1          # la última línea puede estar a medio escribir
+    if fin == 0:
+        return 0
+    for fila in csv.reader(io.StringIO(datos[:fin].decode('utf-8', 'replace'))):
+        comun = fila_comun(fila)
+        if comun is None:
+            continue   # cabecera / línea rota
+        ts = comun[0] / 1000
+        serie = entrada['series'].setdefault(fila[1], {
+            'primera': ts, 'ultima': None, 'capturas': 0, 'intervalos': []})
+        if serie['ultima'] is not None and ts <= serie['ultima']:
+            continue   # misma captura (varias filas por timestamp) o fila desordenada
+        if serie['ultima'] is not None:
+            serie['intervalos'].append(int(ts - serie['ultima']))
+        serie['ultima'] = ts
+        serie['capturas'] += 1
+    entrada['offset'] += fin
+    entrada['inodo'] = firma['inodo']
+    return fin
+
+
+def actualizar(reconstruir=False):
+    indice = {} if reconstruir else cargar_indice()
+    leidos = 0
+    for ruta in buscar_csvs():
+        leidos += actualizar_archivo(ruta, indice.setdefault(ruta, {}))
+    guardar_indice(indice)
+    return indice, leidos
+
+
+# ===================== SLO =====================
+def metricas_serie(serie, objetivo_s):
+    intervalos = serie['intervalos']
+    umbral = objetivo_s * TOLERANCIA
+    huecos = [(i, s) for i, s in enumerate(intervalos) if s > umbral]
+    duracion = (serie['ultima'] or serie['primera']) - serie['primera']
+    esperadas = duracion / objetivo_s + 1
+    return {
+        'capturas': serie['capturas'],
+        'desde': datetime.datetime.fromtimestamp(serie['primera']),
+        'hasta': datetime.datetime.fromtimestamp(serie['ultima'] or serie['primera']),
+        'mediana_min': statistics.median(intervalos) / 60 if intervalos else None,
+        'p95_min': (statistics.quantiles(intervalos, n=20)[-1] / 60) if len(intervalos) >= 2 else None,
+        'huecos': len(huecos),
+        'mayor_hueco_min': max(intervalos) / 60 if intervalos else 0,
+        'pct_objetivo': 100 * (len(intervalos) - len(huecos)) / len(intervalos) if intervalos else None,
+        'cobertura_pct': min(100.0, 100 * serie['capturas'] / esperadas),
+    }
+
+
+def huecos_serie(serie, objetivo_s):
+    """Lista (inicio, fin, minutos) de los huecos de la serie, reconstruida de los intervalos"""
+    umbral = objetivo_s * TOLERANCIA
+    t = serie['primera']
+    huecos = []
+    for s in serie['intervalos']:
+        if s > umbral:
+            huecos.append((datetime.datetime.fromtimestamp(t), datetime.datetime.fromtimestamp(t + s), s / 60))
+        t += s
+    return huecos
+
+
+def _fmt(valor, patron='{:.1f}'):
+    return '-' if valor is None else patron.format(valor)
+
+
+def informe(indice, objetivo_minutos=OBJETIVO_MINUTOS, mostrar_huecos=False):
+    objetivo_s = objetivo_minutos * 60
+    print(f"{'='*150}")
+    print(f"📏 SLO DE CADENCIA (objetivo: 1 captura cada {objetivo_minutos} min, hueco > {TOLERANCIA:g}×)")
+    print(f"{'='*150}")
+    print(f"{'ARCHIVO / PROVEEDOR':76s} {'CAPT':>6s} {'DESDE':>16s} {'HASTA':>16s} "
+          f"{'MED':>6s} {'P95':>6s} {'HUECOS':>6s} {'MAYOR':>8s} {'%OBJ':>6s} {'%COB':>6s}")
+    for ruta, entrada in sorted(indice.items()):
+        for proveedor, serie in sorted(entrada.get('series', {}).items()):
+            m = metricas_serie(serie, objetivo_s)
+            estado = '✅' if (m['pct_objetivo'] or 0) >= 95 else ('⚠️ ' if (m['pct_objetivo'] or 0) >= 80 else '❌')
+            nombre = f"{ruta} / {proveedor}"[:73]
+            print(f"{estado} {nombre:73s} {m['capturas']:6d} {m['desde']:%Y-%m-%d %H:%M} {m['hasta']:%Y-%m-%d %H:%M} "
+                  f"{_fmt(m['mediana_min']):>6s} {_fmt(m['p95_min']):>6s} {m['huecos']:6d} "
+                  f"{m['mayor_hueco_min']:7.0f}m {_fmt(m['pct_objetivo']):>6s} {m['cobertura_pct']:6.1f}")
+            if mostrar_huecos:
+                for inicio, fin, minutos in huecos_serie(serie, objetivo_s):
+                    print(f"      🕳️  {inicio:%Y-%m-%d %H:%M} → {fin:%Y-%m-%d %H:%M} ({minutos:.0f} min)")
+
+
+def main():
+    args = sys.argv[1:]
+    objetivo = OBJETIVO_MINUTOS
+    if '--objetivo' in args:
+        objetivo = float(args[args.index('--objetivo') + 1])
+    indice, leidos = actualizar(reconstruir='--reconstruir' in args)
+    print(f"📥 {leidos / 1024:.0f} KB nuevos procesados → {ARCHIVO_INDICE}")
+    informe(indice, objetivo, mostrar_huecos='--huecos' in args)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,11 @@ import sys
 import threading
 import queue
 
+from zygote_scrapers import Zygote
+from limitador_sitios import LimitadorSitio, url_de_script
+from muestreo_adaptativo import PlanMuestreo
+from cola_trabajo import ColaTrabajo
+
 # ------------------------------------------------------------------
 # 1. Lista automáticamente todos los pruebacontinua_*.py de todas las subcarpetas
 # ------------------------------------------------------------------
@@ -33,8 +38,9 @@ def buscar_scripts_pruebacontinua():
 # ------------------------------------------------------------------
 # 2. Función que ejecuta un script con timeout controlado
 # ------------------------------------------------------------------
-def ejecutar_script_con_timeout(script_path, timeout_segundos=150):
-    """Ejecuta un script con timeout, capturando output en tiempo real"""
+def ejecutar_script_con_timeout(script_path, timeout_segundos=150, zygote=None):
+    """Ejecuta un script con timeout, capturando output en tiempo real.
+    Con zygote el script se lanza como fork del intérprete precargado."""
     nombre = os.path.basename(script_path)
     inicio = datetime.now()
     
@@ -42,14 +48,17 @@ def ejecutar_script_con_timeout(script_path, timeout_segundos=150):
     
     try:
         # Crear proceso
-        proceso = subprocess.Popen(
-            ["python", script_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,
-            universal_newlines=True
-        )
+        if zygote is not None and zygote.vivo():
+            proceso = zygote.lanzar(script_path)
+        else:
+            proceso = subprocess.Popen(
+                ["python", script_path],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                bufsize=1,
+                universal_newlines=True
+            )
         
         # Variables para capturar output
         salida_completa = []
@@ -159,6 +168,7 @@ def main(dias_solicitados=10):
     # CONFIGURACIÓN
     # ------------------------------------------------------------------
     TIMEOUT_POR_SCRIPT = 150  # 150 segundos máximo por script
+    USAR_ZYGOTE = True  # Fork de un intérprete con selenium ya importado (sin coste de arranque)
     INTERVALO_ENTRE_SCRIPTS = 3  # 3 segundos entre scripts (reducido)
     INTERVALO_ENTRE_CICLOS = 10  # 10 segundos entre ciclos
     
@@ -184,9 +194,18 @@ def main(dias_solicitados=10):
         'exitosos': 0,
         'timeouts': 0,
         'errores': 0,
+        'saltados': 0,
         'total_tiempo': 0
     }
     
+    # Cubo de tokens por web (compartido con los propios scripts)
+    limitadores = {s: LimitadorSitio(url_de_script(s) or '') for s in scripts}
+    # Frecuencia por script según la volatilidad reciente de su CSV (presupuesto global)
+    plan = PlanMuestreo(scripts)
+    # Cola con leases: varios lanzadores se reparten la campaña sin repetir capturas
+    cola = ColaTrabajo(scripts)
+    print(f"🤝 Trabajador {cola.trabajador} en la cola {cola.archivo}")
+    
     def signal_handler(sig, frame):
         nonlocal ejecutando
         print(f"\n\n⚠️  Señal de interrupción recibida. Finalizando ciclo actual...")
@@ -195,6 +214,15 @@ def main(dias_solicitados=10):
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
+    zygote = None
+    if USAR_ZYGOTE:
+        try:
+            zygote = Zygote(scripts).arrancar()
+            print("🧬 Zygote listo: capturas lanzadas por fork")
+        except Exception as e:
+            print(f"⚠️  Zygote no disponible ({e}) → subprocess normal")
+            zygote = None
+    
     try:
         # BUCLE PRINCIPAL - Ejecuta hasta fecha exacta
         while ejecutando and datetime.now() < fecha_fin_exacta:
@@ -214,6 +242,7 @@ def main(dias_solicitados=10):
             print(f"{'='*60}")
             
             # Ejecutar cada script en el ciclo
+            ejecutados_ciclo = 0
             for i, script in enumerate(scripts):
                 script_actual += 1
                 
@@ -223,11 +252,34 @@ def main(dias_solicitados=10):
                     ejecutando = False
                     break
                 
+                # Aún no le toca (o la tiene otro lanzador) según la cola compartida → se salta
+                espera_plan = cola.espera(script)
+                if espera_plan > 0:
+                    print(f"⏭️  {os.path.basename(script)} → le toca en {espera_plan:.0f}s "
+                          f"(cada {plan.intervalo(script)/60:.1f} min)")
+                    estadisticas['saltados'] += 1
+                    continue
+                
+                # Sin token para su web → se salta este turno (no se le pide de más al sitio)
+                espera_token = limitadores[script].disponible()
+                if espera_token > 0:
+                    print(f"⏭️  {os.path.basename(script)} → sin token de {limitadores[script].host} ({espera_token:.0f}s)")
+                    estadisticas['saltados'] += 1
+                    continue
+                
+                # Otro lanzador se ha adelantado entre la consulta y el reclamo
+                if not cola.reclamar(script):
+                    print(f"⏭️  {os.path.basename(script)} → reclamado por otro lanzador")
+                    estadisticas['saltados'] += 1
+                    continue
+                ejecutados_ciclo += 1
+                
                 # Limpieza entre scripts
                 limpiar_procesos_selenium()
                 
                 # Ejecutar script con timeout
-                tiempo_ejecucion = ejecutar_script_con_timeout(script, TIMEOUT_POR_SCRIPT)
+                tiempo_ejecucion = ejecutar_script_con_timeout(script, TIMEOUT_POR_SCRIPT, zygote)
+                cola.completar(script, plan.intervalo(script))
                 
                 # Actualizar estadísticas
                 estadisticas['total_tiempo'] += tiempo_ejecucion
@@ -245,10 +297,15 @@ def main(dias_solicitados=10):
             
             # Pausa entre ciclos (solo si aún no llegamos al límite)
             if ejecutando and datetime.now() < fecha_fin_exacta:
+                pausa_ciclo = INTERVALO_ENTRE_CICLOS
+                if not ejecutados_ciclo:
+                    # Ningún script podía correr: dormir hasta el primero que pueda
+                    proximo = min(max(cola.espera(s), limitadores[s].disponible()) for s in scripts)
+                    pausa_ciclo = max(pausa_ciclo, int(proximo) + 1)
                 print(f"\n✅ Ciclo {ciclo_actual} completado")
-                print(f"🔄 Próximo ciclo en {INTERVALO_ENTRE_CICLOS} segundos...")
+                print(f"🔄 Próximo ciclo en {pausa_ciclo} segundos...")
                 
-                for seg in range(INTERVALO_ENTRE_CICLOS, 0, -1):
+                for seg in range(pausa_ciclo, 0, -1):
                     if not ejecutando or datetime.now() >= fecha_fin_exacta:
                         ejecutando = False
                         break
@@ -278,10 +335,13 @@ def main(dias_solicitados=10):
         duracion_total = fin_ejecucion - fecha_inicio
         
         # Limpieza final
+        if zygote is not None:
+            zygote.cerrar()
+        cola.liberar()
         limpiar_procesos_selenium()
         
         # Calcular estadísticas
-        total_ejecuciones = ciclo_actual * len(scripts)
+        total_ejecuciones = ciclo_actual * len(scripts) - estadisticas['saltados']
         tiempo_promedio = estadisticas['total_tiempo'] / total_ejecuciones if total_ejecuciones > 0 else 0
         
         print(f"\n📊 ESTADÍSTICAS FINALES:")
@@ -293,6 +353,7 @@ def main(dias_solicitados=10):
         print(f"   ✅ Exitosos:        {estadisticas['exitosos']}")
         print(f"   ⏱️  Timeouts:        {estadisticas['timeouts']}")
         print(f"   ❌ Errores:         {estadisticas['errores']}")
+        print(f"   ⏭️  Saltados:        {estadisticas['saltados']} (plan/sin token/otro lanzador)")
         print(f"   📈 Tiempo promedio: {tiempo_promedio:.1f}s/script")
         print(f"   ⏰ Inicio:          {fecha_inicio.strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"   ⏰ Fin:             {fin_ejecucion.strftime('%Y-%m-%d %H:%M:%S')}")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LIMITADOR POR SITIO (CUBO DE TOKENS)
+- Un cubo por web (no por script): cloudping.net lo comparten AWS, Azure y GCP
+- peticiones/hora + ráfaga → cada sitio se muestrea tan a menudo como es seguro
+- Estado compartido entre procesos en .cubos_sitios.json (con flock)
+- Cuenta intentos, errores y captchas/bloqueos por sitio; un captcha vacía el cubo
+  y penaliza el sitio PENALIZACION_MINUTOS
+- Uso: python limitador_sitios.py   → informe de límites y tasas por sitio
+"""
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import re
+import time
+from urllib.parse import urlparse
+
+# ===================== CONFIG =====================
+# host: (peticiones/hora, ráfaga)
+LIMITES_SITIOS = {
+    'cloudping.cloud': (20, 4),
+    'cloudping.co': (12, 2),
+    'cloudping.info': (12, 2),
+    'cloudping.net': (30, 4),
+    'cloudpingtest.com': (30, 4),
+}
+LIMITE_POR_DEFECTO = (6, 1)
+PENALIZACION_MINUTOS = 30
+ARCHIVO_ESTADO = os.environ.get(
+    'CUBOS_SITIOS', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cubos_sitios.json'))
+
+# Texto típico de páginas de reto / bloqueo
+PATRON_CAPTCHA = re.compile(r'captcha|cf-challenge|challenge-platform|are you a robot|verify you are human', re.I)
+PATRON_BLOQUEO = re.compile(r'too many requests|access denied|error 1020|rate limit|\b429\b', re.I)
+
+logger = logging.getLogger(__name__)
+
+# Sobrescritura por entorno: LIMITES_SITIOS="cloudping.net=40/5,cloudping.co=6/1"
+for _par in filter(None, os.environ.get('LIMITES_SITIOS', '').split(',')):
+    _host, _limite = _par.split('=')
+    _por_hora, _rafaga = _limite.split('/')
+    LIMITES_SITIOS[_host.strip()] = (float(_por_hora), float(_rafaga))
+
+
+def host_sitio(url):
+    host = urlparse(url).netloc.lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def constante_de_script(script_path, nombre):
+    """Lee una constante de texto (NOMBRE = "...") de un pruebacontinua*.py sin importarlo"""
+    with open(script_path, encoding='utf-8') as f:
+        m = re.search(rf'^{nombre}\s*=\s*["\'](.+?)["\']', f.read(), re.M)
+    return m.group(1) if m else None
+
+
+def url_de_script(script_path):
+    return constante_de_script(script_path, 'URL')
+
+
+# ===================== ESTADO COMPARTIDO =====================
+@contextlib.contextmanager
+def _estado_bloqueado():
+    """Lee, deja modificar y guarda el estado de todos los cubos bajo flock"""
+    with open(ARCHIVO_ESTADO + '.lock', 'a') as candado:
+        fcntl.flock(candado, fcntl.LOCK_EX)
+        try:
+            try:
+                with open(ARCHIVO_ESTADO, encoding='utf-8') as f:
+                    estado = json.load(f)
+            except (OSError, ValueError):
+                estado = {}
+            yield estado
+            tmp = ARCHIVO_ESTADO + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(estado, f, indent=2)
+            os.replace(tmp, ARCHIVO_ESTADO)
+        finally:
+            fcntl.flock(candado, fcntl.LOCK_UN)
+
+
+def _rellenar(cubo, por_hora, rafaga, ahora):
+    transcurrido = max(0.0, ahora - cubo.get('actualizado', ahora))
+    cubo['tokens'] = min(rafaga, cubo.get('tokens', rafaga) + transcurrido * por_hora / 3600)
+    cubo['actualizado'] = ahora
+
+
+def _espera(cubo, por_hora, ahora):
+    penalizacion = max(0.0, cubo.get('penalizado_hasta', 0) - ahora)
+    falta = max(0.0, 1 - cubo['tokens']) * 3600 / por_hora
+    return max(penalizacion, falta)
+
+
+# ===================== LIMITADOR =====================
+class LimitadorSitio:
+    def __init__(self, url):
+        self.host = host_sitio(url)
+        self.por_hora, self.rafaga = LIMITES_SITIOS.get(self.host, LIMITE_POR_DEFECTO)
+        self.tomado = False
+        self.ultimo_fallo = None
+
+    def _cubo(self, estado):
+        cubo = estado.setdefault(self.host, {})
+        _rellenar(cubo, self.por_hora, self.rafaga, time.time())
+        return cubo
+
+    def disponible(self):
+        """Segundos hasta que haya token (0 = ya); no consume"""
+        with _estado_bloqueado() as estado:
+            return _espera(self._cubo(estado), self.por_hora, time.time())
+
+    def tomar(self, espera_maxima=None):
+        """Consume un token, esperando si hace falta. False si la espera supera espera_maxima"""
+        inicio = time.time()
+        while True:
+            with _estado_bloqueado() as estado:
+                cubo = self._cubo(estado)
+                espera = _espera(cubo, self.por_hora, time.time())
+                if espera <= 0:
+                    cubo['tokens'] -= 1
+                    cubo['intentos'] = cubo.get('intentos', 0) + 1
+                    self.tomado = True
+                    self.ultimo_fallo = None
+                    return True
+            if espera_maxima is not None and time.time() - inicio + espera > espera_maxima:
+                return False
+            logger.info(f"🪣 {self.host}: sin token → esperando {espera:.0f}s")
+            time.sleep(min(espera, 60))
+
+    def revisar(self, driver):
+        """Clasifica un fallo mirando la página: 'captcha', 'bloqueo' o 'error'"""
+        try:
+            texto = driver.page_source or ''
+        except Exception:
+            texto = ''
+        if PATRON_CAPTCHA.search(texto):
+            self.ultimo_fallo = 'captcha'
+        elif PATRON_BLOQUEO.search(texto):
+            self.ultimo_fallo = 'bloqueo'
+        else:
+            self.ultimo_fallo = 'error'
+        return self.ultimo_fallo
+
+    def resultado(self, ok):
+        """Anota el resultado de la captura que consumió el token; devuelve ok"""
+        if not self.tomado:
+            return ok
+        self.tomado = False
+        with _estado_bloqueado() as estado:
+            cubo = self._cubo(estado)
+            if ok:
+                cubo['ok'] = cubo.get('ok', 0) + 1
+                return ok
+            tipo = self.ultimo_fallo or 'error'
+            clave = {'captcha': 'captchas', 'bloqueo': 'bloqueos'}.get(tipo, 'errores')
+            cubo[clave] = cubo.get(clave, 0) + 1
+            if tipo in ('captcha', 'bloqueo'):
+                cubo['tokens'] = 0.0
+                cubo['penalizado_hasta'] = time.time() + PENALIZACION_MINUTOS * 60
+                cubo['ultimo_bloqueo'] = time.strftime('%Y-%m-%d %H:%M:%S')
+                logger.warning(f"🚫 {self.host}: {tipo.upper()} → pausa de {PENALIZACION_MINUTOS} min")
+        return ok
+
+
+# ===================== INFORME =====================
+def informe():
+    with _estado_bloqueado() as estado:
+        hosts = sorted(set(LIMITES_SITIOS) | set(estado))
+        ahora = time.time()
+        print(f"{'='*100}")
+        print(f"{'SITIO':20s} {'LÍMITE':>10s} {'TOKENS':>7s} {'ESPERA':>7s} {'INTENTOS':>9s} "
+              f"{'%ERROR':>7s} {'%CAPTCHA':>9s} {'%BLOQUEO':>9s}  ÚLTIMO BLOQUEO")
+        print(f"{'='*100}")
+        for host in hosts:
+            por_hora, rafaga = LIMITES_SITIOS.get(host, LIMITE_POR_DEFECTO)
+            cubo = estado.setdefault(host, {})
+            _rellenar(cubo, por_hora, rafaga, ahora)
+            intentos = cubo.get('intentos', 0)
+
+            def pct(clave):
+                return f"{100 * cubo.get(clave, 0) / intentos:.1f}" if intentos else '-'
+
+            print(f"{host:20s} {f'{por_hora:g}/h+{rafaga:g}':>10s} {cubo['tokens']:7.2f} "
+                  f"{_espera(cubo, por_hora, ahora):6.0f}s {intentos:9d} {pct('errores'):>7s} "
+                  f"{pct('captchas'):>9s} {pct('bloqueos'):>9s}  {cubo.get('ultimo_bloqueo', '-')}")
+
+
+if __name__ == "__main__":
+    informe()
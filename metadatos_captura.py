@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+METADATOS POR CAPTURA
+- Una línea JSON por captura en capturas_metadata.jsonl
+- Separado de los CSV de latencia → no cambia su formato
+- Con NODO_ID cada registro lleva el nodo que hizo la captura
+- capture_id + ts_ms son los de las filas de la captura (LoteCaptura.id y el ts_ms
+  escrito) → clave para unir el registro con sus filas del CSV/SQLite; en un canónico
+  fusionado la fila lleva <capture_id>@<nodo> (segmentos_nodo.id_con_nodo)
+- 'timestamp' es la hora de registro (fin de la captura), no la de las filas
+- leer_metadatos(ultimos=N) lee el archivo desde el final por bloques → el coste no crece
+  con el histórico (bytes_max acota además la búsqueda de un script sin registros)
+"""
+import datetime
+import json
+import os
+
+from segmentos_nodo import NODO_ID, id_con_nodo
+
+ARCHIVO_METADATOS = os.environ.get('CAPTURAS_METADATA', 'capturas_metadata.jsonl')
+BYTES_BLOQUE = 65536
+
+
+def registrar_captura(script, capture_id=None, ts_ms=None, **campos):
+    """Añade un registro {timestamp, script, capture_id, ts_ms, ...campos} en una sola escritura"""
+    registro = {
+        'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'script': script,
+    }
+    if capture_id:
+        registro['capture_id'] = capture_id
+    if ts_ms is not None:
+        registro['ts_ms'] = int(ts_ms)
+    if NODO_ID:
+        registro['nodo'] = NODO_ID
+    registro.update(campos)
+    linea = json.dumps(registro, ensure_ascii=False, default=str) + '\n'
+    # O_APPEND + un único write → las líneas de varios procesos no se mezclan
+    fd = os.open(ARCHIVO_METADATOS, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, linea.encode('utf-8'))
+    finally:
+        os.close(fd)
+
+
+def _filtrar(lineas, script):
+    registros = []
+    for linea in lineas:
+        try:
+            r = json.loads(linea)
+        except ValueError:
+            continue
+        if script is None or r.get('script') == script:
+            registros.append(r)
+    return registros
+
+
+def leer_metadatos(script=None, ultimos=None, bytes_max=None):
+    """
+    Devuelve los registros (opcionalmente de un script y solo los N últimos). Con ultimos
+    se lee hacia atrás por bloques hasta tenerlos; bytes_max: no mirar más atrás de eso
+    """
+    if not os.path.exists(ARCHIVO_METADATOS):
+        return []
+    if not ultimos:
+        with open(ARCHIVO_METADATOS, encoding='utf-8') as f:
+            return _filtrar(f, script)
+    with open(ARCHIVO_METADATOS, 'rb') as f:
+        fin = f.seek(0, os.SEEK_END)
+        limite = max(0, fin - bytes_max) if bytes_max else 0
+        inicio, resto, registros = fin, b'', []
+        while inicio > limite and len(registros) < ultimos:
+            anterior, inicio = inicio, max(limite, inicio - BYTES_BLOQUE)
+            f.seek(inicio)
+            lineas = (f.read(anterior - inicio) + resto).split(b'\n')
+            resto = lineas.pop(0) if inicio else b''   # línea cortada: se completa con el bloque anterior
+            registros = _filtrar((l.decode('utf-8', 'replace') for l in lineas), script) + registros
+    return registros[-ultimos:]
+
+
+def metadatos_por_captura(script=None, fusionado=False):
+    """{capture_id: registro} de los registros con clave; fusionado=True → ids <capture_id>@<nodo>"""
+    indice = {}
+    for r in leer_metadatos(script):
+        capture_id = r.get('capture_id')
+        if not capture_id:
+            continue
+        if fusionado and r.get('nodo'):
+            capture_id = id_con_nodo(capture_id, r['nodo'], r.get('ts_ms'))
+        indice[capture_id] = r
+    return indice
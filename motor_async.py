@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MOTOR ASÍNCRONO DE CAPTURAS (TRIO + CDP)
+- Un solo proceso / un solo hilo de eventos conduce varias sesiones de Chrome a la vez
+- Sin time.sleep: cada sesión se suscribe a eventos CDP (red + mutaciones del DOM)
+  y solo re-evalúa "¿datos listos?" cuando la página cambia
+- Reutiliza URL, clics y guardar_* de cada pruebacontinua*.py (mismo CSV, mismo formato)
+- Las llamadas bloqueantes de Selenium van a hilos con trio.to_thread
+- Planificador por fases: arranque de Chrome, carga, extracción y CSV se solapan entre
+  sitios; las ventanas de ping (lo que se mide) van serializadas o con tope
+  (MOTOR_VENTANAS) y cada captura anota con cuántas solapó: en capturas_metadata.jsonl
+  (con su capture_id y ts_ms) y, con SQLITE_LATENCIA, en capturas.solapes_medicion
+- Cada ventana va rodeada por la sonda de ruido local (referencia + CPU del host)
+- Sin intervalo fijo: cada sitio se captura según el plan adaptativo (volatilidad de
+  su CSV) y nunca más deprisa de lo que permite su cubo de tokens
+- Uso: python motor_async.py [--una-vez] [--sesiones N] [filtro_script ...]
+"""
+import contextlib
+import datetime
+import importlib.util
+import logging
+import os
+import signal
+import sys
+import time
+
+import trio
+
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.common.action_chains import ActionChains
+
+import almacen_sqlite
+from csv_capturas import nuevo_id_captura
+from esquema_latencia import a_epoch_ms
+from vigilante_memoria import VigilanteMemoria
+from aprovisionamiento_driver import crear_servicio
+from sonda_ruido import SondaRuido
+from limitador_sitios import LimitadorSitio
+from muestreo_adaptativo import PlanMuestreo
+
+# ===================== CONFIG =====================
+SESIONES_MAXIMAS = int(os.environ.get('MOTOR_SESIONES', '4'))   # Chromes vivos a la vez
+VENTANAS_MEDICION_MAX = int(os.environ.get('MOTOR_VENTANAS', '1'))   # Pings simultáneos (1 = serie)
+ESTABILIZACION_S = 3        # Silencio de eventos exigido tras "datos listos"
+SONDEO_RESPALDO_S = 5       # Re-evaluación aunque no lleguen eventos (páginas con canvas, etc.)
+ESPERA_REINTENTO_S = 60
+LOG_FILE = "motor_async.log"
+BINDING = '__motorCambio'
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+
+# Avisa (con rebote de 200 ms) de cualquier mutación del DOM a través del binding CDP
+OBSERVADOR_DOM_JS = """
+(() => {
+    let pendiente = null;
+    new MutationObserver(() => {
+        if (pendiente) return;
+        pendiente = setTimeout(() => {
+            pendiente = null;
+            try { %s('dom'); } catch (e) {}
+        }, 200);
+    }).observe(document, {childList: true, subtree: true, characterData: true});
+})();
+""" % BINDING
+
+CONTAR_JS = ("const contar = (xp) => document.evaluate(xp, document, null, "
+             "XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null).snapshotLength;\n")
+
+XPATH_MS = "//*[contains(text(), 'ms') or contains(text(), 'Failed')]"
+XPATH_TD_MS = "//td[contains(text(), 'ms')]"
+
+
+def _pulsar_boton_huawei(idx):
+    def accion(modulo, driver, wait):
+        botones = modulo.find_http_ping_buttons(driver)
+        if idx >= len(botones):
+            raise Exception(f"No hay botón HTTP Ping {idx + 1}")
+        driver.execute_script("arguments[0].scrollIntoView(true);", botones[idx])
+        ActionChains(driver).move_to_element(botones[idx]).click().perform()
+        return True
+    return accion
+
+
+# Especificación declarativa por sitio:
+#   fases: [{accion(modulo, driver, wait), listo (expresión JS → nº), minimo, max_espera, mide}]
+#          mide: la fase es una ventana de ping (por defecto, si tiene 'listo')
+#   guardar: función guardar_* del script; guardar_por_fase: guarda tras cada fase
+#            (todas las fases en el mismo lote, nuevo_lote() del script → una sola escritura)
+#   mide_al_cargar: el sitio empieza a hacer ping en cuanto carga (sin botón)
+SITIOS = [
+    {'script': 'cloudping/pruebacontinuaAWS_cloudping.py',
+     'fases': [{'accion': lambda m, d, w: m.click_http_ping_button(d, w),
+                'listo': "contar(\"//td[contains(text(), 'ms') or contains(text(), '.')] "
+                         "| //span[contains(text(), 'ms') or contains(text(), '.')]\")",
+                'minimo': 20, 'max_espera': 90}],
+     'guardar': 'guardar_datos'},
+    {'script': 'cloudping/pruebacontinuaHuawei_cloudping.py',
+     'fases': [{'accion': _pulsar_boton_huawei(0),
+                'listo': "contar(\"//td[contains(text(), '.') or contains(text(), 'ms')]\")",
+                'minimo': 8, 'max_espera': 50},
+               {'accion': _pulsar_boton_huawei(1),
+                'listo': "contar(\"//td[contains(text(), '.') or contains(text(), 'ms')]\")",
+                'minimo': 8, 'max_espera': 50}],
+     'guardar': 'extraer_y_guardar', 'guardar_por_fase': True},
+    {'script': 'cloudpingco/pruebacontinua_cloudpingco.py',
+     'fases': [{'listo': "contar('//table')", 'minimo': 1, 'max_espera': 60, 'mide': False}],
+     'guardar': 'guardar_matriz'},
+    {'script': 'cloudpinginfo/pruebacontinua_cloudpinginfo.py',
+     'fases': [{'accion': lambda m, d, w: m.click_http_ping(d, w),
+                'listo': "contar(\"//td[contains(text(), 'pinging') or contains(text(), 'connecting')]\") < 10"
+                         f" ? contar(\"{XPATH_TD_MS}\") : 0",
+                'minimo': 100, 'max_espera': 500}],
+     'guardar': 'guardar_datos'},
+    {'script': 'cloudpingnet/pruebacontinuaAWS_cloudpingnet.py',
+     'fases': [{'accion': lambda m, d, w: m.click_aws_ping(d, w),
+                'listo': "contar(\"//*[contains(text(), 'ms')]\")", 'minimo': 30, 'max_espera': 240}],
+     'guardar': 'guardar_datos'},
+    {'script': 'cloudpingnet/pruebacontinuaAzure_cloudpingnet.py',
+     'fases': [{'accion': lambda m, d, w: m.click_azure_tab(d, w)},
+               {'accion': lambda m, d, w: m.click_azure_ping(d, w),
+                'listo': f"contar(\"{XPATH_MS}\")", 'minimo': 35, 'max_espera': 300}],
+     'guardar': 'guardar_datos_azure'},
+    {'script': 'cloudpingnet/pruebacontinuaGCP_cloudpingnet.py',
+     'fases': [{'accion': lambda m, d, w: m.click_gcp_ping(d, w),
+                'listo': f"contar(\"{XPATH_MS}\")", 'minimo': 25, 'max_espera': 300}],
+     'guardar': 'guardar_datos'},
+    {'script': 'cloudpingtest/pruebacontinuaAWS_cloudpingtest.py', 'mide_al_cargar': True,
+     'fases': [{'listo': "contar(\"//table//tr[td[4][contains(text(), 'ms')]]\")",
+                'minimo': 25, 'max_espera': 240}],
+     'guardar': 'guardar_datos'},
+    {'script': 'cloudpingtest/pruebacontinuaAzure_cloudpingtest.py',
+     'fases': [{'accion': lambda m, d, w: m.click_start(d, w),
+                'listo': f"contar(\"{XPATH_TD_MS}\")", 'minimo': 50, 'max_espera': 300}],
+     'guardar': 'guardar_datos'},
+    {'script': 'cloudpingtest/pruebacontinuaGCP_cloudpingtest.py',
+     'fases': [{'accion': lambda m, d, w: m.click_start(d, w),
+                'listo': f"contar(\"{XPATH_TD_MS}\")", 'minimo': 50, 'max_espera': 300}],
+     'guardar': 'guardar_datos'},
+]
+
+
+# ===================== CARGA DE SCRAPERS =====================
+def cargar_modulo(script):
+    """Importa un pruebacontinua*.py sin ejecutar su main() (solo config + funciones)"""
+    ruta = os.path.join(RAIZ, script)
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+    if nombre in sys.modules:
+        return sys.modules[nombre]
+    spec = importlib.util.spec_from_file_location(nombre, ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nombre] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+# ===================== DRIVER (BLOQUEANTE → HILO) =====================
+def crear_driver(vigilante):
+    """Como setup_driver() de los scripts, pero sin matar otros Chrome del host"""
+    chrome_options = Options()
+    chrome_options.add_argument('--headless=new')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--disable-gpu')
+    chrome_options.add_argument('--disable-extensions')
+    chrome_options.add_argument('--disable-images')
+    chrome_options.add_argument('--window-size=1920,1080')
+    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+    # Sesiones en paralelo: ninguna pestaña debe quedar ralentizada por estar "en segundo plano"
+    chrome_options.add_argument('--disable-background-timer-throttling')
+    chrome_options.add_argument('--disable-renderer-backgrounding')
+    chrome_options.add_argument('--disable-backgrounding-occluded-windows')
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+
+    vigilante.comprobar_arranque()
+    driver = webdriver.Chrome(service=crear_servicio(chrome_options), options=chrome_options)
+    vigilante.vigilar(driver)
+    driver.set_page_load_timeout(120)
+    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    return driver
+
+
+def aceptar_consentimiento(driver):
+    try:
+        driver.find_element(By.XPATH, "//button[contains(text(), 'Accept') or contains(text(), 'Agree')]").click()
+    except Exception:
+        pass
+
+
+def anotar_solapes(capture_id, solapes):
+    """Lleva los solapes a la fila de la captura en SQLite (sumidero opcional: si falla solo se avisa)"""
+    if not almacen_sqlite.ARCHIVO_SQLITE:
+        return
+    try:
+        almacen_sqlite.anotar_solapes(capture_id, solapes)
+    except Exception as e:
+        logger.warning(f"⚠️  Solapes de {capture_id} sin anotar en SQLite: {e}")
+
+
+def cerrar_driver(driver, vigilante, metadatos):
+    vigilante.terminar(**metadatos)
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+# ===================== ESPERA DIRIGIDA POR EVENTOS =====================
+async def suscribir_eventos(sesion, devtools):
+    """Activa red + binding del observador DOM y devuelve el canal de eventos"""
+    eventos = sesion.listen(devtools.runtime.BindingCalled,
+                            devtools.network.LoadingFinished,
+                            devtools.network.LoadingFailed,
+                            devtools.page.LoadEventFired,
+                            buffer_size=1000)
+    await sesion.execute(devtools.runtime.enable())
+    await sesion.execute(devtools.runtime.add_binding(name=BINDING))
+    await sesion.execute(devtools.network.enable())
+    await sesion.execute(devtools.page.enable())
+    await sesion.execute(devtools.page.add_script_to_evaluate_on_new_document(source=OBSERVADOR_DOM_JS))
+    return eventos
+
+
+def _vaciar(eventos):
+    n = 0
+    while True:
+        try:
+            eventos.receive_nowait()
+            n += 1
+        except trio.WouldBlock:
+            return n
+
+
+async def _evaluar(sesion, devtools, expresion):
+    resultado, excepcion = await sesion.execute(
+        devtools.runtime.evaluate(expression=CONTAR_JS + expresion, return_by_value=True))
+    if excepcion is not None:
+        return 0
+    try:
+        return float(resultado.value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+async def esperar_listo(sesion, devtools, eventos, fase, nombre):
+    """
+    Bloquea la tarea (no el hilo) hasta que listo >= minimo. Solo se evalúa el DOM
+    cuando llegan eventos de red/mutación (o cada SONDEO_RESPALDO_S como red de seguridad).
+    Después espera ESTABILIZACION_S sin eventos para no cortar pings aún en vuelo.
+    """
+    inicio = time.time()
+    valor = 0
+    with trio.move_on_after(fase['max_espera']):
+        while True:
+            valor = await _evaluar(sesion, devtools, fase['listo'])
+            if valor >= fase['minimo']:
+                break
+            with trio.move_on_after(SONDEO_RESPALDO_S):
+                await eventos.receive()
+            _vaciar(eventos)
+    if valor < fase['minimo']:
+        logger.warning(f"⚠️ {nombre}: TIMEOUT {fase['max_espera']}s ({valor:.0f}/{fase['minimo']}) → guardando lo disponible")
+        return False
+    logger.info(f"✅ {nombre}: {valor:.0f} datos en {time.time() - inicio:.0f}s")
+
+    with trio.move_on_after(fase['max_espera']):
+        while True:
+            with trio.move_on_after(ESTABILIZACION_S) as silencio:
+                await eventos.receive()
+            if silencio.cancelled_caught:
+                break
+            _vaciar(eventos)
+    return True
+
+
+# ===================== VENTANAS DE MEDICIÓN =====================
+class VentanasMedicion:
+    """Limita cuántas capturas hacen ping a la vez y anota quién coincidió con quién"""
+
+    def __init__(self, maximo=VENTANAS_MEDICION_MAX):
+        self.limitador = trio.CapacityLimiter(maximo)
+        self.activas = set()
+        self.solapes = {}     # captura → otras capturas que midieron a la vez
+        self.duraciones = {}  # captura → segundos dentro de ventanas
+
+    @contextlib.asynccontextmanager
+    async def medir(self, nombre, sonda=None):
+        async with self.limitador:
+            if sonda is not None:
+                await trio.to_thread.run_sync(sonda.antes)
+            self.solapes.setdefault(nombre, set()).update(self.activas)
+            for otra in self.activas:
+                self.solapes.setdefault(otra, set()).add(nombre)
+            self.activas.add(nombre)
+            inicio = time.time()
+            try:
+                yield
+            finally:
+                self.activas.discard(nombre)
+                self.duraciones[nombre] = self.duraciones.get(nombre, 0.0) + time.time() - inicio
+                if sonda is not None:
+                    with trio.CancelScope(shield=True):
+                        await trio.to_thread.run_sync(sonda.despues)
+
+    def recoger(self, nombre):
+        """Metadatos de la captura (y olvida su estado)"""
+        solapadas = sorted(self.solapes.pop(nombre, ()))
+        return {
+            'solapes_medicion': len(solapadas),
+            'solapada_con': solapadas,
+            'ventana_medicion_s': round(self.duraciones.pop(nombre, 0.0), 1),
+        }
+
+
+# ===================== CAPTURA DE UN SITIO =====================
+async def ejecutar_fase(fase, modulo, driver, wait, sesion, devtools, eventos, nombre):
+    if fase.get('accion'):
+        if await trio.to_thread.run_sync(fase['accion'], modulo, driver, wait) is False:
+            raise Exception("Fallo en la acción de la página")
+    if fase.get('listo'):
+        await esperar_listo(sesion, devtools, eventos, fase, nombre)
+
+
+async def capturar_sitio(sitio, sesiones, ventanas, limite):
+    modulo = cargar_modulo(sitio['script'])
+    nombre = os.path.basename(sitio['script'])
+    vigilante = VigilanteMemoria(nombre)
+    sonda = SondaRuido()
+    metadatos = {'motor': 'async', 'capture_id': nuevo_id_captura()}   # mismo id que las filas
+    async with sesiones:
+        driver = await trio.to_thread.run_sync(crear_driver, vigilante)
+        try:
+            async with driver.bidi_connection() as conexion:
+                sesion, devtools = conexion.session, conexion.devtools
+                eventos = await suscribir_eventos(sesion, devtools)
+                wait = WebDriverWait(driver, 60)
+                guardar = getattr(modulo, sitio['guardar'])
+                timestamp = None
+                filas = 0
+                # Guardado por fases: todas las fases van al mismo lote → una sola escritura
+                lote = modulo.nuevo_lote(metadatos['capture_id']) if sitio.get('guardar_por_fase') else None
+                async with contextlib.AsyncExitStack() as ventana_carga:
+                    if lote is not None:
+                        ventana_carga.enter_context(lote)
+                    if sitio.get('mide_al_cargar'):
+                        await ventana_carga.enter_async_context(ventanas.medir(nombre, sonda))
+                    logger.info(f"🚀 {nombre}: cargando {modulo.URL}")
+                    await trio.to_thread.run_sync(driver.get, modulo.URL)
+                    await trio.to_thread.run_sync(aceptar_consentimiento, driver)
+                    for fase in sitio['fases']:
+                        args = (fase, modulo, driver, wait, sesion, devtools, eventos, nombre)
+                        if fase.get('mide', 'listo' in fase) and not sitio.get('mide_al_cargar'):
+                            async with ventanas.medir(nombre, sonda):
+                                await ejecutar_fase(*args)
+                        else:
+                            await ejecutar_fase(*args)
+                        if sitio.get('guardar_por_fase'):
+                            timestamp = timestamp or datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+                            filas += await trio.to_thread.run_sync(guardar, driver, timestamp, lote)
+                if not sitio.get('guardar_por_fase'):
+                    timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+                    filas = await trio.to_thread.run_sync(guardar, driver, timestamp, metadatos['capture_id'])
+            logger.info(f"🎉 {nombre}: {filas} filas → {modulo.OUTPUT_CSV}")
+            metadatos.update(timestamp=timestamp, ts_ms=a_epoch_ms(timestamp), filas=filas)
+            return filas > 0
+        except Exception as e:
+            logger.error(f"💥 {nombre}: {e}")
+            metadatos['error'] = str(e)[:200]
+            metadatos['fallo'] = await trio.to_thread.run_sync(limite.revisar, driver)
+            await trio.to_thread.run_sync(modulo.ALMACEN.guardar, driver, "MOTOR_ASYNC")
+            return False
+        finally:
+            metadatos.update(ventanas.recoger(nombre))
+            metadatos.update(sonda.recoger())
+            if metadatos.get('filas'):
+                await trio.to_thread.run_sync(anotar_solapes, metadatos['capture_id'], metadatos['solapes_medicion'])
+            await trio.to_thread.run_sync(cerrar_driver, driver, vigilante, metadatos)
+
+
+async def esperar_token(limite, nombre):
+    """Duerme la tarea (no el hilo) hasta que el cubo del sitio da un token"""
+    while True:
+        espera = await trio.to_thread.run_sync(limite.disponible)
+        if espera <= 0 and await trio.to_thread.run_sync(limite.tomar, 0):
+            return
+        if espera > 0:
+            logger.info(f"🪣 {nombre}: sin token de {limite.host} → {espera:.0f}s")
+        await trio.sleep(max(espera, 1))
+
+
+async def capturar_con_reintentos(sitio, sesiones, ventanas):
+    nombre = os.path.basename(sitio['script'])
+    modulo = cargar_modulo(sitio['script'])
+    limite = LimitadorSitio(modulo.URL)
+    reintentos = getattr(modulo, 'MAX_REINTENTOS', 3)
+    for intento in range(1, reintentos + 1):
+        await esperar_token(limite, nombre)
+        ok = False
+        try:
+            ok = await capturar_sitio(sitio, sesiones, ventanas, limite)
+        except Exception as e:
+            logger.error(f"💥 {nombre}: {e}")
+        if limite.resultado(ok):
+            return True
+        logger.warning(f"❌ {nombre}: intento {intento}/{reintentos} falló → {ESPERA_REINTENTO_S}s")
+        await trio.sleep(ESPERA_REINTENTO_S)
+    logger.error(f"❌ {nombre}: CICLO FALLIDO")
+    return False
+
+
+async def muestrear_sitio(sitio, sesiones, ventanas, plan):
+    """Bucle 24/7 de un sitio: al ritmo del plan adaptativo, limitado por su cubo de tokens"""
+    nombre = os.path.basename(sitio['script'])
+    ruta = os.path.join(RAIZ, sitio['script'])
+    while True:
+        await capturar_con_reintentos(sitio, sesiones, ventanas)
+        plan.registrar(ruta)
+        espera = plan.espera(ruta)
+        logger.info(f"📈 {nombre}: próxima captura en {espera / 60:.1f} min")
+        await trio.sleep(espera)
+
+
+async def ciclo(sitios, sesiones, continuo=False):
+    """
+    Lanza todos los sitios en la misma nursery: arranques, cargas y extracciones
+    se solapan; las ventanas de ping respetan VENTANAS_MEDICION_MAX
+    """
+    limitador = trio.CapacityLimiter(sesiones)
+    ventanas = VentanasMedicion()
+    inicio = time.time()
+    async with trio.open_nursery() as nursery:
+        if continuo:
+            plan = PlanMuestreo([os.path.join(RAIZ, s['script']) for s in sitios])
+            for sitio in sitios:
+                nursery.start_soon(muestrear_sitio, sitio, limitador, ventanas, plan)
+        else:
+            for sitio in sitios:
+                nursery.start_soon(capturar_con_reintentos, sitio, limitador, ventanas)
+    logger.info(f"🏁 Ciclo completo: {len(sitios)} sitios en {time.time() - inicio:.0f}s")
+
+
+async def bucle(sitios, sesiones, una_vez):
+    logger.info(f"\n🔄 MOTOR ASYNC - {datetime.datetime.now().strftime('%H:%M')} "
+                f"({len(sitios)} sitios, {sesiones} sesiones, {VENTANAS_MEDICION_MAX} ventanas de ping)")
+    await ciclo(sitios, sesiones, continuo=not una_vez)
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)s | %(message)s',
+        handlers=[logging.FileHandler(LOG_FILE, encoding='utf-8'), logging.StreamHandler(sys.stdout)]
+    )
+    args = sys.argv[1:]
+    una_vez = '--una-vez' in args
+    sesiones = SESIONES_MAXIMAS
+    if '--sesiones' in args:
+        sesiones = int(args[args.index('--sesiones') + 1])
+        args.remove(args[args.index('--sesiones') + 1])
+    filtros = [a for a in args if not a.startswith('--')]
+    sitios = [s for s in SITIOS if not filtros or any(f in s['script'] for f in filtros)]
+
+    for sitio in sitios:
+        cargar_modulo(sitio['script'])
+    # Los scripts instalan sus propios manejadores (sys.exit); trio necesita KeyboardInterrupt
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    try:
+        trio.run(bucle, sitios, sesiones, una_vez)
+    except KeyboardInterrupt:
+        logger.info("🛑 MOTOR ASYNC DETENIDO POR USUARIO")
+
+
+if __name__ == "__main__":
+    main()
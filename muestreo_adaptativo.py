@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MUESTREO ADAPTATIVO
+- Lee la cola reciente de cada *_latency_longterm.csv (últimas VENTANA_HORAS de datos)
+- Por región: variabilidad (CV) y tasa de cambio entre capturas consecutivas
+- Reparte un presupuesto global de capturas/hora: mínimo fijo por script y el resto
+  proporcional a la volatilidad, sin pasar del límite del cubo de tokens de su web
+- El lanzador y el motor async consultan PlanMuestreo para saber cuándo le toca a cada script
+- Uso: python muestreo_adaptativo.py   → plan actual por script
+"""
+import csv
+import datetime
+import io
+import os
+import statistics
+import time
+
+from esquema_latencia import fila_comun
+from limitador_sitios import LIMITES_SITIOS, LIMITE_POR_DEFECTO, constante_de_script, host_sitio
+
+# ===================== CONFIG =====================
+PRESUPUESTO_CAPTURAS_HORA = float(os.environ.get('PRESUPUESTO_CAPTURAS_HORA', '60'))   # 10 scripts × 6/h
+MINIMO_CAPTURAS_HORA = 2          # Nadie baja de aquí (continuidad de las series)
+VENTANA_HORAS = 24                # Historia usada para medir volatilidad
+BYTES_COLA = 2 * 1024 * 1024      # Solo se lee el final de cada CSV
+MIN_MUESTRAS_REGION = 3
+RECALCULO_MINUTOS = 30
+
+
+# ===================== LECTURA DE LA COLA DEL CSV =====================
+def leer_cola_csv(ruta, bytes_cola=BYTES_COLA):
+    """Filas (timestamp, clave_serie, latencia) del final del CSV, sin cargarlo entero"""
+    if not os.path.exists(ruta):
+        return []
+    with open(ruta, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        tamano = f.tell()
+        f.seek(max(0, tamano - bytes_cola))
+        datos = f.read()
+    if tamano > bytes_cola:
+        datos = datos[datos.find(b'\n') + 1:]   # primera línea probablemente cortada
+    filas = []
+    for fila in csv.reader(io.StringIO(datos.decode('utf-8', 'replace'))):
+        comun = fila_comun(fila)
+        if comun is None or comun[4] is None:
+            continue   # cabecera, 'Failed', filas rotas
+        ts_ms, provider, region, datacenter, latencia, _ = comun
+        filas.append((datetime.datetime.fromtimestamp(ts_ms / 1000), (provider, region, datacenter), latencia))
+    return filas
+
+
+def volatilidad_csv(ruta, ventana_horas=VENTANA_HORAS):
+    """
+    {'regiones', 'cv', 'cambio', 'puntuacion'} con medianas por región, o None sin datos.
+    cv = desviación/media; cambio = |Δ entre capturas consecutivas| / media.
+    """
+    filas = leer_cola_csv(ruta)
+    if not filas:
+        return None
+    limite = max(ts for ts, _, _ in filas) - datetime.timedelta(hours=ventana_horas)
+    series = {}
+    for ts, clave, latencia in filas:
+        if ts >= limite:
+            series.setdefault(clave, []).append((ts, latencia))
+    cvs, cambios = [], []
+    for puntos in series.values():
+        if len(puntos) < MIN_MUESTRAS_REGION:
+            continue
+        puntos.sort()
+        valores = [v for _, v in puntos]
+        media = statistics.fmean(valores)
+        if media <= 0:
+            continue
+        cvs.append(statistics.pstdev(valores) / media)
+        cambios.append(statistics.fmean(abs(b - a) for a, b in zip(valores, valores[1:])) / media)
+    if not cvs:
+        return None
+    cv, cambio = statistics.median(cvs), statistics.median(cambios)
+    return {'regiones': len(cvs), 'cv': cv, 'cambio': cambio, 'puntuacion': cv + cambio}
+
+
+# ===================== REPARTO DEL PRESUPUESTO =====================
+def repartir(puntuaciones, topes, presupuesto=PRESUPUESTO_CAPTURAS_HORA, minimo=MINIMO_CAPTURAS_HORA):
+    """
+    Capturas/hora por script: mínimo para todos y el resto proporcional a la
+    puntuación (llenado por niveles: lo que no cabe bajo un tope pasa al resto)
+    """
+    asignado = {s: min(minimo, topes[s]) for s in puntuaciones}
+    restante = presupuesto - sum(asignado.values())
+    abiertos = {s for s in puntuaciones if asignado[s] < topes[s]}
+    while restante > 1e-9 and abiertos:
+        total = sum(puntuaciones[s] for s in abiertos)
+        reparto = {s: restante * (puntuaciones[s] / total if total > 0 else 1 / len(abiertos)) for s in abiertos}
+        restante = 0.0
+        for s, extra in reparto.items():
+            hueco = topes[s] - asignado[s]
+            if extra >= hueco:
+                asignado[s] = topes[s]
+                restante += extra - hueco
+                abiertos.discard(s)
+            else:
+                asignado[s] += extra
+    return asignado
+
+
+def calcular_plan(scripts, presupuesto=PRESUPUESTO_CAPTURAS_HORA):
+    """{script: {'capturas_hora', 'intervalo_s', 'volatilidad'}} para la lista de scripts"""
+    info = {}
+    for script in scripts:
+        url = constante_de_script(script, 'URL') or ''
+        csv_salida = constante_de_script(script, 'OUTPUT_CSV')
+        info[script] = {'host': host_sitio(url),
+                        'volatilidad': volatilidad_csv(csv_salida) if csv_salida else None}
+
+    # Sin historia → se le trata como el más volátil (hay que explorarlo)
+    conocidas = [i['volatilidad']['puntuacion'] for i in info.values() if i['volatilidad']]
+    por_defecto = max(conocidas) if conocidas else 1.0
+    puntuaciones = {s: (i['volatilidad']['puntuacion'] if i['volatilidad'] else por_defecto)
+                    for s, i in info.items()}
+
+    # Un script no puede pedir más que su parte del cubo de su web
+    por_host = {}
+    for i in info.values():
+        por_host[i['host']] = por_host.get(i['host'], 0) + 1
+    topes = {s: LIMITES_SITIOS.get(i['host'], LIMITE_POR_DEFECTO)[0] / por_host[i['host']]
+             for s, i in info.items()}
+
+    asignado = repartir(puntuaciones, topes, presupuesto)
+    return {s: {'capturas_hora': asignado[s],
+                'intervalo_s': 3600 / asignado[s] if asignado[s] > 0 else float('inf'),
+                'volatilidad': info[s]['volatilidad'],
+                'tope': topes[s]}
+            for s in scripts}
+
+
+# ===================== PLAN CONSULTABLE =====================
+class PlanMuestreo:
+    """Decide cuándo le toca a cada script; se recalcula cada RECALCULO_MINUTOS"""
+
+    def __init__(self, scripts, presupuesto=PRESUPUESTO_CAPTURAS_HORA):
+        self.scripts = [os.path.abspath(s) for s in scripts]
+        self.presupuesto = presupuesto
+        self.plan = {}
+        self.calculado = 0.0
+        self.ultima = {}
+
+    def _actualizar(self):
+        if time.time() - self.calculado > RECALCULO_MINUTOS * 60:
+            self.plan = calcular_plan(self.scripts, self.presupuesto)
+            self.calculado = time.time()
+
+    def intervalo(self, script):
+        self._actualizar()
+        return self.plan[os.path.abspath(script)]['intervalo_s']
+
+    def espera(self, script):
+        """Segundos hasta que al script le toque otra captura (0 = ya)"""
+        ultima = self.ultima.get(os.path.abspath(script))
+        if ultima is None:
+            return 0.0
+        return max(0.0, ultima + self.intervalo(script) - time.time())
+
+    def registrar(self, script):
+        self.ultima[os.path.abspath(script)] = time.time()
+
+
+def mostrar_plan(scripts):
+    plan = calcular_plan(scripts)
+    print(f"{'='*96}")
+    print(f"📈 PLAN DE MUESTREO ADAPTATIVO (presupuesto {PRESUPUESTO_CAPTURAS_HORA:g} capturas/h)")
+    print(f"{'='*96}")
+    print(f"{'SCRIPT':42s} {'REGIONES':>8s} {'CV':>7s} {'CAMBIO':>7s} {'CAPT/H':>7s} {'TOPE':>6s} {'CADA':>9s}")
+    for script, p in sorted(plan.items(), key=lambda x: -x[1]['capturas_hora']):
+        v = p['volatilidad']
+        regiones = str(v['regiones']) if v else '-'
+        cv = f"{v['cv']:.3f}" if v else '-'
+        cambio = f"{v['cambio']:.3f}" if v else '-'
+        print(f"{os.path.basename(script):42s} {regiones:>8s} {cv:>7s} {cambio:>7s} "
+              f"{p['capturas_hora']:7.2f} {p['tope']:6.1f} {p['intervalo_s'] / 60:7.1f}min")
+
+if __name__ == "__main__":
+    from lanzar_todos_en_roundrobin import buscar_scripts_pruebacontinua
+    mostrar_plan(buscar_scripts_pruebacontinua())
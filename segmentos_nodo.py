@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SEGMENTOS POR NODO (RECOLECCIÓN MULTI-NODO)
+- Sin NODO_ID: cada scraper escribe en su OUTPUT_CSV de siempre (un solo vantage)
+- Con NODO_ID: escribe en segmentos/<nodo>/<csv>__<nodo>__<AAAAMMDDHH>.csv (uno por hora)
+- Los nodos no se coordinan entre sí → la ingesta escala con el número de nodos
+- fusionar_segmentos.py junta los segmentos en los *_latency_longterm.csv canónicos; cada
+  fila fusionada lleva su nodo en el capture_id (<capture_id>@<nodo>) → en el canónico se
+  sigue distinguiendo desde qué vantage se midió (nodo_de_captura)
+"""
+import datetime
+import os
+import re
+
+# ===================== CONFIG =====================
+NODO_ID = os.environ.get('NODO_ID') or None
+SEGMENTOS_DIR = os.environ.get('SEGMENTOS_DIR', 'segmentos')
+SEPARADOR_NODO = '@'
+FORMATO_HORA = '%Y%m%d%H'
+
+# <base>__<nodo>__<AAAAMMDDHH>.csv
+PATRON_SEGMENTO = re.compile(r'^(?P<base>.+)__(?P<nodo>[\w.-]+)__(?P<hora>\d{10})\.csv$')
+PATRON_NODO = re.compile(r'^[\w.-]+$')
+
+
+def ruta_salida(output_csv, nodo=None, directorio=None, ahora=None):
+    """Archivo donde escribir la captura: el CSV canónico o el segmento de este nodo y hora"""
+    nodo = nodo or NODO_ID
+    if not nodo:
+        return output_csv
+    directorio = os.path.join(directorio or SEGMENTOS_DIR, nodo)
+    os.makedirs(directorio, exist_ok=True)
+    base = os.path.splitext(os.path.basename(output_csv))[0]
+    hora = (ahora or datetime.datetime.now()).strftime(FORMATO_HORA)
+    return os.path.join(directorio, f"{base}__{nodo}__{hora}.csv")
+
+
+def info_segmento(ruta):
+    """{'base', 'nodo', 'hora'} a partir del nombre del segmento, o None si no lo es"""
+    m = PATRON_SEGMENTO.match(os.path.basename(ruta))
+    if not m:
+        return None
+    return {'base': m.group('base') + '.csv', 'nodo': m.group('nodo'),
+            'hora': datetime.datetime.strptime(m.group('hora'), FORMATO_HORA)}
+
+
+def id_con_nodo(capture_id, nodo, ts_ms):
+    """capture_id de una fila fusionada: <id>@<nodo> (sin id, del ts_ms de la captura)"""
+    capture_id = capture_id or str(ts_ms)
+    if capture_id.endswith(SEPARADOR_NODO + nodo):
+        return capture_id
+    return f"{capture_id}{SEPARADOR_NODO}{nodo}"
+
+
+def nodo_de_captura(capture_id):
+    """Nodo de una fila de un canónico fusionado, o None si la escribió un colector local"""
+    _, separador, nodo = str(capture_id or '').rpartition(SEPARADOR_NODO)
+    return nodo if separador and PATRON_NODO.match(nodo) else None
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SONDA DE RUIDO LOCAL (SUELO DE RUIDO DEL VANTAGE)
+- Mide un endpoint de referencia local justo antes y después del ping de cada sitio
+- Guarda la carga de CPU del host durante esa ventana
+- Si la referencia local también se dispara, el pico es de nuestra máquina, no de la región
+- SONDA_URL: endpoint de referencia (loopback/LAN); sin él se levanta uno propio en 127.0.0.1
+"""
+import http.server
+import logging
+import os
+import statistics
+import threading
+import time
+import urllib.request
+
+# ===================== CONFIG =====================
+SONDA_URL = os.environ.get('SONDA_URL')
+SONDA_REPETICIONES = 5
+SONDA_TIMEOUT = 2          # segundos por petición
+
+logger = logging.getLogger(__name__)
+
+_servidor_url = None
+_servidor_lock = threading.Lock()
+# Sin proxies del entorno: se mide la ruta directa a la referencia
+_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+
+class _RespuestaVacia(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def url_referencia():
+    """SONDA_URL o, si no hay, un servidor HTTP mínimo en loopback (uno por proceso)"""
+    global _servidor_url
+    if SONDA_URL:
+        return SONDA_URL
+    with _servidor_lock:
+        if _servidor_url is None:
+            servidor = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _RespuestaVacia)
+            servidor.daemon_threads = True
+            threading.Thread(target=servidor.serve_forever, name='sonda-ruido', daemon=True).start()
+            _servidor_url = f"http://127.0.0.1:{servidor.server_address[1]}/"
+    return _servidor_url
+
+
+def medir_referencia(url=None, repeticiones=SONDA_REPETICIONES):
+    """Lista de tiempos (ms) de GET al endpoint de referencia (vacía si no responde)"""
+    url = url or url_referencia()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        try:
+            with _opener.open(url, timeout=SONDA_TIMEOUT) as r:
+                r.read()
+        except Exception as e:
+            logger.debug(f"Sonda de ruido falló: {e}")
+            continue
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+
+def _tiempos_cpu():
+    """(ocupado, total) en jiffies desde /proc/stat; None fuera de Linux"""
+    try:
+        with open('/proc/stat') as f:
+            campos = [int(x) for x in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    inactivo = campos[3] + (campos[4] if len(campos) > 4 else 0)   # idle + iowait
+    return sum(campos) - inactivo, sum(campos)
+
+
+class SondaRuido:
+    """antes() al empezar el ping del sitio, despues() al acabar, recoger() → campos de metadatos"""
+
+    def __init__(self, url=None):
+        self.url = url
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self.ruido_antes = None
+        self.ruido_despues = None
+        self.cpu_inicio = None
+        self.cpu_fin = None
+
+    def antes(self):
+        if self.ruido_antes is None:   # con varias ventanas por captura vale la primera
+            self.ruido_antes = medir_referencia(self.url)
+            self.cpu_inicio = _tiempos_cpu()
+
+    def despues(self):
+        self.ruido_despues = medir_referencia(self.url)
+        self.cpu_fin = _tiempos_cpu()
+
+    def recoger(self):
+        if self.ruido_antes is None:
+            return {}
+        campos = {}
+        for clave, tiempos in (('ruido_antes_ms', self.ruido_antes), ('ruido_despues_ms', self.ruido_despues)):
+            if tiempos:
+                campos[clave] = round(statistics.median(tiempos), 3)
+        todos = (self.ruido_antes or []) + (self.ruido_despues or [])
+        if todos:
+            campos['ruido_max_ms'] = round(max(todos), 3)
+        if self.cpu_inicio and self.cpu_fin and self.cpu_fin[1] > self.cpu_inicio[1]:
+            campos['cpu_pct'] = round(100 * (self.cpu_fin[0] - self.cpu_inicio[0]) /
+                                      (self.cpu_fin[1] - self.cpu_inicio[1]), 1)
+        try:
+            campos['carga_1m'] = round(os.getloadavg()[0], 2)
+        except OSError:
+            pass
+        campos['ncpu'] = os.cpu_count()
+        self._reiniciar()
+        return campos
+
+
+if __name__ == "__main__":
+    tiempos = medir_referencia(repeticiones=20)
+    print(f"Referencia: {url_referencia()}")
+    if tiempos:
+        print(f"Mediana {statistics.median(tiempos):.3f} ms | max {max(tiempos):.3f} ms | {len(tiempos)}/20 OK")
+    else:
+        print("❌ Endpoint de referencia inalcanzable")
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+VIGILANTE DE MEMORIA DE CHROME
+- Mide el RSS real del árbol chromedriver → chrome → renderers (vía /proc)
+- Guarda el pico de cada captura en capturas_metadata.jsonl
+- Recicla el navegador si supera LIMITE_NAVEGADOR_MB o el presupuesto del host
+- No arranca navegadores nuevos si no caben en PRESUPUESTO_MEMORIA_MB
+"""
+import logging
+import os
+import signal
+import threading
+import time
+
+from metadatos_captura import registrar_captura, leer_metadatos
+
+# ===================== CONFIG =====================
+# 0 = sin presupuesto fijo (solo se comprueba MemAvailable)
+PRESUPUESTO_MEMORIA_MB = float(os.environ.get('PRESUPUESTO_MEMORIA_MB', '0'))
+LIMITE_NAVEGADOR_MB = float(os.environ.get('LIMITE_NAVEGADOR_MB', '1500'))
+ESTIMACION_INICIAL_MB = 400        # Pico supuesto si aún no hay histórico
+BYTES_HISTORICO = 1 << 20          # Cola de capturas_metadata.jsonl donde buscar los últimos picos
+INTERVALO_MUESTREO = 2             # segundos
+ESPERA_MAXIMA_ARRANQUE = 120       # segundos esperando memoria antes de rendirse
+
+logger = logging.getLogger(__name__)
+
+
+class MemoriaInsuficiente(Exception):
+    pass
+
+
+# ===================== LECTURA /proc =====================
+def _ppid_y_nombre(pid):
+    with open(f'/proc/{pid}/stat', 'rb') as f:
+        datos = f.read().decode('utf-8', 'ignore')
+    # El nombre va entre paréntesis y puede contener espacios
+    nombre = datos[datos.index('(') + 1:datos.rindex(')')]
+    campos = datos[datos.rindex(')') + 2:].split()
+    return int(campos[1]), nombre
+
+
+def _tabla_procesos():
+    """{pid: (ppid, nombre)} de todos los procesos visibles"""
+    tabla = {}
+    try:
+        entradas = os.listdir('/proc')
+    except OSError:
+        return tabla
+    for entrada in entradas:
+        if not entrada.isdigit():
+            continue
+        try:
+            tabla[int(entrada)] = _ppid_y_nombre(entrada)
+        except (OSError, ValueError):
+            continue
+    return tabla
+
+
+def _rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            paginas = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return 0.0
+    return paginas * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+def pids_arbol(pid_raiz, tabla=None):
+    tabla = tabla if tabla is not None else _tabla_procesos()
+    hijos = {}
+    for pid, (ppid, _) in tabla.items():
+        hijos.setdefault(ppid, []).append(pid)
+    pendientes, arbol = [pid_raiz], []
+    while pendientes:
+        pid = pendientes.pop()
+        arbol.append(pid)
+        pendientes.extend(hijos.get(pid, []))
+    return arbol
+
+
+def rss_arbol_mb(pid_raiz):
+    return sum(_rss_mb(p) for p in pids_arbol(pid_raiz))
+
+
+def rss_chrome_host_mb():
+    """RSS de todos los chrome/chromedriver del host (otros scrapers incluidos)"""
+    return sum(_rss_mb(pid) for pid, (_, nombre) in _tabla_procesos().items()
+               if 'chrome' in nombre.lower())
+
+
+def memoria_disponible_mb():
+    try:
+        with open('/proc/meminfo') as f:
+            for linea in f:
+                if linea.startswith('MemAvailable:'):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+# ===================== VIGILANTE =====================
+class VigilanteMemoria:
+    def __init__(self, script, limite_mb=LIMITE_NAVEGADOR_MB, presupuesto_mb=PRESUPUESTO_MEMORIA_MB):
+        """
+        Args:
+            script: Nombre del scraper (clave en los metadatos)
+            limite_mb: RSS máximo de un navegador antes de reciclarlo
+            presupuesto_mb: RSS total de Chrome permitido en el host (0 = sin límite)
+        """
+        self.script = script
+        self.limite_mb = limite_mb
+        self.presupuesto_mb = presupuesto_mb
+        self.driver = None
+        self.hilo = None
+        self.parar = threading.Event()
+        self.pico_mb = 0.0
+        self.reciclado = None
+
+    def estimacion_mb(self):
+        """Pico esperado de un navegador nuevo: máximo de las últimas capturas"""
+        picos = [r.get('pico_rss_mb') for r in leer_metadatos(self.script, ultimos=20, bytes_max=BYTES_HISTORICO)]
+        picos = [p for p in picos if p]
+        return max(picos) if picos else ESTIMACION_INICIAL_MB
+
+    def comprobar_arranque(self, espera_maxima=ESPERA_MAXIMA_ARRANQUE):
+        """Bloquea hasta que quepa un navegador más; si no cabe, lanza MemoriaInsuficiente"""
+        necesario = self.estimacion_mb()
+        fin = time.time() + espera_maxima
+        while True:
+            disponible = memoria_disponible_mb()
+            en_uso = rss_chrome_host_mb() if self.presupuesto_mb else 0.0
+            cabe_host = disponible is None or disponible > necesario
+            cabe_presupuesto = not self.presupuesto_mb or en_uso + necesario <= self.presupuesto_mb
+            if cabe_host and cabe_presupuesto:
+                return
+            if time.time() >= fin:
+                raise MemoriaInsuficiente(
+                    f"Sin memoria para Chrome: necesita ~{necesario:.0f}MB, "
+                    f"disponible {disponible or 0:.0f}MB, en uso {en_uso:.0f}/{self.presupuesto_mb:.0f}MB")
+            logger.warning(f"MEMORIA JUSTA (~{necesario:.0f}MB necesarios) → esperando...")
+            time.sleep(10)
+
+    def vigilar(self, driver):
+        """Empieza a muestrear el árbol de procesos del driver (para antes el muestreo anterior si sigue vivo)"""
+        if self.hilo is not None:
+            logger.warning("vigilar() sin terminar() previo → se descarta el muestreo anterior")
+            self._detener()
+        self.driver = driver
+        self.pico_mb = 0.0
+        self.reciclado = None
+        self.parar = threading.Event()   # uno por hilo: un hilo viejo que tarde en salir no se reactiva
+        self.hilo = threading.Thread(target=self._muestrear, args=(driver, self.parar),
+                                     name='vigilante-memoria', daemon=True)
+        self.hilo.start()
+
+    def terminar(self, **extra):
+        """Detiene el muestreo y registra el pico de la captura (+ campos extra del llamador)"""
+        if self.hilo is None:
+            return
+        self._detener()
+        campos = {'pico_rss_mb': round(self.pico_mb, 1)}
+        if self.reciclado:
+            campos['reciclado'] = self.reciclado
+        campos.update(extra)
+        try:
+            registrar_captura(self.script, **campos)
+        except OSError as e:
+            logger.warning(f"No se pudo registrar metadatos: {e}")
+        logger.info(f"PICO RSS CHROME: {self.pico_mb:.0f} MB")
+
+    def _detener(self):
+        self.parar.set()
+        self.hilo.join(timeout=INTERVALO_MUESTREO * 2)
+        self.hilo = None
+
+    @staticmethod
+    def _pid_driver(driver):
+        try:
+            return driver.service.process.pid
+        except AttributeError:
+            return None
+
+    def _muestrear(self, driver, parar):
+        pid = self._pid_driver(driver)
+        if pid is None:
+            return
+        while not parar.wait(INTERVALO_MUESTREO):
+            rss = rss_arbol_mb(pid)
+            if parar.is_set():
+                return   # lo pararon mientras medía: el pico ya es de otra captura
+            self.pico_mb = max(self.pico_mb, rss)
+            motivo = None
+            if self.limite_mb and rss > self.limite_mb:
+                motivo = f"navegador {rss:.0f}MB > {self.limite_mb:.0f}MB"
+            elif self.presupuesto_mb and rss_chrome_host_mb() > self.presupuesto_mb:
+                motivo = f"host > presupuesto {self.presupuesto_mb:.0f}MB"
+            if motivo:
+                self._reciclar(pid, motivo)
+                return
+
+    def _reciclar(self, pid, motivo):
+        """Mata el árbol de Chrome: la captura en curso falla y el reintento arranca uno limpio"""
+        logger.warning(f"RECICLANDO CHROME: {motivo}")
+        self.reciclado = motivo
+        for p in reversed(pids_arbol(pid)):
+            if p == pid:
+                continue  # chromedriver sigue vivo para que quit() responda
+            try:
+                os.kill(p, signal.SIGKILL)
+            except OSError:
+                pass
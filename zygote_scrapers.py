@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ZYGOTE DE SCRAPERS - ARRANQUE RÁPIDO DE CAPTURAS
+- Proceso residente que ya tiene importado selenium + módulos comunes
+- Precompila cada pruebacontinua*.py una sola vez
+- Por captura: fork() → el hijo ejecuta el script como __main__ con stdout/stderr del lanzador
+- El lanzador ve un objeto tipo Popen (poll/terminate/kill/wait + stdout/stderr)
+- El hijo acaba como un intérprete normal: corre los atexit del script (p. ej. el vaciado
+  del almacén de artefactos tras el SIGTERM del timeout) y logging.shutdown() antes de
+  os._exit; los atexit heredados del zygote se descartan
+- python zygote_scrapers.py --comprobar → lanza un script por el zygote, lo para con
+  SIGTERM y comprueba que su trabajo de atexit se completó
+Protocolo (socket UNIX):
+  lanzador → zygote: {"script": ruta} + fds [stdout, stderr]
+  zygote → lanzador: {"pid": N} y, al terminar el hijo, {"codigo": rc}
+"""
+import atexit
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+# Pila de scraping pre-importada (lo que cada captura pagaba al arrancar)
+MODULOS_PRECARGA = [
+    'csv', 'datetime', 'logging', 'random', 're', 'traceback', 'gc', 'subprocess',
+    'selenium.webdriver',
+    'selenium.webdriver.common.by',
+    'selenium.webdriver.chrome.options',
+    'selenium.webdriver.chrome.service',
+    'selenium.webdriver.support.ui',
+    'selenium.webdriver.support.expected_conditions',
+    'selenium.webdriver.common.action_chains',
+    'selenium.common.exceptions',
+    'requests',
+    'almacen_artefactos',
+    'vigilante_memoria',
+    'aprovisionamiento_driver',
+    'metadatos_captura',
+    'sonda_ruido',
+    'segmentos_nodo',
+    'esquema_latencia',
+    'csv_capturas',
+]
+
+
+# ===================== LADO ZYGOTE =====================
+def precargar(scripts):
+    for modulo in MODULOS_PRECARGA:
+        try:
+            __import__(modulo)
+        except ImportError as e:
+            print(f"[zygote] No se pudo precargar {modulo}: {e}", file=sys.stderr)
+    compilados = {}
+    for script in scripts:
+        ruta = os.path.abspath(script)
+        with open(ruta, 'rb') as f:
+            compilados[ruta] = compile(f.read(), ruta, 'exec')
+    return compilados
+
+
+def _ejecutar_hijo(ruta, codigo, fd_out, fd_err):
+    """Corre en el proceso hijo: nunca vuelve"""
+    rc = 0
+    try:
+        os.dup2(fd_out, 1)
+        os.dup2(fd_err, 2)
+        os.close(fd_out)
+        os.close(fd_err)
+        sys.stdout = os.fdopen(1, 'w', buffering=1, encoding='utf-8', errors='replace')
+        sys.stderr = os.fdopen(2, 'w', buffering=1, encoding='utf-8', errors='replace')
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        sys.argv = [ruta]
+        sys.path[0] = os.path.dirname(ruta)
+        atexit._clear()   # los del zygote no son de esta captura
+        exec(codigo, {'__name__': '__main__', '__file__': ruta, '__builtins__': __builtins__})
+    except SystemExit as e:
+        rc = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        rc = 1
+    finally:
+        # os._exit no pasa por la salida normal del intérprete: atexit y logging a mano
+        try:
+            atexit._run_exitfuncs()
+        except BaseException:
+            pass
+        try:
+            logging.shutdown()
+        except Exception:
+            pass
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except Exception:
+            pass
+        os._exit(rc)
+
+
+def servir(ruta_socket, scripts):
+    compilados = precargar(scripts)
+    servidor = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if os.path.exists(ruta_socket):
+        os.unlink(ruta_socket)
+    servidor.bind(ruta_socket)
+    servidor.listen(16)
+    print(f"[zygote] Listo: {len(compilados)} scripts precompilados", file=sys.stderr, flush=True)
+
+    hijos = {}   # pid → conexión del lanzador
+    signal.signal(signal.SIGTERM, lambda s, f: sys.exit(0))
+    # SIGCHLD despierta el select al instante (sin sondeo) para avisar del fin de cada hijo
+    despertar_r, despertar_w = os.pipe()
+    os.set_blocking(despertar_r, False)
+    os.set_blocking(despertar_w, False)
+    signal.set_wakeup_fd(despertar_w)
+    signal.signal(signal.SIGCHLD, lambda s, f: None)
+    try:
+        while True:
+            listos, _, _ = select.select([servidor, despertar_r], [], [], 1.0)
+            if despertar_r in listos:
+                try:
+                    os.read(despertar_r, 512)
+                except BlockingIOError:
+                    pass
+            if servidor in listos:
+                conn, _ = servidor.accept()
+                try:
+                    mensaje, fds, _, _ = socket.recv_fds(conn, 4096, 2)
+                    ruta = os.path.abspath(json.loads(mensaje.decode('utf-8'))['script'])
+                    if ruta not in compilados:
+                        with open(ruta, 'rb') as f:
+                            compilados[ruta] = compile(f.read(), ruta, 'exec')
+                    pid = os.fork()
+                    if pid == 0:
+                        signal.set_wakeup_fd(-1)
+                        os.close(despertar_r)
+                        os.close(despertar_w)
+                        servidor.close()
+                        conn.close()
+                        _ejecutar_hijo(ruta, compilados[ruta], fds[0], fds[1])
+                    for fd in fds:
+                        os.close(fd)
+                    conn.sendall(json.dumps({'pid': pid}).encode('utf-8') + b'\n')
+                    hijos[pid] = conn
+                except Exception as e:
+                    print(f"[zygote] Error lanzando captura: {e}", file=sys.stderr, flush=True)
+                    try:
+                        conn.sendall(json.dumps({'error': str(e)}).encode('utf-8') + b'\n')
+                    except OSError:
+                        pass
+                    conn.close()
+
+            # Recoger hijos terminados y avisar a su lanzador
+            while hijos:
+                try:
+                    pid, estado = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if pid == 0:
+                    break
+                rc = -os.WTERMSIG(estado) if os.WIFSIGNALED(estado) else os.WEXITSTATUS(estado)
+                conn = hijos.pop(pid, None)
+                if conn:
+                    try:
+                        conn.sendall(json.dumps({'codigo': rc}).encode('utf-8') + b'\n')
+                    except OSError:
+                        pass
+                    conn.close()
+    finally:
+        servidor.close()
+        if os.path.exists(ruta_socket):
+            os.unlink(ruta_socket)
+
+
+# ===================== LADO LANZADOR =====================
+class ProcesoZygote:
+    """Hijo del zygote con la misma interfaz que usa el lanzador de subprocess.Popen"""
+
+    def __init__(self, ruta_socket, script_path):
+        lectura_out, escritura_out = os.pipe()
+        lectura_err, escritura_err = os.pipe()
+        self.conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.conn.connect(ruta_socket)
+            mensaje = json.dumps({'script': os.path.abspath(script_path)}).encode('utf-8')
+            socket.send_fds(self.conn, [mensaje], [escritura_out, escritura_err])
+        finally:
+            os.close(escritura_out)
+            os.close(escritura_err)
+        self.stdout = os.fdopen(lectura_out, 'r', encoding='utf-8', errors='replace')
+        self.stderr = os.fdopen(lectura_err, 'r', encoding='utf-8', errors='replace')
+        self.buffer = b''
+        respuesta = self._leer_mensaje(bloquear=True)
+        if 'pid' not in respuesta:
+            raise RuntimeError(f"Zygote no pudo lanzar {script_path}: {respuesta.get('error')}")
+        self.pid = respuesta['pid']
+        self.returncode = None
+
+    def _leer_mensaje(self, bloquear):
+        while b'\n' not in self.buffer:
+            if not bloquear and not select.select([self.conn], [], [], 0)[0]:
+                return None
+            datos = self.conn.recv(4096)
+            if not datos:
+                return {'codigo': -9}   # zygote muerto: se trata como hijo matado
+            self.buffer += datos
+        linea, self.buffer = self.buffer.split(b'\n', 1)
+        return json.loads(linea.decode('utf-8'))
+
+    def poll(self):
+        if self.returncode is None:
+            mensaje = self._leer_mensaje(bloquear=False)
+            if mensaje is not None:
+                self.returncode = mensaje.get('codigo', -9)
+                self.conn.close()
+        return self.returncode
+
+    def wait(self, timeout=None):
+        fin = None if timeout is None else time.time() + timeout
+        while self.poll() is None:
+            restante = None if fin is None else fin - time.time()
+            if restante is not None and restante <= 0:
+                raise subprocess.TimeoutExpired(f"zygote:{self.pid}", timeout)
+            select.select([self.conn], [], [], restante)
+        return self.returncode
+
+    def _senal(self, sig):
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self._senal(signal.SIGTERM)
+
+    def kill(self):
+        self._senal(signal.SIGKILL)
+
+
+class Zygote:
+    def __init__(self, scripts):
+        self.scripts = scripts
+        self.ruta_socket = os.path.join(tempfile.mkdtemp(prefix='zygote_scrapers_'), 'zygote.sock')
+        self.proceso = None
+
+    def arrancar(self, timeout=60):
+        self.proceso = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), self.ruta_socket] + list(self.scripts),
+            cwd=os.getcwd(),
+            start_new_session=True,   # Ctrl+C del terminal no lo mata; lo cierra el lanzador
+        )
+        fin = time.time() + timeout
+        while not os.path.exists(self.ruta_socket):
+            if self.proceso.poll() is not None or time.time() > fin:
+                raise RuntimeError("El zygote no arrancó")
+            time.sleep(0.1)
+        return self
+
+    def vivo(self):
+        return self.proceso is not None and self.proceso.poll() is None
+
+    def lanzar(self, script_path):
+        return ProcesoZygote(self.ruta_socket, script_path)
+
+    def cerrar(self):
+        if self.vivo():
+            self.proceso.terminate()
+            try:
+                self.proceso.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.proceso.kill()
+
+
+# ===================== COMPROBACIÓN =====================
+# Script de prueba: encola artefactos en el almacén (se vacían en atexit) y espera el SIGTERM
+SCRIPT_COMPROBACION = """
+import atexit, json, logging, os, signal, sys, time
+sys.path.insert(0, {raiz!r})
+from almacen_artefactos import AlmacenArtefactos
+
+logging.basicConfig(filename={log!r}, level=logging.INFO)
+signal.signal(signal.SIGTERM, lambda s, f: sys.exit(0))
+
+class Pagina:
+    def __init__(self, n):
+        self.page_source = '<html>' + 'x' * n + '</html>'
+    def get_screenshot_as_png(self):
+        return b'png' * 1000
+
+ALMACEN = AlmacenArtefactos('comprobacion', directorio={almacen!r})
+for n in range({total}):
+    ALMACEN.guardar(Pagina(n), 'FALLO')
+# registrado después que el vaciado del almacén → corre antes (LIFO): anota lo pendiente
+atexit.register(lambda: open({marca!r}, 'w').write(json.dumps({{'pendientes': ALMACEN.cola.unfinished_tasks}})))
+logging.getLogger('comprobacion').info('ultima linea de log')
+print('LISTO', flush=True)
+time.sleep(60)
+"""
+
+
+def comprobar(total=400):
+    """Lanza SCRIPT_COMPROBACION por el zygote, lo para con SIGTERM y revisa lo que dejó en disco"""
+    with tempfile.TemporaryDirectory() as tmp:
+        rutas = {nombre: os.path.join(tmp, nombre) for nombre in ('prueba.py', 'marca.json', 'prueba.log', 'almacen')}
+        with open(rutas['prueba.py'], 'w', encoding='utf-8') as f:
+            f.write(SCRIPT_COMPROBACION.format(raiz=os.path.dirname(os.path.abspath(__file__)), total=total,
+                                               log=rutas['prueba.log'], almacen=rutas['almacen'],
+                                               marca=rutas['marca.json']))
+        zygote = Zygote([rutas['prueba.py']]).arrancar()
+        try:
+            proceso = zygote.lanzar(rutas['prueba.py'])
+            proceso.stdout.readline()   # LISTO
+            proceso.terminate()         # como el timeout del lanzador
+            rc = proceso.wait(timeout=30)
+        finally:
+            zygote.cerrar()
+        pendientes = None
+        if os.path.exists(rutas['marca.json']):
+            with open(rutas['marca.json'], encoding='utf-8') as f:
+                pendientes = json.load(f)['pendientes']
+        directorio = os.path.join(rutas['almacen'], 'comprobacion')
+        guardados = len(os.listdir(directorio)) if os.path.isdir(directorio) else 0
+        lineas_indice = 0
+        if os.path.exists(os.path.join(rutas['almacen'], 'indice.csv')):
+            with open(os.path.join(rutas['almacen'], 'indice.csv'), encoding='utf-8') as f:
+                lineas_indice = sum(1 for _ in f) - 1
+        with open(rutas['prueba.log'], encoding='utf-8') as f:
+            log_ok = 'ultima linea de log' in f.read()
+    ok = rc == 0 and pendientes is not None and guardados == lineas_indice == total and log_ok
+    print(f"🧪 Zygote + SIGTERM: rc={rc} | atexit {'ejecutado' if pendientes is not None else 'NO ejecutado'} "
+          f"({pendientes} tareas pendientes al recibir la señal) | artefactos {guardados}/{total} | "
+          f"índice {lineas_indice}/{total} | log {'ok' if log_ok else 'perdido'}  {'✅' if ok else '❌'}")
+    return ok
+
+
+if __name__ == "__main__":
+    if '--comprobar' in sys.argv:
+        sys.exit(0 if comprobar() else 1)
+    if len(sys.argv) < 2:
+        print("Uso: python zygote_scrapers.py <socket> [scripts...]")
+        sys.exit(1)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    servir(sys.argv[1], sys.argv[2:])